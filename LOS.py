@@ -2,32 +2,21 @@ import numpy as np
 from tqdm import tqdm
 import time
 import matplotlib.pyplot as plt
-from srtm import get_data
+from terrain import Terrain
+import los_engine
 import matplotlib.colors as colors
 from matplotlib.patches import Circle
 import json
 import os
 import cartopy.crs as ccrs
 import cartopy.io.img_tiles as cimgt
-import io
-from urllib.request import urlopen, Request
-from PIL import Image
+import tile_cache
 
-# Initialize SRTM data
-srtm_data = get_data()
+# Initialize SRTM data (memory-mapped tiles, see terrain.py)
+srtm_data = Terrain()
 
-def image_spoof(self, tile):
-    url = self._image_url(tile)
-    req = Request(url)
-    req.add_header('User-agent', 'Anaconda 3')
-    fh = urlopen(req)
-    im_data = io.BytesIO(fh.read())
-    fh.close()
-    img = Image.open(im_data)
-    img = img.convert(self.desired_tile_form)
-    return img, self.tileextent(tile), 'lower'
-
-cimgt.OSM.get_image = image_spoof
+# Map tiles come from the on-disk tile cache (see tile_cache.py)
+tile_cache.install(cimgt.OSM, 'osm')
 
 def load_last_settings():
     if os.path.exists('last_settings.json'):
@@ -51,61 +40,9 @@ def haversine_distance(lat1, lon1, lat2, lon2):
     c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1-a))
     return R * c
 
-def line_of_sight(start_lat, start_lon, end_lat, end_lon, start_height, end_height):
-    start_elev = srtm_data.get_elevation(start_lat, start_lon)
-    end_elev = srtm_data.get_elevation(end_lat, end_lon)
-    
-    if start_elev is None or end_elev is None:
-        return False
-
-    distance = haversine_distance(start_lat, start_lon, end_lat, end_lon)
-    elevation_difference = (end_elev + end_height) - (start_elev + start_height)
-    angle = np.arctan2(elevation_difference, distance * 1000)
-    
-    visibility_threshold = 0
-    return angle > visibility_threshold
-
-def line_of_sight(start_lat, start_lon, end_lat, end_lon, start_height, end_height):
-    try:
-        start_elev = srtm_data.get_elevation(start_lat, start_lon)
-        end_elev = srtm_data.get_elevation(end_lat, end_lon)
-        
-        if start_elev is None or end_elev is None:
-            return False
-
-        distance = haversine_distance(start_lat, start_lon, end_lat, end_lon)
-        
-        start_total_height = start_elev + start_height
-        end_total_height = end_elev + end_height
-        
-        elevation_difference = end_total_height - start_total_height
-        angle = np.arctan2(elevation_difference, distance * 1000)
-        
-        steps = 100
-        for i in range(1, steps):
-            fraction = i / steps
-            inter_lat = start_lat + fraction * (end_lat - start_lat)
-            inter_lon = start_lon + fraction * (end_lon - start_lon)
-            inter_elev = srtm_data.get_elevation(inter_lat, inter_lon)
-            
-            if inter_elev is None:
-                continue
-            
-            inter_distance = fraction * distance
-            expected_height = start_total_height + fraction * elevation_difference
-            if inter_elev > expected_height:
-                return False
-
-        return True
-    except Exception as e:
-        print(f"Error in line_of_sight: {str(e)}")
-        print(f"Start: {start_lat}, {start_lon}, End: {end_lat}, {end_lon}")
-        return False
 def generate_los_map(point1, point2, radius_miles=30):
     radius_km = radius_miles * 1.60934
     resolution = 300
-    los_map = np.zeros((resolution, resolution))
-    elevations = np.zeros((resolution, resolution))
 
     center_lat = (point1['lat'] + point2['lat']) / 2
     center_lon = (point1['lon'] + point2['lon']) / 2
@@ -116,32 +53,12 @@ def generate_los_map(point1, point2, radius_miles=30):
     total_iterations = resolution * resolution
     start_time = time.time()
 
-    try:
-        with tqdm(total=total_iterations, desc="Generating LOS map", unit="cell") as pbar:
-            for i in range(resolution):
-                for j in range(resolution):
-                    angle = 2 * np.pi * i / resolution
-                    distance = radius_km * j / (resolution - 1)
-
-                    target_lat = center_lat + (distance / 111.32) * np.cos(angle)
-                    target_lon = center_lon + (distance / (111.32 * np.cos(np.radians(center_lat)))) * np.sin(angle)
-
-                    elevation = srtm_data.get_elevation(target_lat, target_lon)
-                    elevations[i, j] = elevation if elevation is not None else 0
-
-                    if line_of_sight(point1['lat'], point1['lon'], target_lat, target_lon, point1['height'], 0) or \
-                       line_of_sight(point2['lat'], point2['lon'], target_lat, target_lon, point2['height'], 0):
-                        los_map[i, j] = 1
-                    else:
-                        los_map[i, j] = 0
-                    
-                    pbar.update(1)
-
-    except Exception as e:
-        print(f"Error occurred at i={i}, j={j}")
-        print(f"Current target: lat={target_lat}, lon={target_lon}")
-        print(f"Exception: {str(e)}")
-        raise
+    # A cell is visible from either point; rays are checked between (not at) their ends
+    with tqdm(total=total_iterations, desc="Generating LOS map", unit="cell") as pbar:
+        los_map, elevations = los_engine.compute_los_map(srtm_data, [point1, point2], center_lat, center_lon,
+                                                         radius_km, resolution, spacing='linear',
+                                                         clip_to_radius=False, include_endpoints=False,
+                                                         progress=pbar.update, workers=os.cpu_count())
 
     end_time = time.time()
     total_time = end_time - start_time
@@ -165,7 +82,7 @@ def plot_los_map(los_map, elevations, center_lat, center_lon, point1, point2):
 
     # Add OpenStreetMap tiles as the background
     osm_tiles = cimgt.OSM()
-    ax.add_image(osm_tiles, 12)  # Adjust zoom level as needed
+    tile_cache.add_image(ax, osm_tiles, 12)  # Adjust zoom level as needed
 
     # Create custom colormap for LOS
     cmap = colors.ListedColormap(['black', 'none'])
@@ -244,6 +161,8 @@ def main():
     print(f"Point 1: {point1['lat']}, {point1['lon']}, height: {point1['height']}m")
     print(f"Point 2: {point2['lat']}, {point2['lon']}, height: {point2['height']}m")
     
+    # Map the tiles under the whole 30 mile map once
+    srtm_data.preload_points([point1, point2], margin_km=50)
     los_map, elevations, center_lat, center_lon = generate_los_map(point1, point2, radius_miles=30)
     print("LOS map contains zeros:", np.any(los_map == 0))
 
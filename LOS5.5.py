@@ -1,7 +1,8 @@
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from srtm import get_data
+from terrain import Terrain
+import los_engine
 import matplotlib.colors as colors
 from matplotlib.patches import Circle
 import json
@@ -9,16 +10,14 @@ import os
 import cartopy.crs as ccrs
 import cartopy.io.img_tiles as cimgt
 from cartopy.mpl.gridliner import LONGITUDE_FORMATTER, LATITUDE_FORMATTER
-import io
-from urllib.request import urlopen, Request
-from PIL import Image
+import tile_cache
 from tqdm import tqdm
 import time
 import tkinter as tk
 from tkinter import ttk
 
-# Initialize SRTM data
-srtm_data = get_data()
+# Initialize SRTM data (memory-mapped tiles, see terrain.py)
+srtm_data = Terrain()
 
 
 
@@ -61,7 +60,7 @@ def map_point_picker(last_settings):
     ax = fig.add_subplot(1, 1, 1, projection=ccrs.PlateCarree())
 
     map_tiles = cimgt.OSM()
-    ax.add_image(map_tiles, 8)  # Adjust zoom level as needed
+    tile_cache.add_image(ax, map_tiles, 8)  # Adjust zoom level as needed
 
     # Set initial map extent (you may want to adjust this based on your default points)
     ax.set_extent([last_settings['point1']['lon'] - 1, last_settings['point1']['lon'] + 1,
@@ -83,18 +82,8 @@ def map_point_picker(last_settings):
         "point2": {"lat": float(point2_coords[0]), "lon": float(point2_coords[1]), "height": last_settings['point2']['height']}
     }
 
-def image_spoof(self, tile):
-    url = self._image_url(tile)
-    req = Request(url)
-    req.add_header('User-agent', 'Anaconda 3')
-    fh = urlopen(req)
-    im_data = io.BytesIO(fh.read())
-    fh.close()
-    img = Image.open(im_data)
-    img = img.convert(self.desired_tile_form)
-    return img, self.tileextent(tile), 'lower'
-
-cimgt.OSM.get_image = image_spoof
+# Map tiles come from the on-disk tile cache (see tile_cache.py)
+tile_cache.install(cimgt.OSM, 'osm')
 
 # Define OpenTopoMap
 class OpenTopoMap(cimgt.OSM):
@@ -103,7 +92,7 @@ class OpenTopoMap(cimgt.OSM):
         url = 'https://a.tile.opentopomap.org/{}/{}/{}.png'.format(z, x, y)
         return url
 
-OpenTopoMap.get_image = image_spoof
+tile_cache.install(OpenTopoMap, 'opentopomap')
 
 def load_last_settings():
     if os.path.exists('last_settings.json'):
@@ -127,50 +116,9 @@ def haversine_distance(lat1, lon1, lat2, lon2):
     c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1-a))
     return R * c
 
-def line_of_sight(start_lat, start_lon, end_lat, end_lon, start_height, end_height):
-    try:
-        start_elev = srtm_data.get_elevation(start_lat, start_lon)
-        end_elev = srtm_data.get_elevation(end_lat, end_lon)
-        
-        if start_elev is None or end_elev is None:
-            return False
-
-        # Calculate the distance between the two points
-        distance = haversine_distance(start_lat, start_lon, end_lat, end_lon)
-        
-        # Calculate the total heights
-        start_total_height = start_elev + start_height
-        end_total_height = end_elev + end_height
-
-        # Sample elevations along the line of sight
-        steps = 100
-        for i in range(steps + 1):
-            fraction = i / steps
-            inter_lat = start_lat + fraction * (end_lat - start_lat)
-            inter_lon = start_lon + fraction * (end_lon - start_lon)
-            inter_elev = srtm_data.get_elevation(inter_lat, inter_lon)
-            
-            if inter_elev is None:
-                continue
-            
-            # Calculate the height of the line of sight at this point
-            los_height = start_total_height + fraction * (end_total_height - start_total_height)
-            
-            # Check if the terrain is higher than the line of sight
-            if inter_elev > los_height:
-                return False
-
-        return True
-    except Exception as e:
-        print(f"Error in line_of_sight: {str(e)}")
-        print(f"Start: {start_lat}, {start_lon}, End: {end_lat}, {end_lon}")
-        return False
-
 def generate_los_map(point1, point2, radius_miles=10):  # Reduced radius to 10 km
     radius_km = radius_miles * 1.60934
     resolution = 1500  # Increased resolution to 1500x1500
-    los_map = np.zeros((resolution, resolution))
-    elevations = np.zeros((resolution, resolution))
 
     center_lat = point1['lat']
     center_lon = point1['lon']
@@ -181,35 +129,9 @@ def generate_los_map(point1, point2, radius_miles=10):  # Reduced radius to 10 k
     total_iterations = resolution * resolution
     start_time = time.time()
 
-    try:
-        with tqdm(total=total_iterations, desc="Generating LOS map", unit="cell") as pbar:
-            for i in range(resolution):
-                for j in range(resolution):
-                    angle = 2 * np.pi * i / resolution
-                    distance = radius_km * (j / (resolution - 1)) ** 2  # Non-linear distance
-
-                    target_lat = center_lat + (distance / 111.32) * np.cos(angle)
-                    target_lon = center_lon + (distance / (111.32 * np.cos(np.radians(center_lat)))) * np.sin(angle)
-
-                    # Check if the target point is within the 10 km radius
-                    if haversine_distance(point1['lat'], point1['lon'], target_lat, target_lon) <= radius_km:
-                        elevation = srtm_data.get_elevation(target_lat, target_lon)
-                        elevations[i, j] = elevation if elevation is not None else 0
-
-                        if line_of_sight(point1['lat'], point1['lon'], target_lat, target_lon, point1['height'], 0):
-                            los_map[i, j] = 1  # Mark as visible
-                        else:
-                            los_map[i, j] = 0  # Mark as not visible
-                    else:
-                        los_map[i, j] = 0  # Mark as not visible (outside radius)
-                    
-                    pbar.update(1)
-
-    except Exception as e:
-        print(f"Error occurred at i={i}, j={j}")
-        print(f"Current target: lat={target_lat}, lon={target_lon}")
-        print(f"Exception: {str(e)}")
-        raise
+    with tqdm(total=total_iterations, desc="Generating LOS map", unit="cell") as pbar:
+        los_map, elevations = los_engine.compute_viewshed(srtm_data, point1, radius_km, resolution,
+                                                          progress=pbar.update, workers=os.cpu_count())
 
     end_time = time.time()
     total_time = end_time - start_time
@@ -238,7 +160,7 @@ def plot_los_map(los_map, elevations, center_lat, center_lon, point1, point2, ma
     else:
         map_tiles = OpenTopoMap()
     
-    ax.add_image(map_tiles, 12)  # Adjust zoom level as needed
+    tile_cache.add_image(ax, map_tiles, 12)  # Adjust zoom level as needed
 
     # Create custom colormap for LOS with solid black for shadows
     cmap = colors.ListedColormap(['black', 'none'])
@@ -339,7 +261,7 @@ def plot_cross_section(point1, point2):
     # Generate elevation profile
     latitudes = np.linspace(point1['lat'], point2['lat'], num=100)
     longitudes = np.linspace(point1['lon'], point2['lon'], num=100)
-    elevations = [srtm_data.get_elevation(lat, lon) for lat, lon in zip(latitudes, longitudes)]
+    elevations = srtm_data.get_elevations(latitudes, longitudes)
     
     print("Elevation profile generated.")
     
@@ -354,7 +276,7 @@ def plot_cross_section(point1, point2):
     # Plot the street map
     ax1 = plt.subplot(211, projection=ccrs.PlateCarree())
     map_tiles = cimgt.OSM()
-    ax1.add_image(map_tiles, 12)  # Adjust zoom level as needed
+    tile_cache.add_image(ax1, map_tiles, 12)  # Adjust zoom level as needed
     
     # Set map extent
     buffer = 0.02  # Adjust this value to change the map extent
@@ -515,6 +437,9 @@ def main():
     # Save the new settings
     save_settings({"point1": point1, "point2": point2})
     
+    # Map the tiles under the cross-section and the LOS map once
+    srtm_data.preload_points([point1, point2])
+
     # Generate the cross-section
     plot_cross_section(point1, point2)
 
@@ -0,0 +1,251 @@
+"""
+Anti-entropy sync between BBS nodes.
+
+Every record is identified by an 8-byte key (a hash of its unique_id, stored
+in the record's indexed sync_key column). Each
+sync scope (mail, or one bulletin board) is treated as a trie over the hex
+digits of those keys, and a subtree is summarised by the XOR of its keys.
+Peers periodically exchange DIGEST records holding the 16 child summaries of
+a subtree; only subtrees whose summaries differ are descended into, and once
+a subtree is small its key list is sent as IDS so each side can push what the
+other lacks or ask for what it lacks with WANT. Traffic therefore scales with
+the number of differences instead of the number of records.
+
+Deleted records leave tombstones. IDS also lists the sender's tombstones
+under the subtree, so a record deleted on one side is deleted on the other
+instead of being pushed back, and a peer still holding a record deleted
+here is sent the delete. Tombstones older than the retention period are
+pruned; a node offline for longer than that can bring old records back.
+
+Control records always use the binary sync framing.
+"""
+
+import logging
+import os
+import threading
+
+from db_operations import (
+    delete_bulletin_by_unique_id, delete_mail, get_bulletin_boards, get_bulletin_by_unique_id, get_bulletin_keys,
+    get_mail_by_unique_id, get_mail_keys, get_tombstone_keys, prune_tombstones
+)
+from db_schema import sync_key
+from utils import (
+    send_delete_bulletin_to_bbs_nodes, send_delete_mail_to_bbs_nodes, send_mail_to_bbs_nodes, send_sync_frames
+)
+
+KEY_SIZE = 8
+FANOUT = 16
+MAX_KEYS_PER_IDS = 32
+MAIL_SCOPE = 'M'
+BULLETIN_SCOPE_PREFIX = 'B:'
+
+stats_lock = threading.Lock()
+stats = {
+    'rounds': 0,
+    'digests_sent': 0,
+    'ids_sent': 0,
+    'records_pushed': 0,
+    'records_requested': 0,
+    'deletes_applied': 0,
+    'deletes_pushed': 0,
+    'tombstones_pruned': 0,
+}
+
+
+def _count(name, amount=1):
+    with stats_lock:
+        stats[name] += amount
+
+
+def record_key(unique_id):
+    return bytes.fromhex(sync_key(unique_id))
+
+
+def get_scopes():
+    return [MAIL_SCOPE] + [BULLETIN_SCOPE_PREFIX + board for board in get_bulletin_boards()]
+
+
+def _keys_under(scope, prefix):
+    """{key: unique_id} of the records in scope whose key starts with the hex prefix."""
+    if scope == MAIL_SCOPE:
+        rows = get_mail_keys(prefix)
+    elif scope.startswith(BULLETIN_SCOPE_PREFIX):
+        rows = get_bulletin_keys(scope[len(BULLETIN_SCOPE_PREFIX):], prefix)
+    else:
+        return {}
+    return {bytes.fromhex(key): unique_id for key, unique_id in rows}
+
+
+def _tombstones_under(scope, prefix):
+    if scope == MAIL_SCOPE:
+        rows = get_tombstone_keys('mail', prefix=prefix)
+    elif scope.startswith(BULLETIN_SCOPE_PREFIX):
+        rows = get_tombstone_keys('bulletin', scope[len(BULLETIN_SCOPE_PREFIX):], prefix)
+    else:
+        return {}
+    return {bytes.fromhex(key): unique_id for key, unique_id in rows}
+
+
+def _child_digests(keys, prefix):
+    digests = [0] * FANOUT
+    depth = len(prefix)
+    for key in keys:
+        digests[int(key.hex()[depth], 16)] ^= int.from_bytes(key, 'big')
+    return [digest.to_bytes(KEY_SIZE, 'big') for digest in digests]
+
+
+def _unpack_keys(packed):
+    return {packed[i:i + KEY_SIZE] for i in range(0, len(packed) - KEY_SIZE + 1, KEY_SIZE)}
+
+
+def send_digest(scope, prefix, keys, peer, interface):
+    send_sync_frames("DIGEST", [scope, prefix, b''.join(_child_digests(keys, prefix))], [peer], interface)
+    _count('digests_sent')
+
+
+def run_round(interface):
+    scopes = get_scopes()
+    for peer in interface.bbs_nodes:
+        for scope in scopes:
+            send_digest(scope, '', _keys_under(scope, ''), peer, interface)
+    _count('rounds')
+    logging.info(f"SERVER SYNC: Sent anti-entropy digests for {len(scopes)} scopes to {len(interface.bbs_nodes)} peers")
+
+
+def handle_digest(fields, sender, interface):
+    scope, prefix, packed = fields[0], fields[1], fields[2]
+    if len(packed) != FANOUT * KEY_SIZE or len(prefix) >= KEY_SIZE * 2:
+        logging.warning(f"SERVER SYNC: Ignoring malformed digest from {sender}")
+        return
+    theirs = [packed[i:i + KEY_SIZE] for i in range(0, len(packed), KEY_SIZE)]
+    keys = _keys_under(scope, prefix)
+    ours = _child_digests(keys, prefix)
+    tombstoned = None
+
+    for nibble in range(FANOUT):
+        if ours[nibble] == theirs[nibble]:
+            continue
+        child = prefix + format(nibble, 'x')
+        child_keys = {key: unique_id for key, unique_id in keys.items() if key.hex().startswith(child)}
+        if tombstoned is None:
+            tombstoned = _tombstones_under(scope, prefix)
+        # Tombstones only travel for small subtrees that differ, never for ones that already match
+        child_tombstones = [key for key in tombstoned if key.hex().startswith(child)]
+        if len(child_keys) + len(child_tombstones) <= MAX_KEYS_PER_IDS or len(child) >= KEY_SIZE * 2 - 1:
+            send_sync_frames("IDS", [scope, child, b''.join(sorted(child_keys)), b''.join(sorted(child_tombstones))],
+                             [sender], interface)
+            _count('ids_sent')
+        else:
+            send_digest(scope, child, child_keys, sender, interface)
+
+
+def handle_ids(fields, sender, interface):
+    scope, prefix, packed = fields[0], fields[1], fields[2]
+    their_tombstones = _unpack_keys(fields[3]) if len(fields) > 3 else set()
+    theirs = _unpack_keys(packed)
+    ours = _keys_under(scope, prefix)
+
+    # Records the peer has deleted are deleted here too; anything else it lacks is pushed.
+    for key, unique_id in ours.items():
+        if key in theirs:
+            continue
+        if key in their_tombstones:
+            apply_delete(scope, unique_id, interface)
+            continue
+        push_record(scope, unique_id, sender, interface)
+
+    # Records deleted here that the peer still has are deleted there; the rest are requested.
+    tombstoned = _tombstones_under(scope, prefix)
+    for key in theirs:
+        if key in tombstoned and key not in ours:
+            push_delete(scope, tombstoned[key], sender, interface)
+    wanted = [key for key in theirs if key not in ours and key not in tombstoned]
+    if wanted:
+        send_sync_frames("WANT", [scope, b''.join(sorted(wanted))], [sender], interface)
+        _count('records_requested', len(wanted))
+
+
+def handle_want(fields, sender, interface):
+    scope, packed = fields[0], fields[1]
+    wanted = _unpack_keys(packed)
+    if not wanted:
+        return
+    # Wanted keys come from one IDS subtree, so their common prefix bounds the lookup
+    prefix = os.path.commonprefix([key.hex() for key in wanted])
+    for key, unique_id in _keys_under(scope, prefix).items():
+        if key in wanted:
+            push_record(scope, unique_id, sender, interface)
+
+
+def apply_delete(scope, unique_id, interface):
+    if scope == MAIL_SCOPE:
+        record = get_mail_by_unique_id(unique_id)
+        if record:
+            delete_mail(unique_id, record[2], [], interface)
+    else:
+        delete_bulletin_by_unique_id(unique_id, [], interface)
+    _count('deletes_applied')
+
+
+def push_delete(scope, unique_id, peer, interface):
+    if scope == MAIL_SCOPE:
+        send_delete_mail_to_bbs_nodes(unique_id, [peer], interface)
+    else:
+        send_delete_bulletin_to_bbs_nodes(unique_id, [peer], interface)
+    _count('deletes_pushed')
+
+
+def push_record(scope, unique_id, peer, interface):
+    if scope == MAIL_SCOPE:
+        record = get_mail_by_unique_id(unique_id)
+        if record:
+            send_mail_to_bbs_nodes(*record, [peer], interface)
+    else:
+        record = get_bulletin_by_unique_id(unique_id)
+        if record:
+            # Marked as backfill so the peer does not re-announce old urgent bulletins
+            send_sync_frames("BACKFILL_BULLETIN", list(record), [peer], interface)
+    if record:
+        _count('records_pushed')
+
+
+def get_stats():
+    with stats_lock:
+        return dict(stats)
+
+
+class AntiEntropyScheduler:
+    def __init__(self, interface, config=None):
+        self.interface = interface
+        self.interval = 1800.0
+        self.initial_delay = 60.0
+        self.tombstone_retention_days = 30.0
+        if config is not None:
+            self.interval = config.getfloat('sync', 'digest_interval', fallback=self.interval)
+            self.initial_delay = config.getfloat('sync', 'digest_initial_delay', fallback=self.initial_delay)
+            self.tombstone_retention_days = config.getfloat('sync', 'tombstone_retention_days',
+                                                            fallback=self.tombstone_retention_days)
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.interval <= 0 or not self.interface.bbs_nodes:
+            return
+        self.thread = threading.Thread(target=self._run, name='anti-entropy', daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=5):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def _run(self):
+        delay = self.initial_delay
+        while not self.stopped.wait(delay):
+            try:
+                if self.tombstone_retention_days > 0:
+                    _count('tombstones_pruned', prune_tombstones(self.tombstone_retention_days))
+                run_round(self.interface)
+            except Exception as e:
+                logging.error(f"SERVER SYNC: Anti-entropy round failed: {e}")
+            delay = self.interval
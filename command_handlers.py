@@ -6,14 +6,15 @@ import time
 from meshtastic import BROADCAST_NUM
 
 from db_operations import (
-    add_bulletin, add_mail, delete_mail,
+    add_bulletin, add_mail, count_bulletins, count_mail, delete_mail,
     get_bulletin_content, get_bulletins,
     get_mail, get_mail_content,
     add_channel, get_channels, get_sender_id_by_mail_id
 )
+from node_stats import get_node_stats
 from utils import (
-    get_node_id_from_num, get_node_info,
-    get_node_short_name, send_message,
+    append_to_draft, get_node_id_from_num, get_node_info,
+    get_node_long_name, get_node_short_name, pack_lines, send_message,
     update_user_state
 )
 
@@ -25,6 +26,10 @@ main_menu_items = config['menu']['main_menu_items'].split(',')
 bbs_menu_items = config['menu']['bbs_menu_items'].split(',')
 utilities_menu_items = config['menu']['utilities_menu_items'].split(',')
 
+# Mail and bulletin listings are sent a page at a time
+page_size = config.getint('menu', 'page_size', fallback=10)
+NEXT_PAGE_HINT = "Send N for the next page."
+
 
 def build_menu(items, menu_name):
     menu_str = f"{menu_name}\n"
@@ -52,23 +57,43 @@ def build_menu(items, menu_name):
     return menu_str
 
 
+# Menus only change with config.ini, so build them once
+menu_strings = {
+    None: build_menu(main_menu_items, "💾TC² BBS💾"),
+    'bbs': build_menu(bbs_menu_items, "📰BBS Menu📰"),
+    'utilities': build_menu(utilities_menu_items, "🛠️Utilities Menu🛠️"),
+}
+
+
+def fetch_page(fetch, key, after_id=None):
+    """Returns one page of rows and the cursor for the next page (None on the last page)."""
+    rows = fetch(key, after_id, page_size + 1)
+    if len(rows) > page_size:
+        return rows[:page_size], rows[page_size - 1][0]
+    return rows, None
+
+
+def is_next_page(message, state):
+    return message.lower().strip() == 'n' and state.get('cursor') is not None
+
+
+def send_lines(lines, sender_id, interface):
+    for message in pack_lines(lines):
+        send_message(message, sender_id, interface)
+
+
 def handle_help_command(sender_id, interface, menu_name=None):
     if menu_name:
         update_user_state(sender_id, {'command': 'MENU', 'menu': menu_name, 'step': 1})
-        if menu_name == 'bbs':
-            response = build_menu(bbs_menu_items, "📰BBS Menu📰")
-        elif menu_name == 'utilities':
-            response = build_menu(utilities_menu_items, "🛠️Utilities Menu🛠️")
     else:
         update_user_state(sender_id, {'command': 'MAIN_MENU', 'step': 1})  # Reset to main menu state
-        response = build_menu(main_menu_items, "💾TC² BBS💾")
-    send_message(response, sender_id, interface)
+    send_message(menu_strings.get(menu_name, menu_strings[None]), sender_id, interface)
 
 
 def get_node_name(node_id, interface):
-    node_info = interface.nodes.get(node_id)
-    if node_info:
-        return node_info['user']['longName']
+    long_name = get_node_long_name(node_id, interface)
+    if long_name:
+        return long_name
     return f"Node {node_id}"
 
 
@@ -129,32 +154,23 @@ def handle_stats_steps(sender_id, message, step, interface):
                 "Last hour": 3600
             }
             total_nodes_summary = []
+            node_stats = get_node_stats(interface)
 
             for period, seconds in timeframes.items():
-                if seconds is None:
-                    total_nodes = len(interface.nodes)
-                else:
-                    time_limit = current_time - seconds
-                    total_nodes = sum(1 for node in interface.nodes.values() if node.get('lastHeard', 0) >= time_limit)
+                total_nodes = node_stats.count_heard_since(None if seconds is None else current_time - seconds)
                 total_nodes_summary.append(f"- {period}: {total_nodes}")
 
             response = "Total nodes seen:\n" + "\n".join(total_nodes_summary)
             send_message(response, sender_id, interface)
             handle_stats_command(sender_id, interface)
         elif choice == 'h':
-            hw_models = {}
-            for node in interface.nodes.values():
-                hw_model = node['user'].get('hwModel', 'Unknown')
-                hw_models[hw_model] = hw_models.get(hw_model, 0) + 1
-            response = "Hardware Models:\n" + "\n".join([f"{model}: {count}" for model, count in hw_models.items()])
+            hw_models = get_node_stats(interface).get_hw_models()
+            response = "Hardware Models:\n" + "\n".join([f"{model}: {count}" for model, count in hw_models])
             send_message(response, sender_id, interface)
             handle_stats_command(sender_id, interface)
         elif choice == 'r':
-            roles = {}
-            for node in interface.nodes.values():
-                role = node['user'].get('role', 'Unknown')
-                roles[role] = roles.get(role, 0) + 1
-            response = "Roles:\n" + "\n".join([f"{role}: {count}" for role, count in roles.items()])
+            roles = get_node_stats(interface).get_roles()
+            response = "Roles:\n" + "\n".join([f"{role}: {count}" for role, count in roles])
             send_message(response, sender_id, interface)
             handle_stats_command(sender_id, interface)
 
@@ -173,12 +189,8 @@ def handle_bb_steps(sender_id, message, step, state, interface, bbs_nodes):
     elif step == 2:
         board_name = state['board']
         if message.lower() == 'r':
-            bulletins = get_bulletins(board_name)
-            if bulletins:
-                send_message(f"Select a bulletin number to view from {board_name}:", sender_id, interface)
-                for bulletin in bulletins:
-                    send_message(f"[{bulletin[0]}] {bulletin[1]}", sender_id, interface)
-                update_user_state(sender_id, {'command': 'BULLETIN_READ', 'step': 3, 'board': board_name})
+            if count_bulletins(board_name):
+                send_board_page(sender_id, interface, board_name, [f"Select a bulletin number to view from {board_name}:"])
             else:
                 send_message(f"No bulletins in {board_name}.", sender_id, interface)
                 handle_bb_steps(sender_id, 'e', 1, state, interface, bbs_nodes)
@@ -195,6 +207,9 @@ def handle_bb_steps(sender_id, message, step, state, interface, bbs_nodes):
             update_user_state(sender_id, {'command': 'BULLETIN_POST', 'step': 4, 'board': board_name})
 
     elif step == 3:
+        if is_next_page(message, state):
+            send_board_page(sender_id, interface, state['board'], [], state['cursor'])
+            return
         bulletin_id = int(message)
         sender_short_name, date, subject, content, unique_id = get_bulletin_content(bulletin_id)
         send_message(f"From: {sender_short_name}\nDate: {date}\nSubject: {subject}\n- - - - - - -\n{content}", sender_id, interface)
@@ -221,11 +236,28 @@ def handle_bb_steps(sender_id, message, step, state, interface, bbs_nodes):
             unique_id = add_bulletin(board, sender_short_name, subject, content, bbs_nodes, interface)
             send_message(f"Your bulletin '{subject}' has been posted to {board}.\n(╯°□°)╯📄📌[{board}]", sender_id, interface)
             handle_bb_steps(sender_id, 'e', 1, state, interface, bbs_nodes)
-        else:
-            state['content'] += message + "\n"
-            update_user_state(sender_id, state)
+        elif not append_to_draft(sender_id, state, message):
+            send_message("Your message has reached the maximum length. Send END to finish it.", sender_id, interface)
+
 
 
+def send_board_page(sender_id, interface, board_name, lines, after_id=None):
+    bulletins, cursor = fetch_page(get_bulletins, board_name, after_id)
+    lines += [f"[{bulletin[0]}] {bulletin[1]}" for bulletin in bulletins]
+    if cursor is not None:
+        lines.append(NEXT_PAGE_HINT)
+    send_lines(lines, sender_id, interface)
+    update_user_state(sender_id, {'command': 'BULLETIN_READ', 'step': 3, 'board': board_name, 'cursor': cursor})
+
+
+def send_mail_page(sender_id, interface, sender_node_id, lines, after_id=None):
+    mail, cursor = fetch_page(get_mail, sender_node_id, after_id)
+    lines += [f"-{msg[0]}-\nDate: {msg[3]}\nFrom: {msg[1]}\nSubject: {msg[2]}" for msg in mail]
+    if cursor is not None:
+        lines.append(NEXT_PAGE_HINT)
+    send_lines(lines, sender_id, interface)
+    update_user_state(sender_id, {'command': 'MAIL', 'step': 2, 'cursor': cursor})
+
 
 def handle_mail_steps(sender_id, message, step, state, interface, bbs_nodes):
     message = message.lower().strip()
@@ -236,12 +268,10 @@ def handle_mail_steps(sender_id, message, step, state, interface, bbs_nodes):
         choice = message
         if choice == 'r':
             sender_node_id = get_node_id_from_num(sender_id, interface)
-            mail = get_mail(sender_node_id)
-            if mail:
-                send_message(f"You have {len(mail)} mail messages. Select a message number to read:", sender_id, interface)
-                for msg in mail:
-                    send_message(f"-{msg[0]}-\nDate: {msg[3]}\nFrom: {msg[1]}\nSubject: {msg[2]}", sender_id, interface)
-                update_user_state(sender_id, {'command': 'MAIL', 'step': 2})
+            total = count_mail(sender_node_id)
+            if total:
+                send_mail_page(sender_id, interface, sender_node_id,
+                               [f"You have {total} mail messages. Select a message number to read:"])
             else:
                 send_message("There are no messages in your mailbox.📭", sender_id, interface)
                 update_user_state(sender_id, None)
@@ -252,6 +282,9 @@ def handle_mail_steps(sender_id, message, step, state, interface, bbs_nodes):
             handle_help_command(sender_id, interface)
 
     elif step == 2:
+        if is_next_page(message, state):
+            send_mail_page(sender_id, interface, get_node_id_from_num(sender_id, interface), [], state['cursor'])
+            return
         mail_id = int(message)
         try:
             sender_node_id = get_node_id_from_num(sender_id, interface)
@@ -328,9 +361,8 @@ def handle_mail_steps(sender_id, message, step, state, interface, bbs_nodes):
 
             update_user_state(sender_id, None)
             update_user_state(sender_id, {'command': 'MAIL', 'step': 8})
-        else:
-            state['content'] += message + "\n"
-            update_user_state(sender_id, state)
+        elif not append_to_draft(sender_id, state, message):
+            send_message("Your message has reached the maximum length. Send END to finish it.", sender_id, interface)
 
     elif step == 8:
         if message.lower() == "y":
@@ -341,14 +373,12 @@ def handle_mail_steps(sender_id, message, step, state, interface, bbs_nodes):
 
 
 def handle_wall_of_shame_command(sender_id, interface):
-    response = "Devices with battery levels below 20%:\n"
-    for node_id, node in interface.nodes.items():
-        metrics = node.get('deviceMetrics', {})
-        battery_level = metrics.get('batteryLevel', 101)
-        if battery_level < 20:
-            long_name = node['user']['longName']
+    low_battery = get_node_stats(interface).get_low_battery()
+    if low_battery:
+        response = "Devices with battery levels below 20%:\n"
+        for long_name, battery_level in low_battery:
             response += f"{long_name} - Battery {battery_level}%\n"
-    if response == "Devices with battery levels below 20%:\n":
+    else:
         response = "No devices with battery levels below 20% found."
     send_message(response, sender_id, interface)
 
@@ -440,27 +470,37 @@ def handle_send_mail_command(sender_id, message, interface, bbs_nodes):
 def handle_check_mail_command(sender_id, interface):
     try:
         sender_node_id = get_node_id_from_num(sender_id, interface)
-        mail = get_mail(sender_node_id)
-        if not mail:
+        if not count_mail(sender_node_id):
             send_message("You have no new messages.", sender_id, interface)
             return
 
-        response = "📬 You have the following messages:\n"
-        for i, msg in enumerate(mail):
-            response += f"{i + 1:02d}. From: {msg[1]}, Subject: {msg[2]}\n"
-        response += "\nPlease reply with the number of the message you want to read."
-        send_message(response, sender_id, interface)
-
-        update_user_state(sender_id, {'command': 'CHECK_MAIL', 'step': 1, 'mail': mail})
+        send_check_mail_page(sender_id, interface, sender_node_id)
 
     except Exception as e:
         logging.error(f"Error processing check mail command: {e}")
         send_message("Error processing check mail command.", sender_id, interface)
 
 
+def send_check_mail_page(sender_id, interface, sender_node_id, shown=(), after_id=None):
+    mail, cursor = fetch_page(get_mail, sender_node_id, after_id)
+    lines = [] if shown else ["📬 You have the following messages:"]
+    lines += [f"{len(shown) + i + 1:02d}. From: {msg[1]}, Subject: {msg[2]}" for i, msg in enumerate(mail)]
+    lines.append("\nPlease reply with the number of the message you want to read.")
+    if cursor is not None:
+        lines.append(NEXT_PAGE_HINT)
+    send_lines(lines, sender_id, interface)
+
+    # Earlier pages stay in the state so their numbers remain valid
+    update_user_state(sender_id, {'command': 'CHECK_MAIL', 'step': 1, 'mail': list(shown) + list(mail),
+                                  'cursor': cursor})
+
+
 def handle_read_mail_command(sender_id, message, state, interface):
     try:
         mail = state.get('mail', [])
+        if is_next_page(message, state):
+            send_check_mail_page(sender_id, interface, get_node_id_from_num(sender_id, interface), mail, state['cursor'])
+            return
         message_number = int(message) - 1
 
         if message_number < 0 or message_number >= len(mail):
@@ -539,26 +579,36 @@ def handle_check_bulletin_command(sender_id, message, interface):
             return
 
         board_name = parts[1].strip()
-        bulletins = get_bulletins(board_name)
-        if not bulletins:
+        if not count_bulletins(board_name):
             send_message(f"No bulletins available on {board_name} board.", sender_id, interface)
             return
 
-        response = f"📰 Bulletins on {board_name} board:\n"
-        for i, bulletin in enumerate(bulletins):
-            response += f"[{i+1:02d}] Subject: {bulletin[1]}, From: {bulletin[2]}, Date: {bulletin[3]}\n"
-        response += "\nPlease reply with the number of the bulletin you want to read."
-        send_message(response, sender_id, interface)
-
-        update_user_state(sender_id, {'command': 'CHECK_BULLETIN', 'step': 1, 'board_name': board_name, 'bulletins': bulletins})
+        send_check_bulletin_page(sender_id, interface, board_name)
 
     except Exception as e:
         logging.error(f"Error processing check bulletin command: {e}")
         send_message("Error processing check bulletin command.", sender_id, interface)
 
+def send_check_bulletin_page(sender_id, interface, board_name, shown=(), after_id=None):
+    bulletins, cursor = fetch_page(get_bulletins, board_name, after_id)
+    lines = [] if shown else [f"📰 Bulletins on {board_name} board:"]
+    lines += [f"[{len(shown) + i + 1:02d}] Subject: {bulletin[1]}, From: {bulletin[2]}, Date: {bulletin[3]}"
+              for i, bulletin in enumerate(bulletins)]
+    lines.append("\nPlease reply with the number of the bulletin you want to read.")
+    if cursor is not None:
+        lines.append(NEXT_PAGE_HINT)
+    send_lines(lines, sender_id, interface)
+
+    update_user_state(sender_id, {'command': 'CHECK_BULLETIN', 'step': 1, 'board_name': board_name,
+                                  'bulletins': list(shown) + list(bulletins), 'cursor': cursor})
+
+
 def handle_read_bulletin_command(sender_id, message, state, interface):
     try:
         bulletins = state.get('bulletins', [])
+        if is_next_page(message, state):
+            send_check_bulletin_page(sender_id, interface, state['board_name'], bulletins, state['cursor'])
+            return
         message_number = int(message) - 1
 
         if message_number < 0 or message_number >= len(bulletins):
@@ -658,7 +708,9 @@ def handle_list_channels_command(sender_id, interface):
         send_message("Error processing list channels command.", sender_id, interface)
 
 
+QUICK_HELP = ("✈️QUICK COMMANDS✈️\nSend command below for usage info:\nSM,, - Send "
+              "Mail\nCM - Check Mail\nPB,, - Post Bulletin\nCB,, - Check Bulletins\n")
+
+
 def handle_quick_help_command(sender_id, interface):
-    response = ("✈️QUICK COMMANDS✈️\nSend command below for usage info:\nSM,, - Send "
-                "Mail\nCM - Check Mail\nPB,, - Post Bulletin\nCB,, - Check Bulletins\n")
-    send_message(response, sender_id, interface)
+    send_message(QUICK_HELP, sender_id, interface)
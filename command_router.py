@@ -0,0 +1,155 @@
+import bisect
+import logging
+import threading
+import time
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+class Route:
+    """A registered handler plus its latency histogram."""
+
+    def __init__(self, name, handler, exclusive=False):
+        self.name = name
+        self.handler = handler
+        self.exclusive = exclusive
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+
+class CommandRouter:
+    """
+    Dispatches incoming user messages in three lookups:
+
+    1. quick commands ("sm,,", "cm", ...) by longest prefix in a character trie,
+    2. single-key menu choices from the menu the user's state points at,
+    3. the (command, step) of the user's state, falling back to (command, None).
+
+    Handlers are called as handler(sender_id, message, state, interface).
+    Modules can register additional routes at import time without touching
+    the dispatcher.
+    """
+
+    def __init__(self):
+        self.quick_commands = {}
+        self.menus = {}
+        self.state_menus = {}
+        self.steps = {}
+        self.default_route = None
+        self.routes = {}
+        self.lock = threading.Lock()
+
+    def _route(self, name, handler, exclusive=False):
+        route = Route(name, handler, exclusive)
+        self.routes[name] = route
+        return route
+
+    def add_quick_command(self, prefix, handler, name=None):
+        node = self.quick_commands
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node[None] = self._route(name or f"quick:{prefix}", handler)
+
+    def add_menu(self, menu_name, handlers, with_state=False):
+        """Registers a {key: handler} menu; handlers take (sender_id, interface[, state])."""
+        routes = {}
+        for key, handler in handlers.items():
+            if with_state:
+                call = lambda sender_id, message, state, interface, handler=handler: handler(sender_id, interface, state)
+            else:
+                call = lambda sender_id, message, state, interface, handler=handler: handler(sender_id, interface)
+            routes[key] = self._route(f"menu:{menu_name}:{key}", call)
+        self.menus[menu_name] = routes
+
+    def add_state_menu(self, command, menu_name):
+        """Selects the menu used while the user is in `command`; menu_name may be a function of the state."""
+        self.state_menus[command] = menu_name
+
+    def add_step(self, command, handler, step=None, exclusive=False):
+        """
+        Registers the handler for a (command, step) state; step=None matches any step.
+        Exclusive routes receive every message in that state, before menus and "x".
+        """
+        self.steps[(command, step)] = self._route(f"step:{command}:{'*' if step is None else step}", handler,
+                                                  exclusive)
+
+    def set_default(self, handler):
+        self.default_route = self._route("default", handler)
+
+    def match_quick_command(self, message_lower):
+        node = self.quick_commands
+        match = None
+        for char in message_lower:
+            node = node.get(char)
+            if node is None:
+                break
+            match = node.get(None, match)
+        return match
+
+    def _menu_for(self, state):
+        menu_name = self.state_menus.get(state['command']) if state else None
+        if callable(menu_name):
+            menu_name = menu_name(state)
+        return self.menus.get(menu_name) or self.menus.get('main', {})
+
+    def dispatch(self, sender_id, message, state, interface):
+        message_lower = message.lower().strip()
+        # Handle repeated characters for single character commands using a prefix
+        if len(message_lower) == 2 and message_lower[1] == 'x':
+            message_lower = message_lower[0]
+
+        route = self.match_quick_command(message_lower)
+        if route is None and state:
+            step_route = self.steps.get((state['command'], state.get('step'))) or self.steps.get((state['command'], None))
+            if step_route is not None and step_route.exclusive:
+                route = step_route
+        if route is None:
+            if message_lower == 'x':
+                route = self.default_route
+            else:
+                route = self._menu_for(state).get(message_lower)
+        if route is None and state:
+            route = self.steps.get((state['command'], state.get('step'))) or self.steps.get((state['command'], None))
+        if route is None:
+            route = self.default_route
+        if route is not None:
+            self._call(route, sender_id, message, state, interface)
+
+    def _call(self, route, sender_id, message, state, interface):
+        started = time.perf_counter()
+        failed = False
+        try:
+            route.handler(sender_id, message, state, interface)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                route.count += 1
+                route.errors += failed
+                route.total += elapsed
+                route.max = max(route.max, elapsed)
+                route.buckets[bisect.bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+            if elapsed > 1.0:
+                logging.info(f"Slow command route {route.name}: {elapsed:.3f}s")
+
+    def get_stats(self):
+        """Per-route call counts and latency histograms (bucket upper bounds in seconds)."""
+        with self.lock:
+            return {
+                route.name: {
+                    'count': route.count,
+                    'errors': route.errors,
+                    'avg': route.total / route.count,
+                    'max': route.max,
+                    'histogram': dict(zip([str(bound) for bound in LATENCY_BUCKETS] + ['inf'], route.buckets)),
+                }
+                for route in self.routes.values() if route.count
+            }
+
+
+router = CommandRouter()
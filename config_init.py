@@ -91,6 +91,9 @@ def initialize_config(config_file: str = None) -> dict[str, Any]:
     hostname - host name for TCP interface
     port - serial port name for serial interface
     bbs_nodes - list of peer nodes to sync with
+    sync_format - 'text' (pipe-delimited messages) or 'binary' (framed PRIVATE_APP packets)
+    sync_compression - compression for binary sync: 'zlib', 'zstd' or 'none'
+    sync_transport - 'unicast' (one send per peer) or 'fanout' (one broadcast on the sync channel, binary format only)
 
     Args:
         config_file (str, optional): Path to config file. Function reads from './config.ini' if this arg is set to None. Defaults to None.
@@ -114,6 +117,10 @@ def initialize_config(config_file: str = None) -> dict[str, Any]:
 
     print(f"Configured to sync with the following BBS nodes: {bbs_nodes}")
 
+    sync_format = config.get('sync', 'format', fallback='text')
+    sync_compression = config.get('sync', 'compression', fallback='zlib')
+    sync_transport = config.get('sync', 'transport', fallback='unicast')
+
     allowed_nodes = config.get('allow_list', 'allowed_nodes', fallback='').split(',')
     if allowed_nodes == ['']:
         allowed_nodes = []
@@ -126,6 +133,9 @@ def initialize_config(config_file: str = None) -> dict[str, Any]:
         'hostname': hostname,
         'port': port,
         'bbs_nodes': bbs_nodes,
+        'sync_format': sync_format,
+        'sync_compression': sync_compression,
+        'sync_transport': sync_transport,
         'allowed_nodes': allowed_nodes,
         'mqtt_topic': 'meshtastic.receive'
     }
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Predicted signal coverage of a site, as a lat/lon raster of RSSI and SNR.
+
+For every cell within the radius the path from the site antenna to a
+receiver rx_height above that cell's ground is sampled (radio_path, with
+Earth curvature), and its loss is free-space loss plus knife-edge
+diffraction over the terrain:
+
+- 'deygout': the main edge (highest Fresnel-Kirchhoff v) plus the worst
+  edge on each side of it, the usual three-edge Deygout construction,
+- 'single': the main edge only,
+- None: free space only.
+
+Everything runs on whole chunks of paths at once, and the rows of the
+raster can be spread over a process pool like the LOS maps. The result is
+kept as path loss; RSSI and SNR follow from a LinkBudget, so the same raster
+serves any transmit power or antenna. save() writes a float32
+(rssi, snr, path loss) .npy stack with a .json sidecar holding the bounds
+and a GDAL-style geotransform.
+
+Usage: python3 coverage_raster.py --lat 30.368449 --lon -98.0621764 --height 10 --radius-km 15 --output site
+"""
+
+import argparse
+import json
+import math
+
+import numpy as np
+
+import los_engine
+import radio_path
+from terrain import grid_for
+
+# LoRa demodulation limit (SNR in dB) per spreading factor
+LORA_SNR_LIMITS = {7: -7.5, 8: -10.0, 9: -12.5, 10: -15.0, 11: -17.5, 12: -20.0}
+BANDS = ('rssi_dbm', 'snr_db', 'path_loss_db')
+# Paths shorter than this are treated as this long, so free-space loss stays finite
+MIN_DISTANCE_M = 1.0
+
+
+class LinkBudget:
+    """Transmitter and receiver settings; the defaults are a 22 dBm SX1262 on Meshtastic LongFast."""
+
+    def __init__(self, tx_power_dbm=22.0, tx_gain_dbi=0.0, rx_gain_dbi=0.0, cable_loss_db=0.0, bandwidth_khz=250.0,
+                 noise_figure_db=6.0, spreading_factor=11):
+        self.tx_power_dbm = tx_power_dbm
+        self.tx_gain_dbi = tx_gain_dbi
+        self.rx_gain_dbi = rx_gain_dbi
+        self.cable_loss_db = cable_loss_db
+        self.bandwidth_khz = bandwidth_khz
+        self.noise_figure_db = noise_figure_db
+        self.spreading_factor = spreading_factor
+
+    @property
+    def noise_floor_dbm(self):
+        return -174 + 10 * math.log10(self.bandwidth_khz * 1000) + self.noise_figure_db
+
+    def rssi(self, path_loss_db):
+        return self.tx_power_dbm + self.tx_gain_dbi + self.rx_gain_dbi - self.cable_loss_db - path_loss_db
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+def free_space_loss(distance_m, frequency):
+    """Free-space path loss in dB."""
+    distance_km = np.maximum(distance_m, MIN_DISTANCE_M) / 1000
+    return 20 * np.log10(distance_km) + 20 * math.log10(radio_path.frequency_mhz(frequency)) + 32.44
+
+
+def knife_edge_loss(v):
+    """ITU-R P.526 approximation of single knife-edge loss (dB) for Fresnel-Kirchhoff parameter v."""
+    v = np.asarray(v, dtype=np.float64)
+    clipped = np.maximum(v, -0.78)
+    return np.where(v > -0.78, 6.9 + 20 * np.log10(np.sqrt((clipped - 0.1) ** 2 + 1) + clipped - 0.1), 0.0)
+
+
+def _edge_v(height, d1, d2, wavelength):
+    """v of an obstacle `height` metres above the line, d1/d2 from the ends; -inf where undefined."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        v = height * np.sqrt(2 / wavelength * (d1 + d2) / (d1 * d2))
+    return np.where(np.isfinite(v), v, -np.inf)
+
+
+def _side_edge(profile, distances, rows, start, end, start_top, end_top, window, wavelength):
+    """
+    Highest v on the sub-path from column start (top at start_top) to column
+    end (top at end_top), over the columns where window is True.
+    """
+    d_start = distances[rows, start][:, None]
+    d_end = distances[rows, end][:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        line = start_top[:, None] + (end_top - start_top)[:, None] * (distances - d_start) / (d_end - d_start)
+    v = _edge_v(profile - line, distances - d_start, d_end - distances, wavelength)
+    return np.where(window, v, -np.inf).max(axis=1)
+
+
+def diffraction_loss(profiles, frequency, diffraction='deygout'):
+    """Knife-edge diffraction loss (dB) of each path in a radio_path.PathProfiles batch."""
+    rows = np.arange(profiles.lengths_m.size)
+    if diffraction is None or profiles.fractions.size < 3:
+        return np.zeros(rows.shape)
+    wavelength = radio_path.wavelength_m(frequency)
+    # v = h * sqrt(2) / F1, and the clearance is -h
+    with np.errstate(invalid='ignore'):
+        v = -np.sqrt(2) * profiles.clearance_ratio
+    v[:, [0, -1]] = -np.inf
+    v = np.where(np.isnan(v), -np.inf, v)
+    main = v.argmax(axis=1)
+    main_v = v[rows, main]
+    loss = knife_edge_loss(main_v)
+    if diffraction == 'single':
+        return loss
+    if diffraction != 'deygout':
+        raise ValueError(f"Unknown diffraction model {diffraction}")
+
+    # Samples next to the main edge that also obstruct the zone belong to the same obstacle (a
+    # ridge several samples wide), so secondary edges are only looked for beyond them
+    last = v.shape[1] - 1
+    columns = np.arange(v.shape[1])
+    clear_columns = v <= -0.78
+    left_end = np.where(clear_columns & (columns < main[:, None]), columns, 0).max(axis=1)
+    right_start = np.where(clear_columns & (columns > main[:, None]), columns, last).min(axis=1)
+
+    profile = profiles.profile
+    distances = profiles.distances_m
+    edge_top = profile[rows, main]
+    first = np.zeros(rows.shape, dtype=np.intp)
+    # Each secondary edge is measured on the sub-path between an antenna and the top of the main edge
+    left = _side_edge(profile, distances, rows, first, main, profiles.line[:, 0], edge_top,
+                      (columns > 0) & (columns <= left_end[:, None]), wavelength)
+    right = _side_edge(profile, distances, rows, main, np.full(rows.shape, last), edge_top, profiles.line[:, -1],
+                       (columns >= right_start[:, None]) & (columns < last), wavelength)
+    # Secondary edges only count where the main edge itself diffracts
+    secondary = knife_edge_loss(left) + knife_edge_loss(right)
+    return loss + np.where(main_v > -0.78, secondary, 0.0)
+
+
+def path_loss(profiles, frequency, diffraction='deygout'):
+    """Free-space plus diffraction loss (dB) of each path; NaN where an end is over a void."""
+    loss = free_space_loss(profiles.lengths_m, frequency) + diffraction_loss(profiles, frequency, diffraction)
+    no_data = np.isnan(profiles.line[:, 0]) | np.isnan(profiles.line[:, -1])
+    return np.where(no_data, np.nan, loss)
+
+
+def path_loss_to(grid, site, lats, lons, frequency='US', k_factor=radio_path.DEFAULT_K_FACTOR, rx_height=1.0,
+                 steps=los_engine.STEPS, diffraction='deygout', method='nearest'):
+    """Path loss (dB) from the site to receivers rx_height above each of a flat batch of points, in chunks."""
+    values = np.empty(len(lats))
+    for begin in range(0, len(lats), los_engine.CHUNK_RAYS):
+        chunk = slice(begin, begin + los_engine.CHUNK_RAYS)
+        profiles = radio_path.path_profiles(grid, site['lat'], site['lon'], lats[chunk], lons[chunk], site['height'],
+                                            rx_height, frequency, k_factor, steps, method)
+        values[chunk] = path_loss(profiles, frequency, diffraction)
+    return values
+
+
+def raster_axes(center_lat, center_lon, radius_km, resolution):
+    """Cell-centre latitudes (north first) and longitudes (west first) of a square raster 2*radius_km across."""
+    lat_step = 2 * radius_km / 111.32 / resolution
+    lon_step = 2 * radius_km / (111.32 * math.cos(math.radians(center_lat))) / resolution
+    north = center_lat + radius_km / 111.32
+    west = center_lon - radius_km / (111.32 * math.cos(math.radians(center_lat)))
+    lats = north - (np.arange(resolution) + 0.5) * lat_step
+    lons = west + (np.arange(resolution) + 0.5) * lon_step
+    return lats, lons
+
+
+def coverage_rows(grid, rows, site, center_lat, center_lon, radius_km, resolution, frequency='US',
+                  k_factor=radio_path.DEFAULT_K_FACTOR, rx_height=1.0, steps=los_engine.STEPS, diffraction='deygout',
+                  method='nearest'):
+    """Path loss and ground elevation rows of the raster (NaN outside the radius and over voids)."""
+    lats, lons = raster_axes(center_lat, center_lon, radius_km, resolution)
+    cell_lat, cell_lon = np.meshgrid(lats[rows], lons, indexing='ij')
+    inside = los_engine.haversine_distance(center_lat, center_lon, cell_lat, cell_lon) <= radius_km
+    loss = np.full(cell_lat.shape, np.nan)
+    elevations = grid.elevations(cell_lat, cell_lon, method)
+    elevations[~inside] = np.nan
+    loss[inside] = path_loss_to(grid, site, cell_lat[inside], cell_lon[inside], frequency, k_factor, rx_height, steps,
+                                diffraction, method)
+    return loss, elevations
+
+
+class CoverageRaster:
+    """
+    Path loss (dB) and ground elevation of a square lat/lon raster around a
+    site; row 0 is the northern edge, column 0 the western.
+    """
+
+    def __init__(self, path_loss_db, elevations, south, west, north, east, site, frequency='US',
+                 budget=None, settings=None):
+        self.path_loss_db = path_loss_db
+        self.elevations = elevations
+        self.south, self.west, self.north, self.east = south, west, north, east
+        self.site = site
+        self.frequency = frequency
+        self.budget = budget or LinkBudget()
+        self.settings = settings or {}
+
+    @property
+    def rssi(self):
+        return self.budget.rssi(self.path_loss_db).astype(np.float32)
+
+    @property
+    def snr(self):
+        return (self.rssi - np.float32(self.budget.noise_floor_dbm)).astype(np.float32)
+
+    def covered(self, spreading_factor=None):
+        """True where the predicted SNR is above the LoRa demodulation limit."""
+        limit = LORA_SNR_LIMITS[spreading_factor or self.budget.spreading_factor]
+        with np.errstate(invalid='ignore'):
+            return self.snr >= limit
+
+    @property
+    def geotransform(self):
+        """GDAL-style (west, pixel width, 0, north, 0, -pixel height) in degrees."""
+        rows, columns = self.path_loss_db.shape
+        return (self.west, (self.east - self.west) / columns, 0.0, self.north, 0.0, -(self.north - self.south) / rows)
+
+    def metadata(self):
+        return {
+            'bands': list(BANDS),
+            'crs': 'EPSG:4326',
+            'bounds': {'south': self.south, 'west': self.west, 'north': self.north, 'east': self.east},
+            'geotransform': list(self.geotransform),
+            'nodata': 'nan',
+            'site': self.site,
+            'frequency_mhz': radio_path.frequency_mhz(self.frequency),
+            'budget': self.budget.to_dict(),
+            'settings': self.settings,
+        }
+
+    def save(self, path):
+        """Writes path.npy (float32 bands x rows x columns), path.elevation.npy and path.json."""
+        stack = np.stack([self.rssi, self.snr, self.path_loss_db.astype(np.float32)])
+        np.save(f"{path}.npy", stack)
+        np.save(f"{path}.elevation.npy", self.elevations.astype(np.float32))
+        with open(f"{path}.json", 'w', encoding='utf-8') as f:
+            json.dump(self.metadata(), f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(f"{path}.json", encoding='utf-8') as f:
+            metadata = json.load(f)
+        stack = np.load(f"{path}.npy")
+        elevations = np.load(f"{path}.elevation.npy")
+        bounds = metadata['bounds']
+        return cls(stack[BANDS.index('path_loss_db')].astype(np.float64), elevations, bounds['south'], bounds['west'],
+                   bounds['north'], bounds['east'], metadata['site'], metadata['frequency_mhz'],
+                   LinkBudget(**metadata['budget']), metadata['settings'])
+
+
+def compute_coverage(srtm_data, site, radius_km, resolution, frequency='US', budget=None,
+                     k_factor=radio_path.DEFAULT_K_FACTOR, rx_height=1.0, steps=los_engine.STEPS,
+                     diffraction='deygout', method='nearest', center=None, grid=None, progress=None, workers=1):
+    """
+    Coverage of site ({'lat', 'lon', 'height'}) on a resolution x resolution
+    raster 2*radius_km across, centred on the site unless center=(lat, lon)
+    is given. Cells further than radius_km from the centre are NaN.
+    """
+    center_lat, center_lon = center or (site['lat'], site['lon'])
+    lats, lons = raster_axes(center_lat, center_lon, radius_km, resolution)
+    half_lat = (lats[0] - lats[1]) / 2
+    half_lon = (lons[1] - lons[0]) / 2
+    south, north = lats[-1] - half_lat, lats[0] + half_lat
+    west, east = lons[0] - half_lon, lons[-1] + half_lon
+    grid = grid or grid_for(srtm_data, min(south, site['lat']), min(west, site['lon']), max(north, site['lat']),
+                            max(east, site['lon']))
+    settings = dict(center_lat=center_lat, center_lon=center_lon, radius_km=radius_km, resolution=resolution,
+                    k_factor=k_factor, rx_height=rx_height, steps=steps, diffraction=diffraction, method=method)
+    kwargs = dict(settings, site=site, frequency=frequency)
+    loss, elevations = los_engine._run_map(coverage_rows, grid, kwargs, max(1, los_engine.CHUNK_RAYS // resolution),
+                                           workers, progress)
+    return CoverageRaster(loss, elevations, south, west, north, east, site, frequency, budget, settings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Predict RSSI/SNR coverage of a site")
+    parser.add_argument("--lat", type=float, required=True)
+    parser.add_argument("--lon", type=float, required=True)
+    parser.add_argument("--height", type=float, default=2, help="Antenna height above ground in meters")
+    parser.add_argument("--radius-km", type=float, default=15)
+    parser.add_argument("--resolution", type=int, default=500)
+    parser.add_argument("--frequency", default='US', help="MHz, or one of " + ", ".join(radio_path.FREQUENCIES_MHZ))
+    parser.add_argument("--tx-power", type=float, default=22, help="dBm")
+    parser.add_argument("--tx-gain", type=float, default=0, help="dBi")
+    parser.add_argument("--rx-gain", type=float, default=0, help="dBi")
+    parser.add_argument("--rx-height", type=float, default=1.0, help="Receiver height above ground in meters")
+    parser.add_argument("--diffraction", choices=['deygout', 'single', 'none'], default='deygout')
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--output", default='coverage', help="Output path without extension")
+    args = parser.parse_args()
+
+    from terrain import Terrain
+    frequency = args.frequency if args.frequency in radio_path.FREQUENCIES_MHZ else float(args.frequency)
+    budget = LinkBudget(tx_power_dbm=args.tx_power, tx_gain_dbi=args.tx_gain, rx_gain_dbi=args.rx_gain)
+    site = {'lat': args.lat, 'lon': args.lon, 'height': args.height}
+    raster = compute_coverage(Terrain(), site, args.radius_km, args.resolution, frequency, budget,
+                              rx_height=args.rx_height,
+                              diffraction=None if args.diffraction == 'none' else args.diffraction,
+                              workers=args.workers)
+    raster.save(args.output)
+    covered = raster.covered()
+    print(f"Wrote {args.output}.npy and {args.output}.json: {int(covered.sum())} of "
+          f"{int(np.sum(~np.isnan(raster.path_loss_db)))} cells above the SF{budget.spreading_factor} SNR limit")
+
+
+if __name__ == "__main__":
+    main()
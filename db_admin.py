@@ -2,6 +2,8 @@ import os
 import sqlite3
 import threading
 
+from db_schema import add_tombstone, migrate_database
+
 thread_local = threading.local()
 
 def get_db_connection():
@@ -37,6 +39,7 @@ def initialize_database():
                     url TEXT NOT NULL
                 );''')
     conn.commit()
+    migrate_database(conn)
 
 def list_bulletins():
     conn = get_db_connection()
@@ -89,10 +92,15 @@ def delete_bulletin():
             print_separator()
             return
         conn = get_db_connection()
-        c = conn.cursor()
-        for bulletin_id in bulletin_ids:
-            c.execute("DELETE FROM bulletins WHERE id = ?", (bulletin_id.strip(),))
-        conn.commit()
+        with conn:
+            c = conn.cursor()
+            for bulletin_id in bulletin_ids:
+                # Tombstone the deletion so anti-entropy sync removes it from the other nodes too
+                c.execute("SELECT unique_id, board FROM bulletins WHERE id = ?", (bulletin_id.strip(),))
+                result = c.fetchone()
+                if result:
+                    c.execute("DELETE FROM bulletins WHERE id = ?", (bulletin_id.strip(),))
+                    add_tombstone(c, result[0], 'bulletin', result[1])
         print_bold(f"Bulletin(s) with ID(s) {', '.join(bulletin_ids)} deleted.")
         print_separator()
 
@@ -105,10 +113,14 @@ def delete_mail():
             print_separator()
             return
         conn = get_db_connection()
-        c = conn.cursor()
-        for mail_id in mail_ids:
-            c.execute("DELETE FROM mail WHERE id = ?", (mail_id.strip(),))
-        conn.commit()
+        with conn:
+            c = conn.cursor()
+            for mail_id in mail_ids:
+                c.execute("SELECT unique_id FROM mail WHERE id = ?", (mail_id.strip(),))
+                result = c.fetchone()
+                if result:
+                    c.execute("DELETE FROM mail WHERE id = ?", (mail_id.strip(),))
+                    add_tombstone(c, result[0], 'mail')
         print_bold(f"Mail with ID(s) {', '.join(mail_ids)} deleted.")
         print_separator()
 
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Query latency benchmark for the BBS database.
+
+Builds throw-away databases with 10k/100k/1M mail and bulletin rows and
+times the hot BBS queries against the original (unindexed) schema and
+against the migrated schema with the configured pragmas.
+
+Usage: python3 db_benchmark.py [--sizes 10000,100000,1000000] [--repeat 200]
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+import uuid
+
+import db_operations
+import db_schema
+
+BOARDS = ["General", "Info", "News", "Urgent"]
+RECIPIENTS = 500
+
+
+def populate(conn, rows):
+    now = "2024-07-14 12:00"
+    bulletins = ((BOARDS[i % len(BOARDS)], f"N{i % 97}", now, f"Subject {i}", "x" * 120, str(uuid.uuid4()))
+                 for i in range(rows))
+    mail = ((f"!{i % 211:08x}", f"N{i % 211}", f"!{i % RECIPIENTS:08x}", now, f"Subject {i}", "x" * 120,
+             str(uuid.uuid4())) for i in range(rows))
+    with conn:
+        conn.executemany("INSERT INTO bulletins (board, sender_short_name, date, subject, content, unique_id) "
+                         "VALUES (?, ?, ?, ?, ?, ?)", bulletins)
+        conn.executemany("INSERT INTO mail (sender, sender_short_name, recipient, date, subject, content, unique_id) "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?)", mail)
+
+
+def time_query(label, fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"  {label:<32} {elapsed * 1000:10.3f} ms")
+
+
+def run(rows, repeat, migrated):
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    db_operations.DB_FILE = path
+    try:
+        saved_migrations = db_schema.SCHEMA_MIGRATIONS
+        saved_settings = dict(db_operations.db_settings)
+        if not migrated:
+            # Original schema: no indexes and the default rollback journal.
+            db_schema.SCHEMA_MIGRATIONS = []
+            db_operations.db_settings.update(journal_mode='DELETE', synchronous='FULL', mmap_size=0)
+        try:
+            db_operations.initialize_database()
+        finally:
+            db_schema.SCHEMA_MIGRATIONS = saved_migrations
+            db_operations.db_settings.update(saved_settings)
+        conn = db_operations.get_db_connection()
+        populate(conn, rows)
+        unique_ids = [row[0] for row in conn.execute("SELECT unique_id FROM mail ORDER BY random() LIMIT 100")]
+
+        print(f"{rows} rows, {'migrated schema' if migrated else 'original schema'}:")
+        time_query("get_bulletins(board)", lambda: db_operations.get_bulletins(random.choice(BOARDS)), max(repeat // 20, 1))
+        time_query("get_mail(recipient)",
+                   lambda: db_operations.get_mail(f"!{random.randrange(RECIPIENTS):08x}"), repeat)
+        time_query("get_mail_content(id, recipient)",
+                   lambda: db_operations.get_mail_content(random.randrange(1, rows), "!00000001"), repeat)
+        time_query("recipient by unique_id",
+                   lambda: conn.execute("SELECT recipient FROM mail WHERE unique_id = ?",
+                                        (random.choice(unique_ids),)).fetchone(), repeat)
+    finally:
+        db_operations.close_db_connection()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BBS database query benchmark")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Comma separated row counts")
+    parser.add_argument("--repeat", type=int, default=200, help="Iterations per query")
+    args = parser.parse_args()
+
+    for rows in (int(size) for size in args.sizes.split(',')):
+        run(rows, args.repeat, migrated=False)
+        run(rows, args.repeat, migrated=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,10 +2,11 @@ import logging
 import sqlite3
 import threading
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from meshtastic import BROADCAST_NUM
 
+from db_schema import add_tombstone, migrate_database, sync_key
 from utils import (
     send_bulletin_to_bbs_nodes,
     send_delete_bulletin_to_bbs_nodes,
@@ -14,14 +15,51 @@ from utils import (
 )
 
 
+DB_FILE = 'bulletins.db'
+
 thread_local = threading.local()
 
+# Connection pragmas, overridden from the [database] section of config.ini
+db_settings = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -8000,
+    'mmap_size': 67108864,
+}
+
+
+def configure_database(config):
+    db_settings['journal_mode'] = config.get('database', 'journal_mode', fallback=db_settings['journal_mode'])
+    db_settings['synchronous'] = config.get('database', 'synchronous', fallback=db_settings['synchronous'])
+    db_settings['cache_size'] = config.getint('database', 'cache_size', fallback=db_settings['cache_size'])
+    db_settings['mmap_size'] = config.getint('database', 'mmap_size', fallback=db_settings['mmap_size'])
+
+
+def apply_pragmas(conn):
+    conn.execute(f"PRAGMA journal_mode = {db_settings['journal_mode']}")
+    conn.execute(f"PRAGMA synchronous = {db_settings['synchronous']}")
+    conn.execute(f"PRAGMA cache_size = {int(db_settings['cache_size'])}")
+    conn.execute(f"PRAGMA mmap_size = {int(db_settings['mmap_size'])}")
+
+
 def get_db_connection():
     if not hasattr(thread_local, 'connection'):
-        thread_local.connection = sqlite3.connect('bulletins.db')
+        conn = sqlite3.connect(DB_FILE)
+        apply_pragmas(conn)
+        thread_local.connection = conn
     return thread_local.connection
 
-def initialize_database():
+
+def close_db_connection():
+    conn = getattr(thread_local, 'connection', None)
+    if conn is not None:
+        conn.close()
+        del thread_local.connection
+
+
+def initialize_database(config=None):
+    if config is not None:
+        configure_database(config)
     conn = get_db_connection()
     c = conn.cursor()
     c.execute('''CREATE TABLE IF NOT EXISTS bulletins (
@@ -49,6 +87,7 @@ def initialize_database():
                     url TEXT NOT NULL
                 );''')
     conn.commit()
+    migrate_database(conn)
     print("Database schema initialized.")
 
 def add_channel(name, url, bbs_nodes=None, interface=None):
@@ -76,9 +115,13 @@ def add_bulletin(board, sender_short_name, subject, content, bbs_nodes, interfac
     if not unique_id:
         unique_id = str(uuid.uuid4())
     c.execute(
-        "INSERT INTO bulletins (board, sender_short_name, date, subject, content, unique_id) VALUES (?, ?, ?, ?, ?, ?)",
-        (board, sender_short_name, date, subject, content, unique_id))
+        "INSERT INTO bulletins (board, sender_short_name, date, subject, content, unique_id, sync_key) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(unique_id) DO NOTHING",
+        (board, sender_short_name, date, subject, content, unique_id, sync_key(unique_id)))
     conn.commit()
+    if not c.rowcount:
+        logging.info(f"Bulletin with unique_id {unique_id} is already stored, not adding it again")
+        return unique_id
     if bbs_nodes and interface:
         send_bulletin_to_bbs_nodes(board, sender_short_name, subject, content, unique_id, bbs_nodes, interface)
 
@@ -90,12 +133,57 @@ def add_bulletin(board, sender_short_name, subject, content, bbs_nodes, interfac
     return unique_id
 
 
-def get_bulletins(board):
+def insert_sync_records(bulletins, mail):
+    """
+    Store bulletins and mail received from other BBS nodes in one transaction.
+
+    bulletins: (board, sender_short_name, subject, content, unique_id) tuples
+    mail: (sender_id, sender_short_name, recipient_id, subject, content, unique_id) tuples
+
+    Records whose unique_id is already stored, or was deleted here, are skipped. Returns the lists of
+    bulletins and mail that were actually inserted.
+    """
+    conn = get_db_connection()
+    date = datetime.now().strftime('%Y-%m-%d %H:%M')
+    inserted_bulletins = []
+    inserted_mail = []
+    with conn:
+        # Tombstones are checked per record through their primary key, never loaded as a whole
+        for board, sender_short_name, subject, content, unique_id in bulletins:
+            c = conn.execute(
+                "INSERT INTO bulletins (board, sender_short_name, date, subject, content, unique_id, sync_key) "
+                "SELECT ?, ?, ?, ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM tombstones WHERE unique_id = ?) "
+                "ON CONFLICT(unique_id) DO NOTHING",
+                (board, sender_short_name, date, subject, content, unique_id, sync_key(unique_id), unique_id))
+            if c.rowcount:
+                inserted_bulletins.append((board, sender_short_name, subject, content, unique_id))
+        for sender_id, sender_short_name, recipient_id, subject, content, unique_id in mail:
+            c = conn.execute(
+                "INSERT INTO mail (sender, sender_short_name, recipient, date, subject, content, unique_id, sync_key) "
+                "SELECT ?, ?, ?, ?, ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM tombstones WHERE unique_id = ?) "
+                "ON CONFLICT(unique_id) DO NOTHING",
+                (sender_id, sender_short_name, recipient_id, date, subject, content, unique_id, sync_key(unique_id),
+                 unique_id))
+            if c.rowcount:
+                inserted_mail.append((sender_id, sender_short_name, recipient_id, subject, content, unique_id))
+    return inserted_bulletins, inserted_mail
+
+
+def get_bulletins(board, after_id=None, limit=None):
+    """Bulletins on a board in id order; pass the last id seen as after_id to fetch the next page."""
     conn = get_db_connection()
     c = conn.cursor()
-    c.execute("SELECT id, subject, sender_short_name, date, unique_id FROM bulletins WHERE board = ?", (board,))
+    c.execute("SELECT id, subject, sender_short_name, date, unique_id FROM bulletins WHERE board = ? AND id > ? "
+              "ORDER BY id LIMIT ?", (board, after_id or 0, -1 if limit is None else limit))
     return c.fetchall()
 
+
+def count_bulletins(board):
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute("SELECT COUNT(*) FROM bulletins WHERE board = ?", (board,))
+    return c.fetchone()[0]
+
 def get_bulletin_content(bulletin_id):
     conn = get_db_connection()
     c = conn.cursor()
@@ -106,9 +194,25 @@ def get_bulletin_content(bulletin_id):
 def delete_bulletin(bulletin_id, bbs_nodes, interface):
     conn = get_db_connection()
     c = conn.cursor()
-    c.execute("DELETE FROM bulletins WHERE id = ?", (bulletin_id,))
-    conn.commit()
-    send_delete_bulletin_to_bbs_nodes(bulletin_id, bbs_nodes, interface)
+    c.execute("SELECT unique_id FROM bulletins WHERE id = ?", (bulletin_id,))
+    result = c.fetchone()
+    if result is None:
+        logging.error(f"No bulletin found with id: {bulletin_id}")
+        return
+    delete_bulletin_by_unique_id(result[0], bbs_nodes, interface)
+
+
+def delete_bulletin_by_unique_id(unique_id, bbs_nodes, interface):
+    # Row ids differ between nodes, so deletes are synced and tombstoned by unique_id only
+    conn = get_db_connection()
+    with conn:
+        c = conn.execute("SELECT board FROM bulletins WHERE unique_id = ?", (unique_id,))
+        result = c.fetchone()
+        if result:
+            c.execute("DELETE FROM bulletins WHERE unique_id = ?", (unique_id,))
+            add_tombstone(c, unique_id, 'bulletin', result[0])
+    if bbs_nodes and interface:
+        send_delete_bulletin_to_bbs_nodes(unique_id, bbs_nodes, interface)
 
 def add_mail(sender_id, sender_short_name, recipient_id, subject, content, bbs_nodes, interface, unique_id=None):
     conn = get_db_connection()
@@ -116,19 +220,32 @@ def add_mail(sender_id, sender_short_name, recipient_id, subject, content, bbs_n
     date = datetime.now().strftime('%Y-%m-%d %H:%M')
     if not unique_id:
         unique_id = str(uuid.uuid4())
-    c.execute("INSERT INTO mail (sender, sender_short_name, recipient, date, subject, content, unique_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
-              (sender_id, sender_short_name, recipient_id, date, subject, content, unique_id))
+    c.execute("INSERT INTO mail (sender, sender_short_name, recipient, date, subject, content, unique_id, sync_key) "
+              "VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(unique_id) DO NOTHING",
+              (sender_id, sender_short_name, recipient_id, date, subject, content, unique_id, sync_key(unique_id)))
     conn.commit()
+    if not c.rowcount:
+        logging.info(f"Mail with unique_id {unique_id} is already stored, not adding it again")
+        return unique_id
     if bbs_nodes and interface:
         send_mail_to_bbs_nodes(sender_id, sender_short_name, recipient_id, subject, content, unique_id, bbs_nodes, interface)
     return unique_id
 
-def get_mail(recipient_id):
+def get_mail(recipient_id, after_id=None, limit=None):
+    """Mail for a recipient in id order; pass the last id seen as after_id to fetch the next page."""
     conn = get_db_connection()
     c = conn.cursor()
-    c.execute("SELECT id, sender_short_name, subject, date, unique_id FROM mail WHERE recipient = ?", (recipient_id,))
+    c.execute("SELECT id, sender_short_name, subject, date, unique_id FROM mail WHERE recipient = ? AND id > ? "
+              "ORDER BY id LIMIT ?", (recipient_id, after_id or 0, -1 if limit is None else limit))
     return c.fetchall()
 
+
+def count_mail(recipient_id):
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute("SELECT COUNT(*) FROM mail WHERE recipient = ?", (recipient_id,))
+    return c.fetchone()[0]
+
 def get_mail_content(mail_id, recipient_id):
     # TODO: ensure only recipient can read mail
     conn = get_db_connection()
@@ -148,6 +265,8 @@ def delete_mail(unique_id, recipient_id, bbs_nodes, interface):
         recipient_id = result[0]
         logging.info(f"Attempting to delete mail with unique_id: {unique_id} by {recipient_id}")
         c.execute("DELETE FROM mail WHERE unique_id = ? and recipient = ?", (unique_id, recipient_id,))
+        if c.rowcount:
+            add_tombstone(c, unique_id, 'mail')
         conn.commit()
         send_delete_mail_to_bbs_nodes(unique_id, bbs_nodes, interface)
         logging.info(f"Mail with unique_id: {unique_id} deleted and sync message sent.")
@@ -164,3 +283,86 @@ def get_sender_id_by_mail_id(mail_id):
     if result:
         return result[0]
     return None
+
+
+def _key_range(prefix):
+    # Keys are lowercase hex, so every key starting with prefix sorts between prefix and prefix + 'g'
+    return prefix, prefix + 'g'
+
+
+def get_tombstone_keys(kind, board=None, prefix=''):
+    """(sync_key, unique_id) of deleted records: all deleted mail, or the bulletins deleted from one board."""
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute("SELECT sync_key, unique_id FROM tombstones "
+              "WHERE kind = ? AND board IS ? AND sync_key >= ? AND sync_key < ?", (kind, board, *_key_range(prefix)))
+    return c.fetchall()
+
+
+def prune_tombstones(retention_days):
+    """Forget deletions older than retention_days; returns how many tombstones were removed."""
+    cutoff = (datetime.now() - timedelta(days=retention_days)).strftime('%Y-%m-%d %H:%M')
+    conn = get_db_connection()
+    with conn:
+        c = conn.execute("DELETE FROM tombstones WHERE deleted_at < ?", (cutoff,))
+    return c.rowcount
+
+
+def get_bulletin_boards():
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute("SELECT DISTINCT board FROM bulletins")
+    return [row[0] for row in c.fetchall()]
+
+
+def get_bulletin_keys(board, prefix=''):
+    """(sync_key, unique_id) of the bulletins on a board whose key starts with prefix."""
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute("SELECT sync_key, unique_id FROM bulletins WHERE board = ? AND sync_key >= ? AND sync_key < ?",
+              (board, *_key_range(prefix)))
+    return c.fetchall()
+
+
+def get_mail_keys(prefix=''):
+    """(sync_key, unique_id) of the mail whose key starts with prefix."""
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute("SELECT sync_key, unique_id FROM mail WHERE sync_key >= ? AND sync_key < ?", _key_range(prefix))
+    return c.fetchall()
+
+
+def get_bulletin_by_unique_id(unique_id):
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute("SELECT board, sender_short_name, subject, content, unique_id FROM bulletins WHERE unique_id = ?",
+              (unique_id,))
+    return c.fetchone()
+
+
+def get_mail_by_unique_id(unique_id):
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute("SELECT sender, sender_short_name, recipient, subject, content, unique_id FROM mail WHERE unique_id = ?",
+              (unique_id,))
+    return c.fetchone()
+
+
+def save_session(user_id, state_json, updated_at):
+    conn = get_db_connection()
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO sessions (user_id, state, updated_at) VALUES (?, ?, ?)",
+                     (user_id, state_json, updated_at))
+
+
+def delete_session(user_id):
+    conn = get_db_connection()
+    with conn:
+        conn.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+
+
+def load_sessions():
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute("SELECT user_id, state, updated_at FROM sessions ORDER BY updated_at")
+    return c.fetchall()
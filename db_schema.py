@@ -0,0 +1,83 @@
+"""
+Schema migrations and tombstone writes shared by db_operations and the
+standalone db_admin tool. Only the standard library is imported here, so
+db_admin works without the radio stack.
+"""
+
+import hashlib
+import logging
+from datetime import datetime
+
+# Each entry upgrades the schema by one version (tracked in PRAGMA user_version).
+# Never edit an entry that has shipped; append a new one instead.
+SCHEMA_MIGRATIONS = [
+    # 1: indexes for the board/recipient/unique_id lookups. unique_id becomes
+    # UNIQUE so re-sent sync records can be ignored; existing duplicates are
+    # collapsed onto their oldest row first.
+    [
+        "DELETE FROM bulletins WHERE id NOT IN (SELECT MIN(id) FROM bulletins GROUP BY unique_id)",
+        "DELETE FROM mail WHERE id NOT IN (SELECT MIN(id) FROM mail GROUP BY unique_id)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_bulletins_unique_id ON bulletins (unique_id)",
+        "CREATE INDEX IF NOT EXISTS idx_bulletins_board ON bulletins (board)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_mail_unique_id ON mail (unique_id)",
+        "CREATE INDEX IF NOT EXISTS idx_mail_recipient ON mail (recipient)",
+    ],
+    # 2: remember deleted records so anti-entropy sync does not bring them back
+    [
+        """CREATE TABLE IF NOT EXISTS tombstones (
+                unique_id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                deleted_at TEXT NOT NULL
+            )""",
+    ],
+    # 3: persisted user sessions (see sessions.py)
+    [
+        """CREATE TABLE IF NOT EXISTS sessions (
+                user_id INTEGER PRIMARY KEY,
+                state TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )""",
+    ],
+    # 4: tombstones record the board of a deleted bulletin so anti-entropy only
+    # exchanges the tombstones of the scope being compared, and can be pruned by age
+    [
+        "ALTER TABLE tombstones ADD COLUMN board TEXT",
+        "CREATE INDEX IF NOT EXISTS idx_tombstones_scope ON tombstones (kind, board)",
+        "CREATE INDEX IF NOT EXISTS idx_tombstones_deleted_at ON tombstones (deleted_at)",
+    ],
+    # 5: store each record's anti-entropy key (see sync_key) so a digest or
+    # lookup reads one indexed key range instead of hashing the whole scope
+    [
+        "ALTER TABLE bulletins ADD COLUMN sync_key TEXT",
+        "ALTER TABLE mail ADD COLUMN sync_key TEXT",
+        "ALTER TABLE tombstones ADD COLUMN sync_key TEXT",
+        "UPDATE bulletins SET sync_key = sync_key(unique_id)",
+        "UPDATE mail SET sync_key = sync_key(unique_id)",
+        "UPDATE tombstones SET sync_key = sync_key(unique_id)",
+        "CREATE INDEX IF NOT EXISTS idx_bulletins_sync_key ON bulletins (board, sync_key)",
+        "CREATE INDEX IF NOT EXISTS idx_mail_sync_key ON mail (sync_key)",
+        "CREATE INDEX IF NOT EXISTS idx_tombstones_sync_key ON tombstones (kind, board, sync_key)",
+    ],
+]
+
+
+def sync_key(unique_id):
+    """The record's anti-entropy key as hex: the first 8 bytes of SHA-1 over its unique_id."""
+    return hashlib.sha1(unique_id.encode('utf-8')).hexdigest()[:16]
+
+
+def migrate_database(conn):
+    conn.create_function('sync_key', 1, sync_key, deterministic=True)
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for target, statements in enumerate(SCHEMA_MIGRATIONS[version:], start=version + 1):
+        with conn:
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {target}")
+        logging.info(f"Database schema migrated to version {target}")
+
+
+def add_tombstone(cursor, unique_id, kind, board=None):
+    cursor.execute("INSERT OR REPLACE INTO tombstones (unique_id, kind, board, deleted_at, sync_key) "
+                   "VALUES (?, ?, ?, ?, ?)",
+                   (unique_id, kind, board, datetime.now().strftime('%Y-%m-%d %H:%M'), sync_key(unique_id)))
@@ -0,0 +1,239 @@
+"""
+Fan-out transport for binary sync.
+
+Instead of sending every sync record once per peer, the record is broadcast
+once on the sync channel with the list of addressed peers in each frame.
+Every listed peer answers with an ACK carrying a bitmap of the fragments it
+holds; peers that are still missing fragments after `ack_timeout` get just
+those fragments again, unicast, up to `max_retries` times.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from meshtastic import BROADCAST_NUM
+
+from outbound import PRIORITY_SYNC, get_dispatcher
+from sync_protocol import SYNC_PORT_NUM, SyncProtocolError, decode_header, decode_peers, encode_record
+
+COMPLETED_CACHE_SIZE = 512
+
+
+def node_id_to_num(node_id):
+    return int(node_id.lstrip('!'), 16)
+
+
+def _encode_bitmap(indexes, count):
+    bitmap = bytearray((count + 7) // 8)
+    for index in indexes:
+        bitmap[index // 8] |= 1 << (index % 8)
+    return bytes(bitmap)
+
+
+def _decode_bitmap(bitmap, count):
+    return {index for index in range(count) if index // 8 < len(bitmap) and bitmap[index // 8] & (1 << (index % 8))}
+
+
+def send_ack(msg_id, count, indexes, peer, interface):
+    fields = [msg_id, count, _encode_bitmap(indexes, count)]
+    for frame in encode_record("ACK", fields, 'none'):
+        get_dispatcher().enqueue(frame, peer, interface, PRIORITY_SYNC, port_num=SYNC_PORT_NUM)
+
+
+class FanoutSender:
+    def __init__(self, config=None):
+        self.channel_index = 0
+        self.ack_timeout = 120.0
+        self.max_retries = 3
+        if config is not None:
+            self.channel_index = config.getint('sync', 'channel_index', fallback=self.channel_index)
+            self.ack_timeout = config.getfloat('sync', 'ack_timeout', fallback=self.ack_timeout)
+            self.max_retries = config.getint('sync', 'max_retries', fallback=self.max_retries)
+
+        self.pending = {}
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+
+        self.records = 0
+        self.frames_broadcast = 0
+        self.frames_retransmitted = 0
+        self.delivered = 0
+        self.failed = 0
+
+    def start(self):
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target=self._run, name='sync-fanout', daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=5):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def send(self, record_type, fields, bbs_nodes, interface):
+        frames = encode_record(record_type, fields, getattr(interface, 'sync_compression', 'zlib'),
+                               peers=[node_id_to_num(node_id) for node_id in bbs_nodes])
+        msg_id = decode_header(frames[0])[2]
+        with self.condition:
+            self.pending[msg_id] = {
+                'record_type': record_type,
+                'frames': frames,
+                'interface': interface,
+                'acked': {node_id: set() for node_id in bbs_nodes},
+                'retries': 0,
+                'deadline': time.monotonic() + self.ack_timeout,
+            }
+            self.records += 1
+            self.frames_broadcast += len(frames)
+            self.condition.notify()
+
+        dispatcher = get_dispatcher()
+        for frame in frames:
+            dispatcher.enqueue(frame, BROADCAST_NUM, interface, PRIORITY_SYNC, port_num=SYNC_PORT_NUM,
+                               channel_index=self.channel_index)
+
+    def handle_ack(self, fields, sender_node_id):
+        msg_id, count, bitmap = fields[0], int(fields[1]), fields[2]
+        with self.condition:
+            entry = self.pending.get(msg_id)
+            if entry is None or sender_node_id not in entry['acked'] or count != len(entry['frames']):
+                return
+            acked = entry['acked'][sender_node_id]
+            acked |= _decode_bitmap(bitmap, count)
+            if len(acked) == count:
+                del entry['acked'][sender_node_id]
+                self.delivered += 1
+                if not entry['acked']:
+                    del self.pending[msg_id]
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.running:
+                    now = time.monotonic()
+                    due = [msg_id for msg_id, entry in self.pending.items() if entry['deadline'] <= now]
+                    if due:
+                        break
+                    next_deadline = min((entry['deadline'] for entry in self.pending.values()), default=None)
+                    self.condition.wait(next_deadline - now if next_deadline is not None else None)
+                if not self.running:
+                    return
+                retransmits = self._collect_retransmits(due, now)
+            dispatcher = get_dispatcher()
+            for frame, node_id, interface in retransmits:
+                dispatcher.enqueue(frame, node_id, interface, PRIORITY_SYNC, port_num=SYNC_PORT_NUM)
+
+    def _collect_retransmits(self, due, now):
+        retransmits = []
+        for msg_id in due:
+            entry = self.pending[msg_id]
+            if entry['retries'] >= self.max_retries:
+                del self.pending[msg_id]
+                self.failed += len(entry['acked'])
+                logging.warning(f"SERVER SYNC: {entry['record_type']} record never acknowledged by "
+                                f"{', '.join(entry['acked'])}")
+                continue
+            entry['retries'] += 1
+            entry['deadline'] = now + self.ack_timeout * (entry['retries'] + 1)
+            for node_id, acked in entry['acked'].items():
+                for index, frame in enumerate(entry['frames']):
+                    if index not in acked:
+                        retransmits.append((frame, node_id, entry['interface']))
+        self.frames_retransmitted += len(retransmits)
+        return retransmits
+
+    def get_stats(self):
+        with self.condition:
+            return {
+                'pending': len(self.pending),
+                'records': self.records,
+                'frames_broadcast': self.frames_broadcast,
+                'frames_retransmitted': self.frames_retransmitted,
+                'delivered': self.delivered,
+                'failed': self.failed,
+            }
+
+
+class FanoutReceiver:
+    """
+    Feeds sync frames into a SyncReassembler, skipping fan-out frames that are
+    not addressed to this node and acknowledging the ones that are.
+    """
+
+    def __init__(self, reassembler):
+        self.reassembler = reassembler
+        self.completed = OrderedDict()
+        self.lock = threading.Lock()
+
+    def add_fragment(self, sender_node_id, frame, interface):
+        try:
+            peers = decode_peers(frame)
+            header = decode_header(frame) if peers is not None else None
+        except SyncProtocolError as e:
+            logging.warning(f"SERVER SYNC: Dropping malformed sync frame from {sender_node_id}: {e}")
+            return None
+        if peers is None:
+            return self.reassembler.add_fragment(sender_node_id, frame)
+        if interface.myInfo.my_node_num not in peers:
+            return None
+
+        _, _, msg_id, index, count, _ = header
+        key = (sender_node_id, msg_id)
+        with self.lock:
+            already_completed = key in self.completed
+        if already_completed:
+            # Our ACK was lost; the sender is retransmitting a record we already have.
+            send_ack(msg_id, count, range(count), sender_node_id, interface)
+            return None
+
+        record = self.reassembler.add_fragment(sender_node_id, frame)
+        if record is not None:
+            with self.lock:
+                self.completed[key] = True
+                if len(self.completed) > COMPLETED_CACHE_SIZE:
+                    self.completed.popitem(last=False)
+            send_ack(msg_id, count, range(count), sender_node_id, interface)
+        elif index == count - 1:
+            # End of the burst but fragments are missing: ask for just those.
+            send_ack(msg_id, count, self.reassembler.received_indexes(sender_node_id, msg_id), sender_node_id,
+                     interface)
+        return record
+
+
+_fanout_sender = None
+_fanout_sender_lock = threading.Lock()
+
+
+def start_fanout_sender(config=None):
+    global _fanout_sender
+    with _fanout_sender_lock:
+        if _fanout_sender is not None:
+            _fanout_sender.stop()
+        _fanout_sender = FanoutSender(config)
+        _fanout_sender.start()
+        return _fanout_sender
+
+
+def get_fanout_sender():
+    global _fanout_sender
+    with _fanout_sender_lock:
+        if _fanout_sender is None:
+            _fanout_sender = FanoutSender()
+            _fanout_sender.start()
+        return _fanout_sender
+
+
+def stop_fanout_sender():
+    global _fanout_sender
+    with _fanout_sender_lock:
+        if _fanout_sender is not None:
+            _fanout_sender.stop()
+            _fanout_sender = None
@@ -6,18 +6,18 @@ import meshtastic.tcp_interface
 import time
 from datetime import datetime
 from math import radians, sin, cos, sqrt, atan2
-from srtm import get_data
+from terrain import Terrain
 
-# Initialize SRTM data
-srtm_data = get_data()
+# Initialize SRTM data (memory-mapped tiles, see terrain.py)
+srtm_data = Terrain()
 
 def haversine_distance(lat1, lon1, lat2, lon2):
     R = 6371  # Earth's radius in kilometers
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
+    lat1, lon1, lat2, lon2 = map(np.radians, [lat1, lon1, lat2, lon2])
     dlat = lat2 - lat1
     dlon = lon2 - lon1
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1-a))
+    a = np.sin(dlat/2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2)**2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1-a))
     return R * c
 
 def get_node_data(host_ip):
@@ -93,18 +93,18 @@ def get_color_for_distance(distance):
 
 
 def line_of_sight(start_lat, start_lon, end_lat, end_lon, start_height=2):
-    # Get elevations
+    # Get elevations; end_lat/end_lon can be arrays, looked up in one call
     start_elev = srtm_data.get_elevation(start_lat, start_lon)
-    end_elev = srtm_data.get_elevation(end_lat, end_lon)
+    end_elev = srtm_data.get_elevations(end_lat, end_lon)
 
     # Calculate distance
     distance = haversine_distance(start_lat, start_lon, end_lat, end_lon)
 
-    # Check if end point is visible
-    if end_elev is None:
-        return False
+    # Nothing is visible from a point without elevation data
+    if start_elev is None:
+        return np.zeros(np.shape(end_elev), dtype=bool)
 
-    # Simple line of sight check
+    # Simple line of sight check (end points without data are NaN and never visible)
     elevation_difference = end_elev - (start_elev + start_height)
     angle = np.arctan2(elevation_difference, distance * 1000)  # Convert km to m
 
@@ -125,6 +125,9 @@ def create_dynamic_heatmap(data):
     try:
         fig = go.Figure()
 
+        # Map the tiles around all nodes once
+        srtm_data.preload_points([{'lat': lat, 'lon': lon} for lat, lon in zip(df['latitude'], df['longitude'])], margin_km=5)
+
         for index, node in df.iterrows():
             print(f"Processing node {index + 1}/{len(df)}")
             lats = []
@@ -132,14 +135,21 @@ def create_dynamic_heatmap(data):
             colors = []
             hover_texts = []
 
-            for radius in np.arange(0, 3.6, 0.2):
+            # Line of sight to every ring point at once
+            radii = np.arange(0, 3.6, 0.2)
+            angles = np.radians(np.arange(0, 360, 20))
+            ring_lats = node['latitude'] + (radii[:, None] / 111.32) * np.cos(angles)
+            ring_lons = node['longitude'] + (radii[:, None] / (111.32 * cos(radians(node['latitude'])))) * np.sin(angles)
+            visible = line_of_sight(node['latitude'], node['longitude'], ring_lats, ring_lons)
+
+            for r, radius in enumerate(radii):
                 color = get_color_for_distance(radius)
 
-                for angle in range(0, 360, 20):
-                    lat = node['latitude'] + (radius / 111.32) * cos(radians(angle))
-                    lon = node['longitude'] + (radius / (111.32 * cos(radians(node['latitude'])))) * sin(radians(angle))
+                for a in range(len(angles)):
+                    lat = ring_lats[r, a]
+                    lon = ring_lons[r, a]
                     
-                    if line_of_sight(node['latitude'], node['longitude'], lat, lon):
+                    if visible[r, a]:
                         lats.append(lat)
                         lons.append(lon)
                         colors.append(color)
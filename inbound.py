@@ -0,0 +1,184 @@
+import hashlib
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+from sync_protocol import SYNC_PORT_NAME
+from utils import send_message
+
+BUSY_REPLY_INTERVAL = 30
+
+
+class DuplicateFilter:
+    """
+    Remembers recently handled text packets so re-delivered copies are dropped.
+    A copy is a packet with the same (sender, packet id) within `id_window`
+    seconds. Matching on (sender, text) within `text_window` seconds is off
+    by default: users legitimately repeat commands such as "R" or "N".
+    """
+
+    def __init__(self, id_window=600.0, text_window=0.0, max_entries=4096):
+        self.id_window = id_window
+        self.text_window = text_window
+        self.max_entries = max_entries
+        self.expires = OrderedDict()
+
+    def is_duplicate(self, packet):
+        now = time.monotonic()
+        sender_id = packet.get('from')
+        keys = []
+        if packet.get('id') and self.id_window > 0:
+            keys.append((('id', sender_id, packet['id']), self.id_window))
+        payload = packet['decoded'].get('payload')
+        if payload and self.text_window > 0:
+            keys.append((('text', sender_id, hashlib.blake2b(payload, digest_size=8).digest()), self.text_window))
+
+        while self.expires and (next(iter(self.expires.values())) <= now or len(self.expires) > self.max_entries):
+            self.expires.popitem(last=False)
+        if any(self.expires.get(key, 0) > now for key, _ in keys):
+            return True
+        for key, window in keys:
+            self.expires[key] = now + window
+            self.expires.move_to_end(key)
+        return False
+
+
+class InboundDispatcher:
+    """
+    Worker pool for incoming text and sync packets.
+
+    Each sender is pinned to one worker queue, so a user's commands are
+    handled strictly in order (the session state machine depends on it)
+    while different users are served in parallel. When a worker queue is
+    full the packet is dropped and the sender gets a short "busy" reply.
+    """
+
+    def __init__(self, handler, config=None):
+        workers = 4
+        queue_size = 32
+        id_window = 600.0
+        text_window = 0.0
+        if config is not None:
+            workers = config.getint('inbound', 'workers', fallback=workers)
+            queue_size = config.getint('inbound', 'queue_size', fallback=queue_size)
+            id_window = config.getfloat('inbound', 'duplicate_id_window', fallback=id_window)
+            text_window = config.getfloat('inbound', 'duplicate_text_window', fallback=text_window)
+
+        self.handler = handler
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(max(workers, 1))]
+        self.threads = []
+        self.lock = threading.Lock()
+        self.last_busy_reply = {}
+        self.duplicate_filter = DuplicateFilter(id_window, text_window)
+
+        self.accepted = 0
+        self.rejected = 0
+        self.duplicates = 0
+        self.processed = 0
+        self.failed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.handler_total = 0.0
+        self.handler_max = 0.0
+
+    def start(self):
+        for index, work_queue in enumerate(self.queues):
+            thread = threading.Thread(target=self._run, args=(work_queue,), name=f'inbound-worker-{index}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self, timeout=5):
+        for work_queue in self.queues:
+            try:
+                work_queue.put_nowait(None)
+            except queue.Full:
+                pass
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads = []
+
+    def submit(self, packet, interface):
+        decoded = packet.get('decoded')
+        if not decoded or decoded.get('portnum') not in ('TEXT_MESSAGE_APP', SYNC_PORT_NAME):
+            return False
+
+        sender_id = packet.get('from')
+        if decoded['portnum'] == 'TEXT_MESSAGE_APP':
+            with self.lock:
+                duplicate = self.duplicate_filter.is_duplicate(packet)
+                self.duplicates += duplicate
+            if duplicate:
+                logging.info(f"Dropping duplicate message from {sender_id}")
+                return False
+
+        work_queue = self.queues[hash(sender_id) % len(self.queues)]
+        try:
+            work_queue.put_nowait((time.monotonic(), packet, interface))
+        except queue.Full:
+            with self.lock:
+                self.rejected += 1
+            logging.warning(f"Inbound queue full, dropping packet from {sender_id}")
+            self._send_busy_reply(packet, interface)
+            return False
+
+        with self.lock:
+            self.accepted += 1
+        return True
+
+    def _send_busy_reply(self, packet, interface):
+        # Sync traffic from peer BBS nodes and group chat never get a reply.
+        if packet.get('fromId') in interface.bbs_nodes:
+            return
+        if packet.get('to') != interface.myInfo.my_node_num:
+            return
+
+        sender_id = packet['from']
+        now = time.monotonic()
+        with self.lock:
+            if now - self.last_busy_reply.get(sender_id, -BUSY_REPLY_INTERVAL) < BUSY_REPLY_INTERVAL:
+                return
+            self.last_busy_reply[sender_id] = now
+        send_message("The BBS is busy right now. Please try again in a minute.", sender_id, interface)
+
+    def _run(self, work_queue):
+        while True:
+            entry = work_queue.get()
+            if entry is None:
+                return
+            enqueued_at, packet, interface = entry
+            started = time.monotonic()
+            try:
+                self.handler(packet, interface)
+                failed = False
+            except Exception as e:
+                failed = True
+                logging.error(f"Error handling packet from {packet.get('from')}: {e}")
+            finished = time.monotonic()
+
+            wait = started - enqueued_at
+            handling = finished - started
+            with self.lock:
+                self.processed += 1
+                self.failed += failed
+                self.wait_total += wait
+                self.wait_max = max(self.wait_max, wait)
+                self.handler_total += handling
+                self.handler_max = max(self.handler_max, handling)
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'workers': len(self.queues),
+                'queue_depth': sum(work_queue.qsize() for work_queue in self.queues),
+                'accepted': self.accepted,
+                'rejected': self.rejected,
+                'duplicates': self.duplicates,
+                'processed': self.processed,
+                'failed': self.failed,
+                'wait_avg': self.wait_total / self.processed if self.processed else 0.0,
+                'wait_max': self.wait_max,
+                'handler_avg': self.handler_total / self.processed if self.processed else 0.0,
+                'handler_max': self.handler_max,
+            }
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Checks los_engine against the original per-cell LOS loop and times both.
+
+The scalar reference below is the generate_los_map / line_of_sight code the
+LOS scripts used before los_engine. It runs at a small resolution (it needs
+about 100 SRTM lookups per cell); the vectorized per-cell map is computed at
+the same resolution and must match cell for cell. Then the viewshed
+algorithms (per-cell rays 'r3', the radial 'sweep' and 'r2') are timed at
+full resolution and compared with each other. --fresnel also checks
+radio_path's clearance map against the same reference and times it for
+each band.
+
+--synthetic builds generated terrain tiles in memory (with voids), so the
+check runs without downloading SRTM data.
+
+Usage: python3 los_benchmark.py [--lat 30.368449 --lon -98.0621764] [--synthetic]
+"""
+
+import argparse
+import math
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+import los_engine
+import radio_path
+import terrain
+
+
+def reference_line_of_sight(srtm_data, start_lat, start_lon, end_lat, end_lon, start_height, end_height):
+    start_elev = srtm_data.get_elevation(start_lat, start_lon)
+    end_elev = srtm_data.get_elevation(end_lat, end_lon)
+    if start_elev is None or end_elev is None:
+        return False
+    start_total_height = start_elev + start_height
+    end_total_height = end_elev + end_height
+    steps = 100
+    for i in range(steps + 1):
+        fraction = i / steps
+        inter_lat = start_lat + fraction * (end_lat - start_lat)
+        inter_lon = start_lon + fraction * (end_lon - start_lon)
+        inter_elev = srtm_data.get_elevation(inter_lat, inter_lon)
+        if inter_elev is None:
+            continue
+        los_height = start_total_height + fraction * (end_total_height - start_total_height)
+        if inter_elev > los_height:
+            return False
+    return True
+
+
+def reference_los_map(srtm_data, point1, radius_km, resolution):
+    los_map = np.zeros((resolution, resolution))
+    elevations = np.zeros((resolution, resolution))
+    center_lat, center_lon = point1['lat'], point1['lon']
+    for i in range(resolution):
+        for j in range(resolution):
+            angle = 2 * np.pi * i / resolution
+            distance = radius_km * (j / (resolution - 1)) ** 2
+            target_lat = center_lat + (distance / 111.32) * np.cos(angle)
+            target_lon = center_lon + (distance / (111.32 * np.cos(np.radians(center_lat)))) * np.sin(angle)
+            if los_engine.haversine_distance(point1['lat'], point1['lon'], target_lat, target_lon) <= radius_km:
+                elevation = srtm_data.get_elevation(target_lat, target_lon)
+                elevations[i, j] = elevation if elevation is not None else 0
+                if reference_line_of_sight(srtm_data, point1['lat'], point1['lon'], target_lat, target_lon,
+                                           point1['height'], 0):
+                    los_map[i, j] = 1
+    return los_map, elevations
+
+
+class SyntheticSRTM:
+    """Stands in for srtm.get_data(): generated hills and voids wrapped in SRTM.py's own GeoElevationFile."""
+
+    def __init__(self, side=1201, seed=1):
+        from srtm.data import GeoElevationFile
+        self.file_class = GeoElevationFile
+        self.side = side
+        self.seed = seed
+        self.files = {}
+
+    def get_file(self, latitude, longitude):
+        lat0, lon0 = math.floor(latitude), math.floor(longitude)
+        if (lat0, lon0) not in self.files:
+            rng = np.random.default_rng([self.seed, lat0 & 0xFFFF, lon0 & 0xFFFF])
+            y, x = np.mgrid[0:self.side, 0:self.side] / (self.side - 1)
+            lat, lon = lat0 + 1 - y, lon0 + x
+            terrain = (300 + 120 * np.sin(lat * 37) * np.cos(lon * 29) + 60 * np.sin(lat * 211 + lon * 173)
+                       + rng.normal(0, 4, y.shape))
+            terrain[rng.random(y.shape) < 0.002] = -32768
+            name = f"{'N' if lat0 >= 0 else 'S'}{abs(lat0):02d}{'E' if lon0 >= 0 else 'W'}{abs(lon0):03d}.hgt"
+            self.files[(lat0, lon0)] = self.file_class(name, terrain.astype('>i2').tobytes(), self)
+        return self.files[(lat0, lon0)]
+
+    def get_elevation(self, latitude, longitude):
+        return self.get_file(latitude, longitude).get_elevation(latitude, longitude)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LOS engine regression check and benchmark")
+    parser.add_argument("--lat", type=float, default=30.368449)
+    parser.add_argument("--lon", type=float, default=-98.0621764)
+    parser.add_argument("--height", type=float, default=2)
+    parser.add_argument("--radius-miles", type=float, default=10)
+    parser.add_argument("--check-resolution", type=int, default=60, help="Resolution of the scalar comparison")
+    parser.add_argument("--resolution", type=int, default=1500, help="Resolution of the timed vectorized map")
+    parser.add_argument("--algorithms", nargs="+", default=['r3', 'sweep', 'r2'],
+                        help="Viewshed algorithms to time; the first is the one the others are compared with")
+    parser.add_argument("--workers", type=int, default=1, help="Processes for the full-resolution maps")
+    parser.add_argument("--synthetic", action="store_true", help="Use generated terrain instead of SRTM downloads")
+    parser.add_argument("--fresnel", action="store_true", help="Also check and time radio_path.compute_fresnel_map")
+    args = parser.parse_args()
+
+    cache_dir = terrain.CACHE_DIR
+    if args.synthetic:
+        srtm_data = SyntheticSRTM()
+        # Keep generated tiles out of the real terrain cache
+        cache_dir = tempfile.mkdtemp(prefix='los-benchmark-')
+    else:
+        from srtm import get_data
+        srtm_data = get_data()
+    terrain_data = terrain.Terrain(cache_dir, srtm_data)
+    try:
+        run(args, srtm_data, terrain_data)
+    finally:
+        if args.synthetic:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def run(args, srtm_data, terrain_data):
+    point1 = {'lat': args.lat, 'lon': args.lon, 'height': args.height}
+    radius_km = args.radius_miles * 1.60934
+
+    started = time.perf_counter()
+    expected_map, expected_elevations = reference_los_map(srtm_data, point1, radius_km, args.check_resolution)
+    scalar_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    los_map, elevations = los_engine.compute_los_map(terrain_data, [point1], args.lat, args.lon, radius_km,
+                                                     args.check_resolution)
+    vector_time = time.perf_counter() - started
+
+    mismatches = int(np.sum(los_map != expected_map))
+    elevation_mismatches = int(np.sum(elevations != expected_elevations))
+    cells = args.check_resolution ** 2
+    print(f"{args.check_resolution}x{args.check_resolution}: scalar {scalar_time:.2f}s, vectorized {vector_time:.3f}s, "
+          f"{mismatches} LOS and {elevation_mismatches} elevation mismatches of {cells} cells")
+
+    estimated_scalar = scalar_time / cells * args.resolution ** 2
+    print(f"{args.resolution}x{args.resolution}: scalar estimated {estimated_scalar / 60:.1f} min")
+    per_cell = None
+    for algorithm in args.algorithms:
+        started = time.perf_counter()
+        los_map, _ = los_engine.compute_viewshed(terrain_data, point1, radius_km, args.resolution, algorithm=algorithm,
+                                                 workers=args.workers)
+        elapsed = time.perf_counter() - started
+        if per_cell is None:
+            per_cell = los_map
+        print(f"{args.resolution}x{args.resolution} {algorithm}: {elapsed:.2f}s, {int(los_map.sum())} visible cells, "
+              f"{np.mean(los_map == per_cell) * 100:.2f}% agree with {args.algorithms[0]}")
+    fresnel_mismatches = 0
+    if args.fresnel:
+        # Without curvature, clearance >= 0 is exactly the per-cell line of sight
+        ratios, _ = radio_path.compute_fresnel_map(terrain_data, point1, radius_km, args.check_resolution,
+                                                   k_factor=np.inf)
+        fresnel_mismatches = int(np.sum((ratios >= 0) != (expected_map == 1)))
+        print(f"{args.check_resolution}x{args.check_resolution} fresnel without curvature: "
+              f"{fresnel_mismatches} LOS mismatches")
+        for frequency in radio_path.FREQUENCIES_MHZ:
+            started = time.perf_counter()
+            ratios, _ = radio_path.compute_fresnel_map(terrain_data, point1, radius_km, args.resolution,
+                                                       frequency=frequency, workers=args.workers)
+            elapsed = time.perf_counter() - started
+            print(f"{args.resolution}x{args.resolution} fresnel {frequency}: {elapsed:.2f}s, "
+                  f"{int(np.sum(ratios >= 0))} cells in LOS with curvature, "
+                  f"{int(np.sum(ratios >= radio_path.REQUIRED_CLEARANCE))} with 60% of the Fresnel zone clear")
+    if mismatches or elevation_mismatches or fresnel_mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
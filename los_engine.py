@@ -0,0 +1,294 @@
+"""
+Vectorized terrain line-of-sight for the LOS map scripts.
+
+The terrain around the area is loaded once as a NumPy raster (an
+ElevationGrid from terrain.py) and every ray of a map is sampled with array
+operations instead of one srtm_data.get_elevation call per sample. The
+terrain source can be a terrain.Terrain or a plain SRTM.py
+GeoElevationData. With the default nearest lookup the grid reproduces
+SRTM.py exactly (same row/column floor, same valid range), so
+compute_los_map matches the original per-cell loops.
+
+compute_viewshed is what the scripts use for a map around one observer: a
+single outward sweep per azimuth instead of an independent ray per cell.
+Both split the map into sectors of azimuths, which can run in a process pool
+(workers=...). See los_benchmark.py for the regression check and timings.
+"""
+
+import numpy as np
+
+from terrain import ElevationGrid, grid_for
+
+CHUNK_RAYS = 8192
+STEPS = 100
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    R = 6371  # Earth's radius in kilometers
+    lat1, lon1, lat2, lon2 = map(np.radians, [lat1, lon1, lat2, lon2])
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = np.sin(dlat/2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2)**2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1-a))
+    return R * c
+
+
+def polar_distances(radius_km, resolution, spacing='quadratic'):
+    """Distance (km) of each column of the polar grid, spaced quadratically (finer near the centre) or linearly."""
+    j = np.arange(resolution)
+    if spacing == 'quadratic':
+        return radius_km * (j / (resolution - 1)) ** 2
+    if spacing == 'linear':
+        return radius_km * j / (resolution - 1)
+    raise ValueError(f"Unknown spacing {spacing}")
+
+
+def polar_targets(center_lat, center_lon, radius_km, resolution, spacing='quadratic', rows=slice(None)):
+    """
+    Cell centres of the scripts' polar grid: row i is the azimuth
+    2*pi*i/resolution, column j the distance. rows selects a sector of azimuths.
+    """
+    i = np.arange(resolution)[rows].reshape(-1, 1)
+    angle = 2 * np.pi * i / resolution
+    distance = polar_distances(radius_km, resolution, spacing).reshape(1, -1)
+    target_lat = center_lat + (distance / 111.32) * np.cos(angle)
+    target_lon = center_lon + (distance / (111.32 * np.cos(np.radians(center_lat)))) * np.sin(angle)
+    return target_lat, target_lon
+
+
+def line_of_sight_many(grid, start_lat, start_lon, end_lats, end_lons, start_height, end_height=0, steps=STEPS,
+                       include_endpoints=True, method='nearest'):
+    """
+    Visibility from one observer to many targets: a target is hidden when any
+    of the `steps` samples along the straight lat/lon line rises above the
+    straight line between the two antenna heights. Samples over voids are
+    skipped; a void at either end means not visible.
+    """
+    end_lats = np.asarray(end_lats, dtype=np.float64).ravel()
+    end_lons = np.asarray(end_lons, dtype=np.float64).ravel()
+    visible = np.zeros(end_lats.shape, dtype=bool)
+    start_elev = grid.elevations(np.array([start_lat]), np.array([start_lon]), method)[0]
+    if np.isnan(start_elev):
+        return visible
+    fractions = (np.arange(steps + 1) if include_endpoints else np.arange(1, steps)) / steps
+    start_total_height = start_elev + start_height
+
+    for begin in range(0, end_lats.size, CHUNK_RAYS):
+        chunk = slice(begin, begin + CHUNK_RAYS)
+        lats, lons = end_lats[chunk], end_lons[chunk]
+        end_elev = grid.elevations(lats, lons, method)
+        end_total_height = end_elev + end_height
+        inter_lat = start_lat + fractions * (lats[:, None] - start_lat)
+        inter_lon = start_lon + fractions * (lons[:, None] - start_lon)
+        inter_elev = grid.elevations(inter_lat, inter_lon, method)
+        los_height = start_total_height + fractions * (end_total_height - start_total_height)[:, None]
+        # NaN samples compare False, which skips voids like the scalar loop did
+        blocked = (inter_elev > los_height).any(axis=1)
+        visible[chunk] = ~np.isnan(end_elev) & ~blocked
+    return visible
+
+
+def line_of_sight(grid, start_lat, start_lon, end_lat, end_lon, start_height, end_height, **kwargs):
+    return bool(line_of_sight_many(grid, start_lat, start_lon, [end_lat], [end_lon], start_height, end_height,
+                                   **kwargs)[0])
+
+
+def _grid_for(srtm_data, center_lat, center_lon, radius_km, resolution, spacing, observers):
+    target_lat, target_lon = polar_targets(center_lat, center_lon, radius_km, resolution, spacing)
+    lats = [target_lat.min(), target_lat.max()] + [observer['lat'] for observer in observers]
+    lons = [target_lon.min(), target_lon.max()] + [observer['lon'] for observer in observers]
+    return grid_for(srtm_data, min(lats), min(lons), max(lats), max(lons))
+
+
+def _sector_cells(grid, center_lat, center_lon, radius_km, resolution, spacing, clip_to_radius, method, rows):
+    """Targets, in-radius mask and plotted elevations (0 for voids and outside the radius) of a sector."""
+    target_lat, target_lon = polar_targets(center_lat, center_lon, radius_km, resolution, spacing, rows)
+    if clip_to_radius:
+        inside = haversine_distance(center_lat, center_lon, target_lat, target_lon) <= radius_km
+    else:
+        inside = np.ones(target_lat.shape, dtype=bool)
+    elevations = np.nan_to_num(grid.elevations(target_lat, target_lon, method), nan=0.0)
+    elevations[~inside] = 0
+    return target_lat, target_lon, inside, elevations
+
+
+def los_map_rows(grid, rows, observers, center_lat, center_lon, radius_km, resolution, spacing='quadratic',
+                 clip_to_radius=True, steps=STEPS, include_endpoints=True, method='nearest'):
+    """LOS and elevation rows of compute_los_map for the azimuths in `rows`."""
+    target_lat, target_lon, inside, elevations = _sector_cells(grid, center_lat, center_lon, radius_km, resolution,
+                                                               spacing, clip_to_radius, method, rows)
+    visible = np.zeros(inside.shape, dtype=bool)
+    for observer in observers:
+        visible[inside] |= line_of_sight_many(grid, observer['lat'], observer['lon'], target_lat[inside],
+                                              target_lon[inside], observer['height'], 0, steps, include_endpoints,
+                                              method)
+    return visible.astype(np.float64), elevations
+
+
+def _previous_max(slopes):
+    """Running maximum of the slopes strictly before each column, -inf for the first."""
+    running = np.maximum.accumulate(slopes, axis=1)
+    previous = np.empty_like(running)
+    previous[:, 0] = -np.inf
+    previous[:, 1:] = running[:, :-1]
+    return previous
+
+
+def viewshed_rows(grid, rows, observer, radius_km, resolution, spacing='quadratic', clip_to_radius=True,
+                  algorithm='sweep', profile_spacing_m=None, method='nearest'):
+    """LOS and elevation rows of compute_viewshed ('sweep' or 'r2') for the azimuths in `rows`."""
+    center_lat, center_lon = observer['lat'], observer['lon']
+    target_lat, target_lon, inside, elevations = _sector_cells(grid, center_lat, center_lon, radius_km, resolution,
+                                                               spacing, clip_to_radius, method, rows)
+    los_rows = np.zeros(inside.shape)
+    observer_elev = grid.elevations(np.array([center_lat]), np.array([center_lon]), method)[0]
+    if np.isnan(observer_elev):
+        return los_rows, elevations
+    observer_height = observer_elev + observer['height']
+    distances = polar_distances(radius_km, resolution, spacing)
+
+    cell_elev = grid.elevations(target_lat, target_lon, method)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cell_slope = (cell_elev - observer_height) / distances
+    blocking = np.where(np.isnan(cell_slope), -np.inf, cell_slope)
+    blocking[:, 0] = -np.inf
+    previous = _previous_max(blocking)
+    if algorithm == 'r2':
+        spacing_m = profile_spacing_m or 111320.0 / (grid.side - 1)
+        samples = max(2, int(np.ceil(radius_km * 1000 / spacing_m)) + 1)
+        profile_distances = np.linspace(0, radius_km, samples)[1:]
+        # Profile samples strictly nearer than each cell (the observer's own sample excluded)
+        nearer = np.searchsorted(profile_distances, distances, side='left')
+        angle = 2 * np.pi * np.arange(resolution)[rows] / resolution
+        profile_lat = center_lat + (profile_distances / 111.32) * np.cos(angle)[:, None]
+        profile_lon = center_lon + (profile_distances / (111.32 * np.cos(np.radians(center_lat)))) * \
+            np.sin(angle)[:, None]
+        profile_elev = grid.elevations(profile_lat, profile_lon, 'bilinear')
+        profile_slope = (profile_elev - observer_height) / profile_distances
+        running = np.maximum.accumulate(np.where(np.isnan(profile_slope), -np.inf, profile_slope), axis=1)
+        running = np.concatenate([np.full((running.shape[0], 1), -np.inf), running], axis=1)
+        previous = np.maximum(previous, running[:, nearer])
+    elif algorithm != 'sweep':
+        raise ValueError(f"Unknown viewshed algorithm {algorithm}")
+
+    visible = ~np.isnan(cell_elev) & ~(previous > cell_slope)
+    # The observer's own cell is visible whenever it has ground data
+    visible[:, 0] = ~np.isnan(cell_elev[:, 0])
+    los_rows[visible & inside] = 1
+    return los_rows, elevations
+
+
+# Set in each worker process by _attach_shared
+_shared = {}
+
+
+def _attach_shared(grid_name, grid_shape, grid_dtype, bounds, los_name, elevations_name, shape):
+    from multiprocessing import shared_memory
+    _shared['blocks'] = [shared_memory.SharedMemory(name=name) for name in (grid_name, los_name, elevations_name)]
+    grid_block, los_block, elevations_block = _shared['blocks']
+    data = np.ndarray(grid_shape, dtype=grid_dtype, buffer=grid_block.buf)
+    _shared['grid'] = ElevationGrid(data, *bounds)
+    _shared['los_map'] = np.ndarray(shape, dtype=np.float64, buffer=los_block.buf)
+    _shared['elevations'] = np.ndarray(shape, dtype=np.float64, buffer=elevations_block.buf)
+
+
+def _run_sector(row_function, begin, end, kwargs):
+    rows = slice(begin, end)
+    los_rows, elevation_rows = row_function(_shared['grid'], rows, **kwargs)
+    _shared['los_map'][rows] = los_rows
+    _shared['elevations'][rows] = elevation_rows
+    return los_rows.size
+
+
+def _run_map(row_function, grid, kwargs, rows_per_sector, workers, progress, shape=None):
+    """
+    Computes every sector of azimuth rows and stitches them into the map
+    (resolution x resolution unless shape is given). With workers > 1
+    sectors run in a process pool; the elevation raster and the output
+    arrays live in shared memory, so only sector bounds cross the process
+    boundary.
+    """
+    shape = shape or (kwargs['resolution'], kwargs['resolution'])
+    rows, columns = shape
+    sectors = [(begin, min(begin + rows_per_sector, rows)) for begin in range(0, rows, rows_per_sector)]
+    if not workers or workers <= 1:
+        los_map = np.zeros(shape)
+        elevations = np.zeros(shape)
+        for begin, end in sectors:
+            los_map[begin:end], elevations[begin:end] = row_function(grid, slice(begin, end), **kwargs)
+            if progress is not None:
+                progress((end - begin) * columns)
+        return los_map, elevations
+
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    from multiprocessing import shared_memory
+
+    output_size = rows * columns * np.dtype(np.float64).itemsize
+    blocks = []
+    try:
+        grid_block = shared_memory.SharedMemory(create=True, size=grid.data.nbytes)
+        blocks.append(grid_block)
+        np.ndarray(grid.data.shape, dtype=grid.data.dtype, buffer=grid_block.buf)[:] = grid.data
+        for _ in range(2):
+            blocks.append(shared_memory.SharedMemory(create=True, size=output_size))
+        initargs = (grid_block.name, grid.data.shape, grid.data.dtype.str, grid.bounds, blocks[1].name, blocks[2].name,
+                    shape)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach_shared, initargs=initargs) as executor:
+            futures = [executor.submit(_run_sector, row_function, begin, end, kwargs) for begin, end in sectors]
+            for future in as_completed(futures):
+                cells = future.result()
+                if progress is not None:
+                    progress(cells)
+        los_map = np.ndarray(shape, dtype=np.float64, buffer=blocks[1].buf).copy()
+        elevations = np.ndarray(shape, dtype=np.float64, buffer=blocks[2].buf).copy()
+        return los_map, elevations
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+
+def compute_los_map(srtm_data, observers, center_lat, center_lon, radius_km, resolution, spacing='quadratic',
+                    clip_to_radius=True, steps=STEPS, include_endpoints=True, method='nearest', grid=None,
+                    progress=None, workers=1):
+    """
+    Builds the (resolution x resolution) polar LOS map the scripts plot: 1
+    where any observer ({'lat', 'lon', 'height'}) sees the ground, plus the
+    ground elevation of every cell (0 for voids and cells outside the radius).
+
+    progress, if given, is called with the number of cells finished; workers
+    > 1 spreads sectors of azimuths over that many processes.
+    """
+    grid = grid or _grid_for(srtm_data, center_lat, center_lon, radius_km, resolution, spacing, observers)
+    kwargs = dict(observers=observers, center_lat=center_lat, center_lon=center_lon, radius_km=radius_km,
+                  resolution=resolution, spacing=spacing, clip_to_radius=clip_to_radius, steps=steps,
+                  include_endpoints=include_endpoints, method=method)
+    return _run_map(los_map_rows, grid, kwargs, max(1, CHUNK_RAYS // resolution), workers, progress)
+
+
+def compute_viewshed(srtm_data, observer, radius_km, resolution, spacing='quadratic', clip_to_radius=True,
+                     algorithm='sweep', profile_spacing_m=None, method='nearest', grid=None, progress=None,
+                     workers=1):
+    """
+    The same map as compute_los_map for an observer at the centre of the
+    polar grid, from one outward pass per azimuth: a cell is visible unless a
+    point nearer the observer on the same azimuth has a steeper elevation
+    angle (terrain above the line from the antenna to the cell's ground).
+    That is O(R^2) instead of the O(R^2 * steps) of a ray per cell.
+
+    algorithm picks where the blocking terrain is sampled:
+    - 'sweep': the grid's own cells along the azimuth (default),
+    - 'r2': those cells plus a bilinear profile along the azimuth at DEM
+      spacing (or profile_spacing_m), so terrain between the sparse outer
+      cells of a quadratic grid is not skipped,
+    - 'r3': a separate 100-sample ray per cell, i.e. compute_los_map.
+    """
+    if algorithm == 'r3':
+        return compute_los_map(srtm_data, [observer], observer['lat'], observer['lon'], radius_km, resolution,
+                               spacing, clip_to_radius, method=method, grid=grid, progress=progress, workers=workers)
+    if algorithm not in ('sweep', 'r2'):
+        raise ValueError(f"Unknown viewshed algorithm {algorithm}")
+    grid = grid or _grid_for(srtm_data, observer['lat'], observer['lon'], radius_km, resolution, spacing, [observer])
+    kwargs = dict(observer=observer, radius_km=radius_km, resolution=resolution, spacing=spacing,
+                  clip_to_radius=clip_to_radius, algorithm=algorithm, profile_spacing_m=profile_spacing_m,
+                  method=method)
+    return _run_map(viewshed_rows, grid, kwargs, max(1, CHUNK_RAYS * 8 // resolution), workers, progress)
@@ -0,0 +1,177 @@
+import logging
+import threading
+import time
+from collections import Counter, deque
+
+from pubsub import pub
+
+HOP_WINDOW = 20
+SNR_ALPHA = 0.25
+
+_topology_lock = threading.Lock()
+
+
+def node_num_to_id(node_num):
+    return f"!{node_num & 0xFFFFFFFF:08x}"
+
+
+def packet_hops(packet):
+    """
+    Hops a packet travelled, from its header: hopStart - hopLimit. The packet
+    dicts drop zero-valued fields, so a missing hopLimit means it arrived with
+    none left; a missing hopStart means old firmware that does not send it.
+    """
+    hop_start = packet.get('hopStart')
+    if not hop_start:
+        return None
+    hops = hop_start - (packet.get('hopLimit') or 0)
+    return hops if hops >= 0 else None
+
+
+class HopHistory:
+    """The last HOP_WINDOW hop counts seen from one node, with a running Counter over them."""
+
+    def __init__(self, window=HOP_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.counts = Counter()
+        self.last = None
+        self.updated = 0
+
+    def add(self, hops, now):
+        if len(self.samples) == self.samples.maxlen:
+            oldest = self.samples[0]
+            self.counts[oldest] -= 1
+            if not self.counts[oldest]:
+                del self.counts[oldest]
+        self.samples.append(hops)
+        self.counts[hops] += 1
+        self.last = hops
+        self.updated = now
+
+    def typical(self):
+        # At most hop_limit + 1 (<= 8) distinct values, so this is constant time
+        return min(self.counts.items(), key=lambda item: (-item[1], item[0]))[0] if self.counts else None
+
+
+class MeshTopology:
+    """
+    Hop counts and neighbours as seen by the local node.
+
+    Every packet with hop header fields adds a sample to its sender's rolling
+    hop distribution. Packets received directly (0 hops) add an edge between
+    the local node and the sender, and NEIGHBORINFO packets add the edges other
+    nodes report; each edge keeps an exponentially weighted moving average of
+    its SNR. All queries are dictionary lookups.
+    """
+
+    def __init__(self, local_id=None, window=HOP_WINDOW, alpha=SNR_ALPHA):
+        self.local_id = local_id
+        self.window = window
+        self.alpha = alpha
+        self.lock = threading.Lock()
+        self.hops = {}
+        self.edges = {}
+        self.packets = 0
+
+    def _set_local_id(self, interface):
+        my_info = getattr(interface, 'myInfo', None)
+        node_num = getattr(my_info, 'my_node_num', None)
+        if node_num:
+            self.local_id = node_num_to_id(node_num)
+
+    def _add_edge(self, a, b, snr, now):
+        for x, y in ((a, b), (b, a)):
+            edge = self.edges.setdefault(x, {}).get(y)
+            if edge is None:
+                self.edges[x][y] = edge = {'snr': snr, 'count': 0, 'last_seen': now}
+            elif snr is not None:
+                edge['snr'] = snr if edge['snr'] is None else edge['snr'] + self.alpha * (snr - edge['snr'])
+            edge['count'] += 1
+            edge['last_seen'] = now
+
+    def observe(self, packet, interface=None, now=None):
+        """Records one received packet; returns its hop count, or None if the header does not carry it."""
+        from_id = packet.get('fromId')
+        if from_id is None:
+            return None
+        now = now if now is not None else time.time()
+        if self.local_id is None and interface is not None:
+            self._set_local_id(interface)
+        hops = packet_hops(packet)
+        neighbour_info = (packet.get('decoded') or {}).get('neighborinfo')
+        with self.lock:
+            self.packets += 1
+            if hops is not None:
+                history = self.hops.get(from_id)
+                if history is None:
+                    history = self.hops[from_id] = HopHistory(self.window)
+                history.add(hops, now)
+                if hops == 0 and self.local_id is not None and from_id != self.local_id:
+                    self._add_edge(self.local_id, from_id, packet.get('rxSnr'), now)
+            if neighbour_info and neighbour_info.get('nodeId'):
+                reporter = node_num_to_id(neighbour_info['nodeId'])
+                for neighbour in neighbour_info.get('neighbors', []):
+                    if neighbour.get('nodeId'):
+                        self._add_edge(reporter, node_num_to_id(neighbour['nodeId']), neighbour.get('snr'), now)
+        return hops
+
+    def hops_to(self, node_id):
+        """Most common hop count in the node's recent packets, or None if never measured."""
+        with self.lock:
+            history = self.hops.get(node_id)
+            return history.typical() if history is not None else None
+
+    def last_hops(self, node_id):
+        with self.lock:
+            history = self.hops.get(node_id)
+            return history.last if history is not None else None
+
+    def hop_distribution(self, node_id):
+        with self.lock:
+            history = self.hops.get(node_id)
+            return dict(history.counts) if history is not None else {}
+
+    def neighbours(self, node_id):
+        """{neighbour_id: smoothed SNR} for the node's known direct links."""
+        with self.lock:
+            return {neighbour: edge['snr'] for neighbour, edge in self.edges.get(node_id, {}).items()}
+
+    def edge_snr(self, a, b):
+        with self.lock:
+            edge = self.edges.get(a, {}).get(b)
+            return edge['snr'] if edge is not None else None
+
+    def get_stats(self):
+        with self.lock:
+            distribution = Counter(history.typical() for history in self.hops.values())
+            return {
+                'local_id': self.local_id,
+                'packets': self.packets,
+                'nodes_with_hops': len(self.hops),
+                'direct_neighbours': len(self.edges.get(self.local_id, {})),
+                'edges': sum(len(neighbours) for neighbours in self.edges.values()) // 2,
+                'hops': {str(hops): count for hops, count in sorted(distribution.items())},
+            }
+
+
+def get_mesh_topology(interface):
+    topology = getattr(interface, 'mesh_topology', None)
+    if topology is None:
+        with _topology_lock:
+            topology = getattr(interface, 'mesh_topology', None)
+            if topology is None:
+                topology = MeshTopology()
+                interface.mesh_topology = topology
+    return topology
+
+
+def _on_receive(packet, interface):
+    topology = getattr(interface, 'mesh_topology', None)
+    if topology is not None:
+        try:
+            topology.observe(packet, interface)
+        except Exception as e:
+            logging.error(f"Error updating mesh topology for {packet.get('fromId')}: {e}")
+
+
+pub.subscribe(_on_receive, "meshtastic.receive")
@@ -1,7 +1,6 @@
 import logging
 
-from meshtastic import BROADCAST_NUM
-
+from anti_entropy import handle_digest, handle_ids, handle_want
 from command_handlers import (
     handle_mail_command, handle_bulletin_command, handle_help_command, handle_stats_command, handle_fortune_command,
     handle_bb_steps, handle_mail_steps, handle_stats_steps, handle_wall_of_shame_command,
@@ -10,10 +9,16 @@ from command_handlers import (
     handle_check_bulletin_command, handle_read_bulletin_command, handle_read_channel_command,
     handle_post_channel_command, handle_list_channels_command, handle_quick_help_command
 )
-from db_operations import add_bulletin, add_mail, delete_bulletin, delete_mail, get_db_connection, add_channel
+from command_router import router
+from db_operations import delete_bulletin_by_unique_id, delete_mail, get_db_connection, add_channel
+from fanout import FanoutReceiver, get_fanout_sender
 from js8call_integration import handle_js8call_command, handle_js8call_steps, handle_group_message_selection
+from sync_ingest import get_sync_ingest
+from sync_protocol import SYNC_PORT_NAME, SyncReassembler
 from utils import get_user_state, get_node_short_name, get_node_id_from_num, send_message
 
+sync_receiver = FanoutReceiver(SyncReassembler())
+
 main_menu_handlers = {
     "q": handle_quick_help_command,
     "b": lambda sender_id, interface: handle_help_command(sender_id, interface, 'bbs'),
@@ -53,125 +58,95 @@ board_action_handlers = {
     "x": handle_help_command
 }
 
-def process_message(sender_id, message, interface, is_sync_message=False):
-    state = get_user_state(sender_id)
-    message_lower = message.lower().strip()
-    bbs_nodes = interface.bbs_nodes
+router.add_menu('main', main_menu_handlers)
+router.add_menu('bbs', bbs_menu_handlers)
+router.add_menu('utilities', utilities_menu_handlers)
+router.add_menu('bulletin', bulletin_menu_handlers)
+router.add_menu('board_action', board_action_handlers, with_state=True)
+router.add_state_menu('MENU', lambda state: state['menu'])
+router.add_state_menu('BULLETIN_MENU', 'bulletin')
+router.add_state_menu('BULLETIN_ACTION', 'board_action')
+router.set_default(lambda sender_id, message, state, interface: handle_help_command(sender_id, interface))
+
+router.add_quick_command("sm,,", lambda sender_id, message, state, interface: handle_send_mail_command(
+    sender_id, message.lower().strip(), interface, interface.bbs_nodes))
+router.add_quick_command("cm", lambda sender_id, message, state, interface: handle_check_mail_command(sender_id, interface))
+router.add_quick_command("pb,,", lambda sender_id, message, state, interface: handle_post_bulletin_command(
+    sender_id, message.lower().strip(), interface, interface.bbs_nodes))
+router.add_quick_command("cb,,", lambda sender_id, message, state, interface: handle_check_bulletin_command(
+    sender_id, message.lower().strip(), interface))
+router.add_quick_command("chp,,", lambda sender_id, message, state, interface: handle_post_channel_command(
+    sender_id, message.lower().strip(), interface))
+router.add_quick_command("chl", lambda sender_id, message, state, interface: handle_list_channels_command(sender_id, interface))
+
+router.add_step('JS8CALL_MENU', lambda sender_id, message, state, interface: handle_js8call_steps(
+    sender_id, message, state['step'], interface, state), exclusive=True)
+router.add_step('GROUP_MESSAGES', lambda sender_id, message, state, interface: handle_group_message_selection(
+    sender_id, message, state['step'], state, interface), exclusive=True)
+router.add_step('MAIL', lambda sender_id, message, state, interface: handle_mail_steps(
+    sender_id, message, state['step'], state, interface, interface.bbs_nodes))
+router.add_step('BULLETIN', lambda sender_id, message, state, interface: handle_bb_steps(
+    sender_id, message, state['step'], state, interface, interface.bbs_nodes))
+router.add_step('STATS', lambda sender_id, message, state, interface: handle_stats_steps(
+    sender_id, message, state['step'], interface))
+router.add_step('CHANNEL_DIRECTORY', lambda sender_id, message, state, interface: handle_channel_directory_steps(
+    sender_id, message, state['step'], state, interface))
+router.add_step('CHECK_MAIL', lambda sender_id, message, state, interface: handle_read_mail_command(
+    sender_id, message, state, interface), step=1)
+router.add_step('CHECK_MAIL', lambda sender_id, message, state, interface: handle_delete_mail_confirmation(
+    sender_id, message, state, interface, interface.bbs_nodes), step=2)
+router.add_step('CHECK_BULLETIN', lambda sender_id, message, state, interface: handle_read_bulletin_command(
+    sender_id, message, state, interface), step=1)
+router.add_step('CHECK_CHANNEL', lambda sender_id, message, state, interface: handle_read_channel_command(
+    sender_id, message, state, interface), step=1)
+router.add_step('LIST_CHANNELS', lambda sender_id, message, state, interface: handle_read_channel_command(
+    sender_id, message, state, interface), step=1)
+router.add_step('BULLETIN_POST', lambda sender_id, message, state, interface: handle_bb_steps(
+    sender_id, message, 4, state, interface, interface.bbs_nodes))
+router.add_step('BULLETIN_POST_CONTENT', lambda sender_id, message, state, interface: handle_bb_steps(
+    sender_id, message, 5, state, interface, interface.bbs_nodes))
+router.add_step('BULLETIN_READ', lambda sender_id, message, state, interface: handle_bb_steps(
+    sender_id, message, 3, state, interface, interface.bbs_nodes))
+
+
+def process_sync_record(record_type, fields, interface, sender_node_id=None):
+    if record_type in ("BULLETIN", "BACKFILL_BULLETIN"):
+        board, sender_short_name, subject, content, unique_id = fields[:5]
+        # Bulletins caught up on by anti-entropy are old news, only live posts raise the urgent alert
+        get_sync_ingest().add_bulletin(board, sender_short_name, subject, content, unique_id, interface,
+                                       notify=record_type == "BULLETIN")
+    elif record_type == "MAIL":
+        sender_id, sender_short_name, recipient_id, subject, content, unique_id = fields[:6]
+        get_sync_ingest().add_mail(sender_id, sender_short_name, recipient_id, subject, content, unique_id, interface)
+    elif record_type == "DELETE_BULLETIN":
+        unique_id = fields[0]
+        get_sync_ingest().flush()
+        delete_bulletin_by_unique_id(unique_id, [], interface)
+    elif record_type == "DELETE_MAIL":
+        unique_id = fields[0]
+        logging.info(f"Processing delete mail with unique_id: {unique_id}")
+        get_sync_ingest().flush()
+        recipient_id = get_recipient_id_by_mail(unique_id)
+        delete_mail(unique_id, recipient_id, [], interface)
+    elif record_type == "CHANNEL":
+        channel_name, channel_url = fields[:2]
+        add_channel(channel_name, channel_url)
+    elif record_type == "DIGEST":
+        handle_digest(fields, sender_node_id, interface)
+    elif record_type == "IDS":
+        handle_ids(fields, sender_node_id, interface)
+    elif record_type == "WANT":
+        handle_want(fields, sender_node_id, interface)
+    elif record_type == "ACK":
+        get_fanout_sender().handle_ack(fields, sender_node_id)
 
-    # Handle repeated characters for single character commands using a prefix
-    if len(message_lower) == 2 and message_lower[1] == 'x':
-        message_lower = message_lower[0]
 
+def process_message(sender_id, message, interface, is_sync_message=False):
     if is_sync_message:
-        if message.startswith("BULLETIN|"):
-            parts = message.split("|")
-            board, sender_short_name, subject, content, unique_id = parts[1], parts[2], parts[3], parts[4], parts[5]
-            add_bulletin(board, sender_short_name, subject, content, [], interface, unique_id=unique_id)
-
-            if board.lower() == "urgent":
-                notification_message = f"💥NEW URGENT BULLETIN💥\nFrom: {sender_short_name}\nTitle: {subject}"
-                send_message(notification_message, BROADCAST_NUM, interface)
-        elif message.startswith("MAIL|"):
-            parts = message.split("|")
-            sender_id, sender_short_name, recipient_id, subject, content, unique_id = parts[1], parts[2], parts[3], parts[4], parts[5], parts[6]
-            add_mail(sender_id, sender_short_name, recipient_id, subject, content, [], interface, unique_id=unique_id)
-        elif message.startswith("DELETE_BULLETIN|"):
-            unique_id = message.split("|")[1]
-            delete_bulletin(unique_id, [], interface)
-        elif message.startswith("DELETE_MAIL|"):
-            unique_id = message.split("|")[1]
-            logging.info(f"Processing delete mail with unique_id: {unique_id}")
-            recipient_id = get_recipient_id_by_mail(unique_id)
-            delete_mail(unique_id, recipient_id, [], interface)
-        elif message.startswith("CHANNEL|"):
-            parts = message.split("|")
-            channel_name, channel_url = parts[1], parts[2]
-            add_channel(channel_name, channel_url)
+        record_type, *fields = message.split("|")
+        process_sync_record(record_type, fields, interface)
     else:
-        if message_lower.startswith("sm,,"):
-            handle_send_mail_command(sender_id, message_lower, interface, bbs_nodes)
-        elif message_lower.startswith("cm"):
-            handle_check_mail_command(sender_id, interface)
-        elif message_lower.startswith("pb,,"):
-            handle_post_bulletin_command(sender_id, message_lower, interface, bbs_nodes)
-        elif message_lower.startswith("cb,,"):
-            handle_check_bulletin_command(sender_id, message_lower, interface)
-        elif message_lower.startswith("chp,,"):
-            handle_post_channel_command(sender_id, message_lower, interface)
-        elif message_lower.startswith("chl"):
-            handle_list_channels_command(sender_id, interface)
-        else:
-            if state and state['command'] == 'MENU':
-                menu_name = state['menu']
-                if menu_name == 'bbs':
-                    handlers = bbs_menu_handlers
-                elif menu_name == 'utilities':
-                    handlers = utilities_menu_handlers
-                else:
-                    handlers = main_menu_handlers
-            elif state and state['command'] == 'BULLETIN_MENU':
-                handlers = bulletin_menu_handlers
-            elif state and state['command'] == 'BULLETIN_ACTION':
-                handlers = board_action_handlers
-            elif state and state['command'] == 'JS8CALL_MENU':
-                handle_js8call_steps(sender_id, message, state['step'], interface, state)
-                return
-            elif state and state['command'] == 'GROUP_MESSAGES':
-                handle_group_message_selection(sender_id, message, state['step'], state, interface)
-                return
-            else:
-                handlers = main_menu_handlers
-
-            if message_lower == 'x':
-                # Reset to main menu state
-                handle_help_command(sender_id, interface)
-                return
-
-            if message_lower in handlers:
-                if state and state['command'] in ['BULLETIN_ACTION', 'BULLETIN_READ', 'BULLETIN_POST', 'BULLETIN_POST_CONTENT']:
-                    handlers[message_lower](sender_id, interface, state)
-                else:
-                    handlers[message_lower](sender_id, interface)
-            elif state:
-                command = state['command']
-                step = state['step']
-
-                if command == 'MAIL':
-                    handle_mail_steps(sender_id, message, step, state, interface, bbs_nodes)
-                elif command == 'BULLETIN':
-                    handle_bb_steps(sender_id, message, step, state, interface, bbs_nodes)
-                elif command == 'STATS':
-                    handle_stats_steps(sender_id, message, step, interface)
-                elif command == 'CHANNEL_DIRECTORY':
-                    handle_channel_directory_steps(sender_id, message, step, state, interface)
-                elif command == 'CHECK_MAIL':
-                    if step == 1:
-                        handle_read_mail_command(sender_id, message, state, interface)
-                    elif step == 2:
-                        handle_delete_mail_confirmation(sender_id, message, state, interface, bbs_nodes)
-                elif command == 'CHECK_BULLETIN':
-                    if step == 1:
-                        handle_read_bulletin_command(sender_id, message, state, interface)
-                elif command == 'CHECK_CHANNEL':
-                    if step == 1:
-                        handle_read_channel_command(sender_id, message, state, interface)
-                elif command == 'LIST_CHANNELS':
-                    if step == 1:
-                        handle_read_channel_command(sender_id, message, state, interface)
-                elif command == 'BULLETIN_POST':
-                    handle_bb_steps(sender_id, message, 4, state, interface, bbs_nodes)
-                elif command == 'BULLETIN_POST_CONTENT':
-                    handle_bb_steps(sender_id, message, 5, state, interface, bbs_nodes)
-                elif command == 'BULLETIN_READ':
-                    handle_bb_steps(sender_id, message, 3, state, interface, bbs_nodes)
-                elif command == 'JS8CALL_MENU':
-                    handle_js8call_steps(sender_id, message, step, interface, state)
-                elif command == 'GROUP_MESSAGES':
-                    handle_group_message_selection(sender_id, message, step, state, interface)
-                else:
-                    handle_help_command(sender_id, interface)
-            else:
-                handle_help_command(sender_id, interface)
+        router.dispatch(sender_id, message, get_user_state(sender_id), interface)
 
 
 def on_receive(packet, interface):
@@ -201,6 +176,16 @@ def on_receive(packet, interface):
                 process_message(sender_id, message_string, interface, is_sync_message=False)
             else:
                 logging.info("Ignoring message sent to group chat or from unknown node")
+        elif 'decoded' in packet and packet['decoded']['portnum'] == SYNC_PORT_NAME:
+            sender_node_id = packet['fromId']
+            if sender_node_id not in interface.bbs_nodes:
+                logging.info(f"Ignoring sync frame from unknown node {sender_node_id}")
+                return
+            record = sync_receiver.add_fragment(sender_node_id, packet['decoded']['payload'], interface)
+            if record:
+                record_type, fields = record
+                logging.info(f"SERVER SYNC: Received {record_type} record from {sender_node_id}")
+                process_sync_record(record_type, fields, interface, sender_node_id)
     except KeyError as e:
         logging.error(f"Error processing packet: {e}")
 
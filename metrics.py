@@ -0,0 +1,73 @@
+"""
+Local HTTP endpoint exposing the BBS's runtime statistics as JSON.
+
+Enabled by setting [metrics] port; binds to [metrics] host (default
+127.0.0.1). GET /metrics returns every registered source, GET
+/metrics/<name> a single one.
+"""
+
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MetricsServer:
+    def __init__(self, config=None):
+        self.host = '127.0.0.1'
+        self.port = 0
+        if config is not None:
+            self.host = config.get('metrics', 'host', fallback=self.host)
+            self.port = config.getint('metrics', 'port', fallback=self.port)
+        self.sources = {}
+        self.httpd = None
+        self.thread = None
+
+    def add_source(self, name, get_stats):
+        self.sources[name] = get_stats
+
+    def collect(self, names=None):
+        result = {}
+        for name in names or self.sources:
+            try:
+                result[name] = self.sources[name]()
+            except Exception as e:
+                result[name] = {'error': str(e)}
+        return result
+
+    def start(self):
+        if not self.port:
+            return False
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.rstrip('/')
+                if path == '/metrics':
+                    body = server.collect()
+                elif path.startswith('/metrics/') and path[len('/metrics/'):] in server.sources:
+                    body = server.collect([path[len('/metrics/'):]])
+                else:
+                    self.send_error(404)
+                    return
+                payload = json.dumps(body, default=str).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                logging.debug(f"Metrics request: {format % args}")
+
+        self.httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='metrics-http', daemon=True)
+        self.thread.start()
+        logging.info(f"Metrics endpoint listening on http://{self.host}:{self.port}/metrics")
+        return True
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
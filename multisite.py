@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Combined coverage of several repeater sites.
+
+Every site's coverage (coverage_raster.py path loss) is computed on one fixed
+lat/lon lattice, by default the SRTM3 3 arc-second spacing, over a window
+range_km around the site. Because the lattice does not depend on which
+sites are in the plan, a site's raster stays valid when others are added or
+moved: rasters are cached on disk (and in memory) under a hash of the
+site's position and height and the path settings, so adding one site to a
+dozen computes one new raster.
+
+MultiSitePlan.compute() stitches the windows onto their common extent and
+derives, per cell:
+
+- snr: the best SNR of any site,
+- best_server: index of the site with that SNR (-1 where no site covers),
+- overlap: how many sites cover the cell (SNR above the LoRa limit),
+- union: overlap > 0.
+
+Usage: python3 multisite.py sites.json [--range-km 15] [--output plan]
+where sites.json is a list of {"name", "lat", "lon", "height"} objects.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+
+import numpy as np
+
+import coverage_raster
+import los_engine
+import radio_path
+from terrain import grid_for
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'meshtastic-coverage')
+# SRTM3 sample spacing
+DEFAULT_CELL_ARCSEC = 3.0
+
+
+class Lattice:
+    """A global grid of cell_arcsec cells; row 0 starts at 90N, column 0 at 180W."""
+
+    def __init__(self, cell_arcsec=DEFAULT_CELL_ARCSEC):
+        self.cell_arcsec = cell_arcsec
+        self.cell = cell_arcsec / 3600
+
+    def row(self, lat):
+        return int(math.floor((90 - lat) / self.cell))
+
+    def column(self, lon):
+        return int(math.floor((lon + 180) / self.cell))
+
+    def lats(self, first_row, rows):
+        return 90 - (first_row + np.arange(rows) + 0.5) * self.cell
+
+    def lons(self, first_column, columns):
+        return -180 + (first_column + np.arange(columns) + 0.5) * self.cell
+
+    def window(self, site, range_km):
+        """(first_row, first_column, rows, columns) of the cells within range_km of the site's lat/lon box."""
+        dlat = range_km / 111.32
+        dlon = range_km / (111.32 * max(math.cos(math.radians(site['lat'])), 0.01))
+        first_row, last_row = self.row(site['lat'] + dlat), self.row(site['lat'] - dlat)
+        first_column, last_column = self.column(site['lon'] - dlon), self.column(site['lon'] + dlon)
+        return first_row, first_column, last_row - first_row + 1, last_column - first_column + 1
+
+
+def window_rows(grid, rows, site, first_row, first_column, columns, cell_arcsec, range_km, frequency='US',
+                k_factor=radio_path.DEFAULT_K_FACTOR, rx_height=1.0, steps=los_engine.STEPS, diffraction='deygout',
+                method='nearest'):
+    """Path loss and elevation rows of a site's window (NaN beyond range_km and over voids)."""
+    lattice = Lattice(cell_arcsec)
+    lats = lattice.lats(first_row, rows.stop)[rows]
+    cell_lat, cell_lon = np.meshgrid(lats, lattice.lons(first_column, columns), indexing='ij')
+    inside = los_engine.haversine_distance(site['lat'], site['lon'], cell_lat, cell_lon) <= range_km
+    loss = np.full(cell_lat.shape, np.nan)
+    elevations = grid.elevations(cell_lat, cell_lon, method)
+    elevations[~inside] = np.nan
+    loss[inside] = coverage_raster.path_loss_to(grid, site, cell_lat[inside], cell_lon[inside], frequency,
+                                                k_factor, rx_height, steps, diffraction, method)
+    return loss, elevations
+
+
+class SiteRaster:
+    """Path loss window of one site: rows/columns offset on the lattice, float32, NaN where not computed."""
+
+    def __init__(self, site, first_row, first_column, path_loss_db):
+        self.site = site
+        self.first_row = first_row
+        self.first_column = first_column
+        self.path_loss_db = path_loss_db
+
+
+class SiteCache:
+    """Per-site rasters on disk as <key>.npy plus <key>.json, with an in-memory layer."""
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.memory = {}
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key):
+        if key in self.memory:
+            return self.memory[key]
+        path = self._path(key)
+        if not os.path.exists(f"{path}.json"):
+            return None
+        try:
+            with open(f"{path}.json", encoding='utf-8') as f:
+                metadata = json.load(f)
+            raster = SiteRaster(metadata['site'], metadata['first_row'], metadata['first_column'],
+                                np.load(f"{path}.npy", mmap_mode='r'))
+        except (OSError, ValueError, KeyError) as e:
+            # An unreadable entry (e.g. left by an interrupted run) is recomputed and overwritten
+            logging.warning(f"Ignoring unreadable coverage cache entry {key}: {e}")
+            return None
+        self.memory[key] = raster
+        return raster
+
+    def put(self, key, raster, settings):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        # Both files are written under temporary names and renamed into place, array first: a .json
+        # without its .npy would look like a cache hit
+        partial = f"{path}.{os.getpid()}.partial"
+        np.save(f"{partial}.npy", raster.path_loss_db.astype(np.float32))
+        os.replace(f"{partial}.npy", f"{path}.npy")
+        with open(f"{partial}.json", 'w', encoding='utf-8') as f:
+            json.dump({'site': raster.site, 'first_row': raster.first_row, 'first_column': raster.first_column,
+                       'settings': settings}, f, indent=2)
+        os.replace(f"{partial}.json", f"{path}.json")
+        self.memory[key] = raster
+
+
+class MultiSiteCoverage:
+    """The combined rasters of a plan over the union of the site windows; row 0 is the northern edge."""
+
+    def __init__(self, sites, lattice, first_row, first_column, snr, rssi, best_server, overlap, limit):
+        self.sites = sites
+        self.lattice = lattice
+        self.first_row = first_row
+        self.first_column = first_column
+        self.snr = snr
+        self.rssi = rssi
+        self.best_server = best_server
+        self.overlap = overlap
+        self.limit = limit
+
+    @property
+    def union(self):
+        return self.overlap > 0
+
+    @property
+    def geotransform(self):
+        """GDAL-style (west, pixel width, 0, north, 0, -pixel height) in degrees."""
+        cell = self.lattice.cell
+        return (-180 + self.first_column * cell, cell, 0.0, 90 - self.first_row * cell, 0.0, -cell)
+
+    def save(self, path):
+        """path.npy (float32 best SNR, best RSSI, best server, overlap) and path.json."""
+        np.save(f"{path}.npy", np.stack([self.snr, self.rssi, self.best_server.astype(np.float32),
+                                         self.overlap.astype(np.float32)]))
+        rows, columns = self.snr.shape
+        west, _, _, north, _, _ = self.geotransform
+        with open(f"{path}.json", 'w', encoding='utf-8') as f:
+            json.dump({
+                'bands': ['snr_db', 'rssi_dbm', 'best_server', 'overlap'],
+                'crs': 'EPSG:4326',
+                'bounds': {'south': north - rows * self.lattice.cell, 'west': west, 'north': north,
+                           'east': west + columns * self.lattice.cell},
+                'geotransform': list(self.geotransform),
+                'snr_limit_db': self.limit,
+                'sites': self.sites,
+            }, f, indent=2)
+
+
+class MultiSitePlan:
+    """
+    sites: {'lat', 'lon', 'height'} dicts, optionally with 'name' and a
+    'budget' (LinkBudget keyword arguments) overriding the plan's budget.
+    """
+
+    def __init__(self, srtm_data, sites, range_km=15, frequency='US', budget=None, k_factor=radio_path.DEFAULT_K_FACTOR,
+                 rx_height=1.0, steps=los_engine.STEPS, diffraction='deygout', method='nearest',
+                 cell_arcsec=DEFAULT_CELL_ARCSEC, cache=None, workers=1):
+        self.srtm_data = srtm_data
+        self.sites = list(sites)
+        self.range_km = range_km
+        self.frequency = frequency
+        self.budget = budget or coverage_raster.LinkBudget()
+        self.settings = dict(range_km=range_km, frequency_mhz=radio_path.frequency_mhz(frequency), k_factor=k_factor,
+                             rx_height=rx_height, steps=steps, diffraction=diffraction, method=method,
+                             cell_arcsec=cell_arcsec)
+        self.lattice = Lattice(cell_arcsec)
+        self.cache = cache if cache is not None else SiteCache()
+        self.workers = workers
+        self.computed = 0
+
+    def add_site(self, site):
+        self.sites.append(site)
+
+    def site_key(self, site):
+        """Cache key: everything the path loss depends on (not the link budget, applied afterwards)."""
+        identity = {'lat': site['lat'], 'lon': site['lon'], 'height': site['height'], **self.settings}
+        return hashlib.sha1(json.dumps(identity, sort_keys=True).encode()).hexdigest()
+
+    def site_budget(self, site):
+        return coverage_raster.LinkBudget(**site['budget']) if site.get('budget') else self.budget
+
+    def site_raster(self, site, progress=None):
+        key = self.site_key(site)
+        raster = self.cache.get(key)
+        if raster is not None:
+            return raster
+        first_row, first_column, rows, columns = self.lattice.window(site, self.range_km)
+        cell = self.lattice.cell
+        north, west = 90 - first_row * cell, -180 + first_column * cell
+        south, east = north - rows * cell, west + columns * cell
+        grid = grid_for(self.srtm_data, south, west, north, east)
+        kwargs = dict(site={'lat': site['lat'], 'lon': site['lon'], 'height': site['height']}, first_row=first_row,
+                      first_column=first_column, columns=columns, cell_arcsec=self.lattice.cell_arcsec,
+                      range_km=self.range_km, frequency=self.frequency, k_factor=self.settings['k_factor'],
+                      rx_height=self.settings['rx_height'], steps=self.settings['steps'],
+                      diffraction=self.settings['diffraction'], method=self.settings['method'])
+        logging.info(f"Computing coverage of {site.get('name', key[:8])} ({rows}x{columns} cells)")
+        loss, _ = los_engine._run_map(window_rows, grid, kwargs, max(1, los_engine.CHUNK_RAYS // columns),
+                                      self.workers, progress, shape=(rows, columns))
+        raster = SiteRaster(kwargs['site'], first_row, first_column, loss.astype(np.float32))
+        self.cache.put(key, raster, self.settings)
+        self.computed += 1
+        return raster
+
+    def compute(self, spreading_factor=None, progress=None):
+        """MultiSiteCoverage of all sites; only sites without a cached raster are computed."""
+        if not self.sites:
+            raise ValueError("No sites to compute")
+        rasters = [self.site_raster(site, progress) for site in self.sites]
+        first_row = min(raster.first_row for raster in rasters)
+        first_column = min(raster.first_column for raster in rasters)
+        last_row = max(raster.first_row + raster.path_loss_db.shape[0] for raster in rasters)
+        last_column = max(raster.first_column + raster.path_loss_db.shape[1] for raster in rasters)
+        shape = (last_row - first_row, last_column - first_column)
+        limit = coverage_raster.LORA_SNR_LIMITS[spreading_factor or self.budget.spreading_factor]
+
+        best_snr = np.full(shape, -np.inf, dtype=np.float32)
+        best_rssi = np.full(shape, np.nan, dtype=np.float32)
+        best_server = np.full(shape, -1, dtype=np.int16)
+        overlap = np.zeros(shape, dtype=np.uint8 if len(rasters) < 256 else np.uint16)
+        # One site at a time, so memory stays at the size of the combined raster
+        for index, (site, raster) in enumerate(zip(self.sites, rasters)):
+            budget = self.site_budget(site)
+            rows, columns = raster.path_loss_db.shape
+            window = (slice(raster.first_row - first_row, raster.first_row - first_row + rows),
+                      slice(raster.first_column - first_column, raster.first_column - first_column + columns))
+            rssi = budget.rssi(np.asarray(raster.path_loss_db)).astype(np.float32)
+            snr = rssi - np.float32(budget.noise_floor_dbm)
+            with np.errstate(invalid='ignore'):
+                better = snr > best_snr[window]
+                overlap[window] += snr >= limit
+            best_snr[window] = np.where(better, snr, best_snr[window])
+            best_rssi[window] = np.where(better, rssi, best_rssi[window])
+            best_server[window] = np.where(better, index, best_server[window])
+        with np.errstate(invalid='ignore'):
+            best_server[best_snr < limit] = -1
+        best_snr[np.isneginf(best_snr)] = np.nan
+        return MultiSiteCoverage(self.sites, self.lattice, first_row, first_column, best_snr, best_rssi, best_server,
+                                 overlap, limit)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Combined coverage and best server of several sites")
+    parser.add_argument("sites", help="JSON file with a list of {name, lat, lon, height} sites")
+    parser.add_argument("--range-km", type=float, default=15)
+    parser.add_argument("--frequency", default='US', help="MHz, or one of " + ", ".join(radio_path.FREQUENCIES_MHZ))
+    parser.add_argument("--tx-power", type=float, default=22, help="dBm")
+    parser.add_argument("--cell-arcsec", type=float, default=DEFAULT_CELL_ARCSEC)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--output", default='plan', help="Output path without extension")
+    args = parser.parse_args()
+
+    from terrain import Terrain
+    with open(args.sites, encoding='utf-8') as f:
+        sites = json.load(f)
+    frequency = args.frequency if args.frequency in radio_path.FREQUENCIES_MHZ else float(args.frequency)
+    budget = coverage_raster.LinkBudget(tx_power_dbm=args.tx_power)
+    plan = MultiSitePlan(Terrain(), sites, args.range_km, frequency, budget, cell_arcsec=args.cell_arcsec,
+                         workers=args.workers)
+    result = plan.compute()
+    result.save(args.output)
+    print(f"{len(sites)} sites, {plan.computed} computed, {len(sites) - plan.computed} from cache")
+    cells = int(np.sum(~np.isnan(result.snr)))
+    print(f"Covered: {int(result.union.sum())} of {cells} cells, by 2 or more sites: {int(np.sum(result.overlap >= 2))}")
+    for index, site in enumerate(sites):
+        print(f"  {site.get('name', index)}: best server for {int(np.sum(result.best_server == index))} cells")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import logging
+import threading
+
+from pubsub import pub
+
+_index_lock = threading.Lock()
+
+
+class NodeIndex:
+    """
+    Lookup tables over interface.nodes: node num -> node id, lowercased short
+    name -> node ids, and node id -> (shortName, longName).
+
+    Kept current from NODEINFO updates; a change in the size of the NodeDB
+    (new node heard, nodedb reset) triggers a full rebuild on the next lookup.
+    """
+
+    def __init__(self, interface):
+        self.interface = interface
+        self.lock = threading.RLock()
+        self.id_by_num = {}
+        self.ids_by_short_name = {}
+        self.names_by_id = {}
+        self.indexed_count = -1
+        self.rebuild()
+
+    def rebuild(self):
+        with self.lock:
+            self.id_by_num = {}
+            self.ids_by_short_name = {}
+            self.names_by_id = {}
+            nodes = dict(self.interface.nodes or {})
+            for node_id, node in nodes.items():
+                self._add(node_id, node)
+            self.indexed_count = len(nodes)
+        logging.debug(f"Node index rebuilt with {self.indexed_count} nodes")
+
+    def _add(self, node_id, node):
+        num = node.get('num')
+        if num is not None:
+            self.id_by_num[num] = node_id
+        user = node.get('user')
+        if not user:
+            return
+        short_name = user.get('shortName')
+        self.names_by_id[node_id] = (short_name, user.get('longName'))
+        if short_name is not None:
+            self.ids_by_short_name.setdefault(short_name.lower(), []).append(node_id)
+
+    def _remove(self, node_id):
+        names = self.names_by_id.pop(node_id, None)
+        if names and names[0] is not None:
+            ids = self.ids_by_short_name.get(names[0].lower(), [])
+            if node_id in ids:
+                ids.remove(node_id)
+            if not ids:
+                self.ids_by_short_name.pop(names[0].lower(), None)
+
+    def update_node(self, node):
+        user = node.get('user') or {}
+        node_id = user.get('id')
+        if node_id is None:
+            return
+        with self.lock:
+            self._remove(node_id)
+            self._add(node_id, node)
+
+    def _refresh_if_stale(self):
+        nodes = self.interface.nodes
+        if nodes is not None and len(nodes) != self.indexed_count:
+            self.rebuild()
+
+    def get_id(self, node_num):
+        with self.lock:
+            self._refresh_if_stale()
+            return self.id_by_num.get(node_num)
+
+    def find_by_short_name(self, short_name):
+        with self.lock:
+            self._refresh_if_stale()
+            return [(node_id, *self.names_by_id[node_id])
+                    for node_id in self.ids_by_short_name.get(short_name.lower(), [])]
+
+    def get_names(self, node_id):
+        with self.lock:
+            self._refresh_if_stale()
+            return self.names_by_id.get(node_id)
+
+
+def get_node_index(interface):
+    index = getattr(interface, 'node_index', None)
+    if index is None:
+        with _index_lock:
+            index = getattr(interface, 'node_index', None)
+            if index is None:
+                index = NodeIndex(interface)
+                interface.node_index = index
+    return index
+
+
+def _on_node_updated(node, interface):
+    index = getattr(interface, 'node_index', None)
+    if index is not None:
+        index.update_node(node)
+
+
+def _on_connection_established(interface):
+    index = getattr(interface, 'node_index', None)
+    if index is not None:
+        index.rebuild()
+
+
+pub.subscribe(_on_node_updated, "meshtastic.node.updated")
+pub.subscribe(_on_connection_established, "meshtastic.connection.established")
@@ -0,0 +1,210 @@
+"""
+Live table of the nodes heard on the mesh, used by hops.py.
+
+NodeTable keeps one row per node in an OrderedDict ordered by last-seen time:
+a packet moves its sender to the end in O(1), so the most recently heard
+nodes are read straight off the end and nothing is ever re-sorted. Views
+only touch what they show:
+
+- CursesView redraws the screen lines whose text changed, at most once per
+  refresh interval, however many packets arrived in between,
+- JsonLinesView writes one JSON object per node update for downstream tools,
+- PlainView prints the most recent rows periodically where curses is not
+  available (Windows without windows-curses).
+"""
+
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from itertools import islice
+
+from mesh_topology import packet_hops
+
+try:
+    import curses
+except ImportError:
+    curses = None
+
+
+def format_age(seconds):
+    hours, remainder = divmod(max(int(seconds), 0), 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{hours:02}:{minutes:02}:{seconds:02}"
+
+
+class NodeTable:
+    def __init__(self, topology=None):
+        """With a MeshTopology, the hop column shows each node's most common recent hop count."""
+        self.topology = topology
+        self.rows = OrderedDict()
+        self.lock = threading.Lock()
+        self.version = 0
+        self.listeners = []
+
+    def __len__(self):
+        return len(self.rows)
+
+    def add_listener(self, listener):
+        """listener(event, row) is called after every update, outside the table lock."""
+        self.listeners.append(listener)
+
+    def load_nodedb(self, nodes):
+        """Seeds the table from interface.nodes; the only sort, done once at startup."""
+        entries = sorted((nodes or {}).items(), key=lambda item: item[1].get('lastHeard') or 0)
+        loaded = []
+        with self.lock:
+            for node_id, node in entries:
+                row = {
+                    'id': node_id,
+                    'name': (node.get('user') or {}).get('longName', node_id),
+                    'hop_count': node.get('hopsAway', 'N/A'),
+                    'snr': node.get('snr'),
+                    'last_seen': node.get('lastHeard') or 0,
+                    'packets': 0,
+                }
+                self.rows.pop(node_id, None)
+                self.rows[node_id] = row
+                loaded.append(dict(row))
+            self.version += 1
+        for row in loaded:
+            self._notify('initial', row)
+
+    def update(self, node_id, **fields):
+        with self.lock:
+            row = self.rows.pop(node_id, None)
+            if row is None:
+                row = {'id': node_id, 'name': node_id, 'hop_count': 'N/A', 'snr': None, 'last_seen': 0, 'packets': 0}
+            row.update(fields)
+            row['packets'] += 1
+            self.rows[node_id] = row
+            self.version += 1
+            row = dict(row)
+        self._notify('heard', row)
+        return row
+
+    def _notify(self, event, row):
+        for listener in self.listeners:
+            listener(event, row)
+
+    def on_receive(self, packet, interface):
+        from_id = packet.get('fromId')
+        if from_id is None:
+            return
+        fields = {'snr': packet.get('rxSnr'), 'last_seen': time.time()}
+        if self.topology is not None:
+            self.topology.observe(packet, interface)
+            hops = self.topology.hops_to(from_id)
+        else:
+            hops = packet_hops(packet)
+        if hops is not None:
+            fields['hop_count'] = hops
+        if from_id not in self.rows:
+            node = (interface.nodes or {}).get(from_id) if interface is not None else None
+            fields['name'] = ((node or {}).get('user') or {}).get('longName', from_id)
+        self.update(from_id, **fields)
+
+    def recent(self, limit=None):
+        """Copies of the `limit` most recently heard rows, newest first."""
+        with self.lock:
+            return [dict(row) for row in islice(reversed(self.rows.values()), limit)]
+
+# How often CursesView checks for a key press between redraws
+KEY_POLL_INTERVAL = 0.1
+
+HEADER = f"{'Node Name':<32} {'Hops':>4} {'SNR':>6} {'Packets':>7} {'Last Seen':>9}"
+
+
+def format_row(row, now):
+    snr = row['snr']
+    snr = f"{snr:.1f}" if isinstance(snr, (int, float)) else 'N/A'
+    return (f"{str(row['name'])[:32]:<32} {str(row['hop_count']):>4} {snr:>6} {row['packets']:>7} "
+            f"{format_age(now - row['last_seen']) if row['last_seen'] else 'never':>9}")
+
+
+def render_lines(table, rows_available, now=None):
+    now = now if now is not None else time.time()
+    lines = [f"Nodes: {len(table)}   Updated: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now))}   "
+             f"(q to quit)", HEADER]
+    lines.extend(format_row(row, now) for row in table.recent(max(rows_available, 0)))
+    return lines
+
+
+class CursesView:
+    def __init__(self, table, refresh=1.0):
+        self.table = table
+        self.refresh = refresh
+
+    def run(self):
+        if curses is None:
+            raise RuntimeError("curses is not available; install windows-curses or use --headless")
+        curses.wrapper(self._loop)
+
+    def _loop(self, screen):
+        curses.curs_set(0)
+        screen.nodelay(True)
+        drawn = []
+        drawn_version = None
+        drawn_at = 0.0
+        size = None
+        while True:
+            key = screen.getch()
+            if key in (ord('q'), ord('Q')):
+                return
+            now = time.monotonic()
+            version = self.table.version
+            resized = size != screen.getmaxyx()
+            # Ages tick every second, so redraw once a second even without packets
+            stale = version != drawn_version or now - drawn_at >= 1.0
+            if not resized and (now - drawn_at < self.refresh or not stale):
+                time.sleep(KEY_POLL_INTERVAL)
+                continue
+            if resized:
+                size = screen.getmaxyx()
+                screen.erase()
+                drawn = []
+            height, width = size
+            lines = render_lines(self.table, height - 2)[:height]
+            for y, text in enumerate(lines):
+                if y >= len(drawn) or drawn[y] != text:
+                    screen.move(y, 0)
+                    screen.clrtoeol()
+                    screen.addnstr(y, 0, text, width - 1)
+            for y in range(len(lines), len(drawn)):
+                screen.move(y, 0)
+                screen.clrtoeol()
+            screen.refresh()
+            drawn = lines
+            drawn_version = version
+            drawn_at = now
+
+
+class PlainView:
+    def __init__(self, table, refresh=60, limit=50):
+        self.table = table
+        self.refresh = refresh
+        self.limit = limit
+
+    def run(self):
+        while True:
+            print()
+            print("\n".join(render_lines(self.table, self.limit)))
+            time.sleep(self.refresh)
+
+
+class JsonLinesView:
+    def __init__(self, table, output=None):
+        self.output = output or sys.stdout
+        self.lock = threading.Lock()
+        table.add_listener(self.write)
+
+    def write(self, event, row):
+        line = json.dumps(dict(row, event=event, ts=time.time()), default=str)
+        with self.lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def run(self):
+        while True:
+            time.sleep(3600)
@@ -0,0 +1,167 @@
+import bisect
+import logging
+import threading
+import time
+from collections import Counter
+
+from pubsub import pub
+
+LOW_BATTERY_THRESHOLD = 20
+
+_stats_lock = threading.Lock()
+
+
+class NodeStats:
+    """
+    Running statistics over interface.nodes for the Stats menu and the Wall of
+    Shame: a sorted list of lastHeard times (so "nodes heard since t" is a
+    bisect), hardware model and role counters, and a sorted list of the
+    nodes whose battery is below LOW_BATTERY_THRESHOLD.
+
+    Updated from node and packet events; like NodeIndex, a change in the size
+    of the NodeDB triggers a full rebuild on the next query.
+    """
+
+    def __init__(self, interface):
+        self.interface = interface
+        self.lock = threading.RLock()
+        self.rebuild()
+
+    def rebuild(self):
+        with self.lock:
+            self.nodes = {}
+            self.last_heard = []
+            self.hw_models = Counter()
+            self.roles = Counter()
+            self.low_battery = []
+            nodes = dict(self.interface.nodes or {})
+            for node_id, node in nodes.items():
+                self._add(node_id, self._snapshot(node))
+            self.indexed_count = len(nodes)
+
+    @staticmethod
+    def _snapshot(node):
+        user = node.get('user') or {}
+        return {
+            'last_heard': node.get('lastHeard') or 0,
+            'hw_model': user.get('hwModel', 'Unknown'),
+            'role': user.get('role', 'Unknown'),
+            'battery': (node.get('deviceMetrics') or {}).get('batteryLevel'),
+            'long_name': user.get('longName'),
+        }
+
+    def _add(self, node_id, snapshot):
+        self.nodes[node_id] = snapshot
+        bisect.insort(self.last_heard, snapshot['last_heard'])
+        self.hw_models[snapshot['hw_model']] += 1
+        self.roles[snapshot['role']] += 1
+        battery = snapshot['battery']
+        if battery is not None and battery < LOW_BATTERY_THRESHOLD:
+            bisect.insort(self.low_battery, (battery, node_id))
+
+    def _remove(self, node_id):
+        snapshot = self.nodes.pop(node_id, None)
+        if snapshot is None:
+            return
+        index = bisect.bisect_left(self.last_heard, snapshot['last_heard'])
+        del self.last_heard[index]
+        for counter, key in ((self.hw_models, snapshot['hw_model']), (self.roles, snapshot['role'])):
+            counter[key] -= 1
+            if counter[key] <= 0:
+                del counter[key]
+        battery = snapshot['battery']
+        if battery is not None and battery < LOW_BATTERY_THRESHOLD:
+            del self.low_battery[bisect.bisect_left(self.low_battery, (battery, node_id))]
+
+    def update_node(self, node_id, node):
+        snapshot = self._snapshot(node)
+        with self.lock:
+            if self.nodes.get(node_id) != snapshot:
+                self._remove(node_id)
+                self._add(node_id, snapshot)
+
+    def _refresh_if_stale(self):
+        nodes = self.interface.nodes
+        if nodes is not None and len(nodes) != self.indexed_count:
+            self.rebuild()
+
+    def count_heard_since(self, since=None):
+        with self.lock:
+            self._refresh_if_stale()
+            if since is None:
+                return len(self.nodes)
+            return len(self.last_heard) - bisect.bisect_left(self.last_heard, since)
+
+    def get_hw_models(self):
+        with self.lock:
+            self._refresh_if_stale()
+            return self.hw_models.most_common()
+
+    def get_roles(self):
+        with self.lock:
+            self._refresh_if_stale()
+            return self.roles.most_common()
+
+    def get_low_battery(self):
+        """(long_name, battery) for nodes below LOW_BATTERY_THRESHOLD, lowest first."""
+        with self.lock:
+            self._refresh_if_stale()
+            return [(self.nodes[node_id]['long_name'], battery) for battery, node_id in self.low_battery]
+
+    def get_stats(self):
+        now = int(time.time())
+        with self.lock:
+            return {
+                'nodes': self.count_heard_since(),
+                'heard_24h': self.count_heard_since(now - 86400),
+                'heard_8h': self.count_heard_since(now - 28800),
+                'heard_1h': self.count_heard_since(now - 3600),
+                'hw_models': dict(self.get_hw_models()),
+                'roles': dict(self.get_roles()),
+                'low_battery': len(self.low_battery),
+            }
+
+
+def get_node_stats(interface):
+    stats = getattr(interface, 'node_stats', None)
+    if stats is None:
+        with _stats_lock:
+            stats = getattr(interface, 'node_stats', None)
+            if stats is None:
+                stats = NodeStats(interface)
+                interface.node_stats = stats
+    return stats
+
+
+def _refresh_from_nodedb(interface, node_id):
+    stats = getattr(interface, 'node_stats', None)
+    node = (interface.nodes or {}).get(node_id) if stats is not None else None
+    if node is not None:
+        stats.update_node(node_id, node)
+
+
+def _on_node_updated(node, interface):
+    node_id = (node.get('user') or {}).get('id')
+    if node_id is not None:
+        _refresh_from_nodedb(interface, node_id)
+
+
+def _on_receive(packet, interface):
+    # The interface has already stamped lastHeard (and deviceMetrics for telemetry) on the sender's node
+    node_id = packet.get('fromId')
+    if node_id is not None:
+        try:
+            _refresh_from_nodedb(interface, node_id)
+        except Exception as e:
+            logging.error(f"Error updating node stats for {node_id}: {e}")
+
+
+def _on_connection_established(interface):
+    stats = getattr(interface, 'node_stats', None)
+    if stats is not None:
+        stats.rebuild()
+
+
+pub.subscribe(_on_node_updated, "meshtastic.node.updated")
+pub.subscribe(_on_receive, "meshtastic.receive")
+pub.subscribe(_on_connection_established, "meshtastic.connection.established")
@@ -0,0 +1,233 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+
+try:
+    from meshtastic.protobuf.mesh_pb2 import Constants
+except ImportError:  # meshtastic < 2.3
+    from meshtastic.mesh_pb2 import Constants
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_SYNC = 1
+
+
+class TokenBucket:
+    """Global airtime budget: one token per frame, refilled at `rate` tokens/s."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost=1.0):
+        self._refill()
+        if self.tokens >= cost:
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+    def consume(self, cost=1.0):
+        self._refill()
+        self.tokens -= cost
+
+
+class OutboundItem:
+    __slots__ = ('payload', 'destination', 'interface', 'port_num', 'channel_index', 'enqueued_at')
+
+    def __init__(self, payload, destination, interface, port_num=None, channel_index=0):
+        self.payload = payload
+        self.destination = destination
+        self.interface = interface
+        self.port_num = port_num
+        self.channel_index = channel_index
+        self.enqueued_at = time.monotonic()
+
+
+class OutboundDispatcher:
+    """
+    Background transmitter for everything the BBS sends over the mesh.
+
+    Callers enqueue frames and return immediately; a single worker thread drains
+    the queues at the pace allowed by the token bucket. Interactive replies are
+    always served before sync traffic, and destinations within a priority are
+    served round-robin so one long mailbox listing can't starve other users.
+    """
+
+    def __init__(self, config=None):
+        send_interval = 2.0
+        burst = 1
+        max_queue = 500
+        max_payload_bytes = Constants.DATA_PAYLOAD_LEN
+        if config is not None:
+            send_interval = config.getfloat('outbound', 'send_interval', fallback=send_interval)
+            burst = config.getint('outbound', 'burst', fallback=burst)
+            max_queue = config.getint('outbound', 'max_queue_per_destination', fallback=max_queue)
+            max_payload_bytes = config.getint('outbound', 'max_payload_bytes', fallback=max_payload_bytes)
+
+        self.bucket = TokenBucket(1.0 / send_interval if send_interval > 0 else 1e9, max(burst, 1))
+        self.max_queue = max_queue
+        # Largest payload the radio accepts in one packet, in UTF-8 bytes
+        self.max_payload_bytes = min(max_payload_bytes, Constants.DATA_PAYLOAD_LEN)
+        self.queues = {PRIORITY_INTERACTIVE: OrderedDict(), PRIORITY_SYNC: OrderedDict()}
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+
+        self.sent = 0
+        self.errors = 0
+        self.dropped = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.recent_latencies = deque(maxlen=256)
+
+    def start(self):
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target=self._run, name='outbound-dispatcher', daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=5):
+        with self.condition:
+            self.running = False
+            pending = self._depth()
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout)
+        if pending:
+            logging.info(f"Outbound dispatcher stopped with {pending} frames still queued")
+
+    def enqueue(self, payload, destination, interface, priority=PRIORITY_INTERACTIVE, port_num=None, channel_index=0):
+        with self.condition:
+            queues = self.queues[priority]
+            queue = queues.get(destination)
+            if queue is None:
+                queue = queues[destination] = deque()
+            if len(queue) >= self.max_queue:
+                self.dropped += 1
+                logging.warning(f"Outbound queue for {destination} is full, dropping frame")
+                return False
+            queue.append(OutboundItem(payload, destination, interface, port_num, channel_index))
+            self.condition.notify()
+            return True
+
+    def _depth(self, priority=None):
+        priorities = [priority] if priority is not None else self.queues.keys()
+        return sum(len(queue) for p in priorities for queue in self.queues[p].values())
+
+    def _pop_next(self):
+        for priority in (PRIORITY_INTERACTIVE, PRIORITY_SYNC):
+            queues = self.queues[priority]
+            if not queues:
+                continue
+            destination, queue = next(iter(queues.items()))
+            item = queue.popleft()
+            if queue:
+                queues.move_to_end(destination)
+            else:
+                del queues[destination]
+            return item
+        return None
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.running and not self._depth():
+                    self.condition.wait()
+                if not self.running:
+                    return
+                delay = self.bucket.wait_time()
+                if delay > 0:
+                    # Re-check after waiting so a higher priority frame that
+                    # arrives meanwhile goes out first.
+                    self.condition.wait(delay)
+                    continue
+                item = self._pop_next()
+                self.bucket.consume()
+            self._send(item)
+
+    def _send(self, item):
+        try:
+            if item.port_num is None:
+                d = item.interface.sendText(
+                    text=item.payload,
+                    destinationId=item.destination,
+                    wantAck=False,
+                    wantResponse=False
+                )
+            else:
+                d = item.interface.sendData(
+                    item.payload,
+                    destinationId=item.destination,
+                    portNum=item.port_num,
+                    channelIndex=item.channel_index,
+                    wantAck=False,
+                    wantResponse=False
+                )
+            logging.info(f"REPLY SEND ID={d.id}")
+        except Exception as e:
+            with self.condition:
+                self.errors += 1
+            logging.info(f"REPLY SEND ERROR {e}")
+            return
+
+        latency = time.monotonic() - item.enqueued_at
+        with self.condition:
+            self.sent += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+            self.recent_latencies.append(latency)
+
+    def get_stats(self):
+        with self.condition:
+            recent = sorted(self.recent_latencies)
+            return {
+                'queue_depth': self._depth(),
+                'queue_depth_interactive': self._depth(PRIORITY_INTERACTIVE),
+                'queue_depth_sync': self._depth(PRIORITY_SYNC),
+                'destinations': sum(len(queues) for queues in self.queues.values()),
+                'sent': self.sent,
+                'errors': self.errors,
+                'dropped': self.dropped,
+                'latency_avg': self.latency_total / self.sent if self.sent else 0.0,
+                'latency_max': self.latency_max,
+                'latency_p95': recent[int(len(recent) * 0.95)] if recent else 0.0,
+            }
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def start_dispatcher(config=None):
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is not None:
+            _dispatcher.stop()
+        _dispatcher = OutboundDispatcher(config)
+        _dispatcher.start()
+        return _dispatcher
+
+
+def get_dispatcher():
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = OutboundDispatcher()
+            _dispatcher.start()
+        return _dispatcher
+
+
+def stop_dispatcher():
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is not None:
+            _dispatcher.stop()
+            _dispatcher = None
@@ -0,0 +1,250 @@
+"""
+Radio path clearance for LoRa links over SRTM terrain.
+
+los_engine answers "does the terrain cross the straight line between the
+antennas"; a link also needs the first Fresnel zone mostly clear, and over a
+few tens of kilometres the Earth's bulge (reduced by refraction, the
+k-factor) lifts the terrain noticeably. For a batch of paths from one
+observer this samples the ground along each path with array operations and
+returns, per path:
+
+- the minimum Fresnel clearance ratio: clearance below the line of sight
+  divided by the first Fresnel radius (1 just touches the zone, the usual
+  rule of thumb is 0.6, 0 grazes the line, negative is obstructed),
+- where that worst point is (distance, lat, lon),
+- optionally the whole curvature-corrected profile.
+
+compute_fresnel_map does the same for every cell of the LOS scripts' polar
+grid, reusing los_engine's sectors and process pool.
+"""
+
+import numpy as np
+
+import los_engine
+from terrain import grid_for
+
+SPEED_OF_LIGHT = 299792458.0
+EARTH_RADIUS_M = 6371000.0
+# Standard atmosphere: radio horizon as if the Earth were 4/3 larger
+DEFAULT_K_FACTOR = 4 / 3
+REQUIRED_CLEARANCE = 0.6
+
+# Meshtastic regions and the centre of their LoRa band
+FREQUENCIES_MHZ = {
+    'US': 915.0,
+    'EU_868': 868.0,
+    'EU_433': 433.0,
+}
+
+
+def frequency_mhz(frequency):
+    """A frequency in MHz, or one of the FREQUENCIES_MHZ region names."""
+    if isinstance(frequency, str):
+        if frequency not in FREQUENCIES_MHZ:
+            raise ValueError(f"Unknown region {frequency}, expected one of {', '.join(FREQUENCIES_MHZ)}")
+        return FREQUENCIES_MHZ[frequency]
+    return float(frequency)
+
+
+def wavelength_m(frequency):
+    return SPEED_OF_LIGHT / (frequency_mhz(frequency) * 1e6)
+
+
+def fresnel_radius(d1, d2, frequency, zone=1):
+    """Radius (m) of the nth Fresnel zone at d1/d2 metres from the two ends."""
+    d1 = np.asarray(d1, dtype=np.float64)
+    d2 = np.asarray(d2, dtype=np.float64)
+    total = d1 + d2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        radius = np.sqrt(zone * wavelength_m(frequency) * d1 * d2 / total)
+    return np.where(total > 0, radius, 0.0)
+
+
+def earth_bulge(d1, d2, k_factor=DEFAULT_K_FACTOR):
+    """Height (m) the Earth rises above the chord between the ends, d1*d2 / (2*k*R)."""
+    return np.asarray(d1, dtype=np.float64) * np.asarray(d2, dtype=np.float64) / (2 * k_factor * EARTH_RADIUS_M)
+
+
+class PathProfiles:
+    """
+    Sampled profiles of a batch of paths, one row per path and one column
+    per sample (fractions along the path). Heights are metres above sea
+    level; terrain is NaN over voids.
+    """
+
+    def __init__(self, fractions, lengths_m, lats, lons, terrain, bulge, line, fresnel):
+        self.fractions = fractions
+        self.lengths_m = lengths_m
+        self.lats = lats
+        self.lons = lons
+        self.terrain = terrain
+        self.bulge = bulge
+        self.line = line
+        self.fresnel = fresnel
+
+    @property
+    def distances_m(self):
+        return self.lengths_m[:, None] * self.fractions
+
+    @property
+    def profile(self):
+        """Terrain raised by the Earth's bulge: what the straight radio line has to clear."""
+        return self.terrain + self.bulge
+
+    @property
+    def clearance(self):
+        return self.line - self.profile
+
+    @property
+    def clearance_ratio(self):
+        return _clearance_ratio(self.clearance, self.fresnel)
+
+
+def _clearance_ratio(clearance, fresnel):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = clearance / fresnel
+    # Zero-length paths have no Fresnel zone: clear unless the terrain is above the line
+    return np.where(fresnel > 0, ratio, np.where(clearance >= 0, np.inf, -np.inf))
+
+
+class PathAnalysis:
+    """Per-path results of analyze_paths, shaped like the end points passed in."""
+
+    def __init__(self, min_clearance_ratio, worst_distance_m, worst_lat, worst_lon, worst_clearance_m, length_m,
+                 profiles=None):
+        self.min_clearance_ratio = min_clearance_ratio
+        self.worst_distance_m = worst_distance_m
+        self.worst_lat = worst_lat
+        self.worst_lon = worst_lon
+        self.worst_clearance_m = worst_clearance_m
+        self.length_m = length_m
+        self.profiles = profiles
+
+    def clear(self, required=REQUIRED_CLEARANCE):
+        """True where at least `required` of the first Fresnel zone is clear along the whole path."""
+        return self.min_clearance_ratio >= required
+
+    def line_of_sight(self):
+        """True where the curvature-corrected terrain stays below the line of sight."""
+        return self.min_clearance_ratio >= 0
+
+
+def path_profiles(grid, start_lat, start_lon, end_lats, end_lons, start_height, end_height=0, frequency='US',
+                  k_factor=DEFAULT_K_FACTOR, steps=los_engine.STEPS, method='nearest'):
+    """
+    Profiles from one observer to a flat batch of end points: `steps` + 1
+    samples per path along the same straight lat/lon line los_engine uses,
+    antenna heights above the ground at either end. An end over a void makes
+    its whole line NaN.
+    """
+    end_lats = np.asarray(end_lats, dtype=np.float64).ravel()
+    end_lons = np.asarray(end_lons, dtype=np.float64).ravel()
+    fractions = np.arange(steps + 1) / steps
+    lengths = los_engine.haversine_distance(start_lat, start_lon, end_lats, end_lons) * 1000
+    lats = start_lat + fractions * (end_lats[:, None] - start_lat)
+    lons = start_lon + fractions * (end_lons[:, None] - start_lon)
+    terrain = grid.elevations(lats, lons, method)
+    start_total = terrain[:, :1] + start_height
+    end_total = terrain[:, -1:] + end_height
+    line = start_total + fractions * (end_total - start_total)
+    d1 = lengths[:, None] * fractions
+    d2 = lengths[:, None] - d1
+    return PathProfiles(fractions, lengths, lats, lons, terrain, earth_bulge(d1, d2, k_factor), line,
+                        fresnel_radius(d1, d2, frequency))
+
+
+def _reduce(profiles):
+    """Minimum clearance ratio over the interior samples of each path and where it occurs."""
+    rows = np.arange(profiles.lengths_m.size)
+    clearance = profiles.clearance
+    ratio = _clearance_ratio(clearance[:, 1:-1], profiles.fresnel[:, 1:-1])
+    if ratio.shape[1] == 0:
+        min_ratio = np.full(rows.shape, np.inf)
+        worst = np.zeros(rows.shape, dtype=np.intp)
+    else:
+        # Voids are skipped like in los_engine; a path without any usable sample counts as clear
+        worst = np.where(np.isnan(ratio), np.inf, ratio).argmin(axis=1)
+        min_ratio = ratio[rows, worst]
+        min_ratio = np.where(np.isnan(min_ratio), np.inf, min_ratio)
+        worst += 1
+    # A void under either end leaves the antenna height unknown
+    no_data = np.isnan(profiles.line[:, 0]) | np.isnan(profiles.line[:, -1])
+    min_ratio = np.where(no_data, np.nan, min_ratio)
+    return (min_ratio, profiles.lengths_m * profiles.fractions[worst], profiles.lats[rows, worst],
+            profiles.lons[rows, worst], clearance[rows, worst])
+
+
+def analyze_paths(source, start_lat, start_lon, end_lats, end_lons, start_height, end_height=0, frequency='US',
+                  k_factor=DEFAULT_K_FACTOR, steps=los_engine.STEPS, method='nearest', keep_profiles=False,
+                  grid=None):
+    """
+    Fresnel clearance of every path from (start_lat, start_lon) to the end
+    points, worked through in chunks so a whole map's worth of paths fits in
+    memory. source is a terrain.Terrain or an SRTM.py GeoElevationData (or
+    pass a ready ElevationGrid as grid). keep_profiles keeps the full
+    PathProfiles, which is steps + 1 samples per path, so only for small
+    batches such as a cross-section.
+    """
+    end_lats = np.asarray(end_lats, dtype=np.float64)
+    end_lons = np.asarray(end_lons, dtype=np.float64)
+    shape = end_lats.shape
+    flat_lats, flat_lons = end_lats.ravel(), end_lons.ravel()
+    if grid is None:
+        lats = np.append(flat_lats, start_lat)
+        lons = np.append(flat_lons, start_lon)
+        grid = grid_for(source, lats.min(), lons.min(), lats.max(), lons.max())
+
+    results = [np.empty(flat_lats.size) for _ in range(5)]
+    chunks = []
+    for begin in range(0, flat_lats.size, los_engine.CHUNK_RAYS):
+        chunk = slice(begin, begin + los_engine.CHUNK_RAYS)
+        profiles = path_profiles(grid, start_lat, start_lon, flat_lats[chunk], flat_lons[chunk], start_height,
+                                 end_height, frequency, k_factor, steps, method)
+        for result, values in zip(results, _reduce(profiles)):
+            result[chunk] = values
+        if keep_profiles:
+            chunks.append(profiles)
+    length = los_engine.haversine_distance(start_lat, start_lon, flat_lats, flat_lons) * 1000
+    kept = None
+    if keep_profiles and chunks:
+        kept = PathProfiles(chunks[0].fractions, *(np.concatenate([getattr(profiles, name) for profiles in chunks])
+                                                   for name in ('lengths_m', 'lats', 'lons', 'terrain', 'bulge', 'line',
+                                                                'fresnel')))
+    return PathAnalysis(*(result.reshape(shape) for result in results), length.reshape(shape), kept)
+
+
+def fresnel_map_rows(grid, rows, observer, radius_km, resolution, spacing='quadratic', clip_to_radius=True,
+                     frequency='US', k_factor=DEFAULT_K_FACTOR, end_height=0, steps=los_engine.STEPS,
+                     method='nearest'):
+    """Minimum clearance ratio and elevation rows of compute_fresnel_map for the azimuths in `rows`."""
+    target_lat, target_lon, inside, elevations = los_engine._sector_cells(
+        grid, observer['lat'], observer['lon'], radius_km, resolution, spacing, clip_to_radius, method, rows)
+    ratio = np.full(inside.shape, np.nan)
+    lats, lons = target_lat[inside], target_lon[inside]
+    values = np.empty(lats.size)
+    for begin in range(0, lats.size, los_engine.CHUNK_RAYS):
+        chunk = slice(begin, begin + los_engine.CHUNK_RAYS)
+        profiles = path_profiles(grid, observer['lat'], observer['lon'], lats[chunk], lons[chunk],
+                                 observer['height'], end_height, frequency, k_factor, steps, method)
+        values[chunk] = _reduce(profiles)[0]
+    ratio[inside] = values
+    return ratio, elevations
+
+
+def compute_fresnel_map(srtm_data, observer, radius_km, resolution, spacing='quadratic', clip_to_radius=True,
+                        frequency='US', k_factor=DEFAULT_K_FACTOR, end_height=0, steps=los_engine.STEPS,
+                        method='nearest', grid=None, progress=None, workers=1):
+    """
+    The polar grid of compute_viewshed, but each cell holds the minimum
+    Fresnel clearance ratio of the path from the observer to an antenna
+    end_height above that cell's ground (NaN outside the radius and over
+    voids); compare with REQUIRED_CLEARANCE, or >= 0 for curvature-corrected
+    line of sight. Returns (ratios, elevations).
+    """
+    grid = grid or los_engine._grid_for(srtm_data, observer['lat'], observer['lon'], radius_km, resolution, spacing,
+                                        [observer])
+    kwargs = dict(observer=observer, radius_km=radius_km, resolution=resolution, spacing=spacing,
+                  clip_to_radius=clip_to_radius, frequency=frequency, k_factor=k_factor, end_height=end_height,
+                  steps=steps, method=method)
+    return los_engine._run_map(fresnel_map_rows, grid, kwargs, max(1, los_engine.CHUNK_RAYS // resolution), workers,
+                               progress)
@@ -15,11 +15,21 @@ other BBS servers listed in the config.ini file.
 import logging
 import time
 
+from anti_entropy import AntiEntropyScheduler, get_stats as get_anti_entropy_stats
+from command_router import router
 from config_init import initialize_config, get_interface, init_cli_parser, merge_config
 from db_operations import initialize_database
+from fanout import start_fanout_sender, stop_fanout_sender
+from inbound import InboundDispatcher
 from js8call_integration import JS8CallClient
+from mesh_topology import get_mesh_topology
 from message_processing import on_receive
+from metrics import MetricsServer
+from node_stats import get_node_stats
+from outbound import start_dispatcher, stop_dispatcher
 from pubsub import pub
+from sessions import configure_sessions
+from sync_ingest import start_sync_ingest, stop_sync_ingest
 
 # General logging
 logging.basicConfig(
@@ -61,17 +71,45 @@ def main():
 
     interface = get_interface(system_config)
     interface.bbs_nodes = system_config['bbs_nodes']
+    interface.sync_format = system_config['sync_format']
+    interface.sync_compression = system_config['sync_compression']
+    interface.sync_transport = system_config['sync_transport']
     interface.allowed_nodes = system_config['allowed_nodes']
 
     logging.info(f"TC²-BBS is running on {system_config['interface_type']} interface...")
 
-    initialize_database()
+    initialize_database(system_config['config'])
+    sessions = configure_sessions(system_config['config'])
+
+    dispatcher = start_dispatcher(system_config['config'])
+    sync_ingest = start_sync_ingest(system_config['config'])
+    fanout_sender = start_fanout_sender(system_config['config'])
+
+    inbound = InboundDispatcher(on_receive, system_config['config'])
+    inbound.start()
+
+    # Digest rounds use binary control records, so only schedule them when peers speak the binary format
+    anti_entropy = AntiEntropyScheduler(interface, system_config['config'])
+    if interface.sync_format == 'binary':
+        anti_entropy.start()
 
     def receive_packet(packet, interface):
-        on_receive(packet, interface)
+        inbound.submit(packet, interface)
 
     pub.subscribe(receive_packet, system_config['mqtt_topic'])
 
+    metrics_server = MetricsServer(system_config['config'])
+    metrics_server.add_source('nodes', get_node_stats(interface).get_stats)
+    metrics_server.add_source('topology', get_mesh_topology(interface).get_stats)
+    metrics_server.add_source('inbound', inbound.get_stats)
+    metrics_server.add_source('outbound', dispatcher.get_stats)
+    metrics_server.add_source('sync_ingest', sync_ingest.get_stats)
+    metrics_server.add_source('sync_fanout', fanout_sender.get_stats)
+    metrics_server.add_source('anti_entropy', get_anti_entropy_stats)
+    metrics_server.add_source('sessions', sessions.get_stats)
+    metrics_server.add_source('commands', router.get_stats)
+    metrics_server.start()
+
     # Initialize and start JS8Call Client if configured
     js8call_client = JS8CallClient(interface)
     js8call_client.logger = js8call_logger
@@ -85,6 +123,19 @@ def main():
 
     except KeyboardInterrupt:
         logging.info("Shutting down the server...")
+        logging.info(f"Inbound dispatcher stats: {inbound.get_stats()}")
+        logging.info(f"Outbound dispatcher stats: {dispatcher.get_stats()}")
+        logging.info(f"Sync ingest stats: {sync_ingest.get_stats()}")
+        logging.info(f"Anti-entropy stats: {get_anti_entropy_stats()}")
+        logging.info(f"Sync fan-out stats: {fanout_sender.get_stats()}")
+        logging.info(f"Session store stats: {sessions.get_stats()}")
+        logging.info(f"Command route stats: {router.get_stats()}")
+        metrics_server.stop()
+        anti_entropy.stop()
+        inbound.stop()
+        stop_sync_ingest()
+        stop_fanout_sender()
+        stop_dispatcher()
         interface.close()
         if js8call_client.connected:
             js8call_client.close()
@@ -0,0 +1,165 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+SWEEP_INTERVAL = 60
+
+
+class SessionStore:
+    """
+    Per-user menu/composition state.
+
+    Sessions expire after `ttl` seconds without activity, the least recently
+    used sessions are evicted beyond `max_sessions`, and drafts are capped at
+    `max_draft_bytes` of UTF-8. With persistence enabled every change is
+    written through to the sessions table so in-progress mail and bulletins
+    survive a restart.
+    """
+
+    def __init__(self, config=None):
+        self.ttl = 1800.0
+        self.max_sessions = 1000
+        self.max_draft_bytes = 4000
+        self.persist = False
+        if config is not None:
+            self.ttl = config.getfloat('sessions', 'ttl', fallback=self.ttl)
+            self.max_sessions = config.getint('sessions', 'max_sessions', fallback=self.max_sessions)
+            self.max_draft_bytes = config.getint('sessions', 'max_draft_bytes', fallback=self.max_draft_bytes)
+            self.persist = config.getboolean('sessions', 'persist', fallback=self.persist)
+
+        self.sessions = OrderedDict()
+        self.lock = threading.RLock()
+        self.last_sweep = time.time()
+
+        self.expired = 0
+        self.evicted = 0
+        self.drafts_rejected = 0
+        self.persist_errors = 0
+
+    def load(self):
+        if not self.persist:
+            return 0
+        # db_operations imports utils, which imports this module
+        import db_operations
+        cutoff = time.time() - self.ttl
+        with self.lock:
+            for user_id, state_json, updated_at in db_operations.load_sessions():
+                if updated_at < cutoff:
+                    self._delete_persisted(user_id)
+                    continue
+                self.sessions[user_id] = {'state': json.loads(state_json), 'updated': updated_at}
+            self._evict_lru()
+            loaded = len(self.sessions)
+        logging.info(f"Restored {loaded} user sessions")
+        return loaded
+
+    def get(self, user_id):
+        now = time.time()
+        with self.lock:
+            self._sweep(now)
+            entry = self.sessions.get(user_id)
+            if entry is None:
+                return None
+            if now - entry['updated'] > self.ttl:
+                self._remove(user_id)
+                self.expired += 1
+                return None
+            # Reading counts as activity; refreshing 'updated' here keeps the
+            # order by last activity, which _sweep relies on to stop early
+            entry['updated'] = now
+            self.sessions.move_to_end(user_id)
+            return entry['state']
+
+    def set(self, user_id, state):
+        if state is None:
+            with self.lock:
+                self._remove(user_id)
+            return
+
+        now = time.time()
+        with self.lock:
+            self._sweep(now)
+            self.sessions[user_id] = {'state': state, 'updated': now}
+            self.sessions.move_to_end(user_id)
+            self._evict_lru()
+            if self.persist:
+                import db_operations
+                try:
+                    db_operations.save_session(user_id, json.dumps(state), now)
+                except Exception as e:
+                    self.persist_errors += 1
+                    logging.error(f"Failed to persist session for {user_id}: {e}")
+
+    def append_draft(self, user_id, state, text):
+        """Appends a line to the draft in state['content']; returns False if it would exceed the draft limit."""
+        content = state.get('content', '') + text + "\n"
+        if len(content.encode('utf-8')) > self.max_draft_bytes:
+            with self.lock:
+                self.drafts_rejected += 1
+            return False
+        state['content'] = content
+        self.set(user_id, state)
+        return True
+
+    def _remove(self, user_id):
+        if self.sessions.pop(user_id, None) is not None and self.persist:
+            self._delete_persisted(user_id)
+
+    def _delete_persisted(self, user_id):
+        import db_operations
+        try:
+            db_operations.delete_session(user_id)
+        except Exception as e:
+            self.persist_errors += 1
+            logging.error(f"Failed to delete persisted session for {user_id}: {e}")
+
+    def _evict_lru(self):
+        while len(self.sessions) > self.max_sessions:
+            user_id = next(iter(self.sessions))
+            self._remove(user_id)
+            self.evicted += 1
+
+    def _sweep(self, now):
+        if now - self.last_sweep < SWEEP_INTERVAL:
+            return
+        self.last_sweep = now
+        # Sessions are kept in least-recently-used order, so expired ones are at the front.
+        for user_id, entry in list(self.sessions.items()):
+            if now - entry['updated'] <= self.ttl:
+                break
+            self._remove(user_id)
+            self.expired += 1
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'sessions': len(self.sessions),
+                # Measured here rather than on every set, so sessions are only serialized when persisted
+                'state_bytes': sum(len(json.dumps(entry['state'])) for entry in self.sessions.values()),
+                'expired': self.expired,
+                'evicted': self.evicted,
+                'drafts_rejected': self.drafts_rejected,
+                'persist_errors': self.persist_errors,
+            }
+
+
+_session_store = None
+_session_store_lock = threading.Lock()
+
+
+def configure_sessions(config=None):
+    global _session_store
+    with _session_store_lock:
+        _session_store = SessionStore(config)
+        _session_store.load()
+        return _session_store
+
+
+def get_session_store():
+    global _session_store
+    with _session_store_lock:
+        if _session_store is None:
+            _session_store = SessionStore()
+        return _session_store
@@ -0,0 +1,185 @@
+import logging
+import threading
+import time
+
+from meshtastic import BROADCAST_NUM
+
+from db_operations import insert_sync_records
+from utils import send_message
+
+
+class SyncIngest:
+    """
+    Buffers bulletins and mail arriving from other BBS nodes and writes them
+    in batches, so a sync storm costs one transaction per window instead of
+    one commit per record. Records already stored (same unique_id) are
+    counted as duplicates and dropped. Urgent bulletins are announced only
+    when they arrived as live posts (notify), not as backfill. A batch that fails to store is put
+    back and retried with a doubling delay, up to max_retries times.
+    """
+
+    def __init__(self, config=None):
+        self.window = 2.0
+        self.max_batch = 50
+        self.max_retries = 5
+        if config is not None:
+            self.window = config.getfloat('sync', 'ingest_window', fallback=self.window)
+            self.max_batch = config.getint('sync', 'ingest_max_batch', fallback=self.max_batch)
+            self.max_retries = config.getint('sync', 'ingest_max_retries', fallback=self.max_retries)
+
+        self.condition = threading.Condition()
+        self.flush_lock = threading.Lock()
+        self.pending_bulletins = []
+        self.pending_mail = []
+        self.first_pending_at = None
+        self.failures = 0
+        self.running = False
+        self.thread = None
+
+        self.batches = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.dropped = 0
+
+    def start(self):
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target=self._run, name='sync-ingest', daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=5):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout)
+        self.flush()
+
+    def add_bulletin(self, board, sender_short_name, subject, content, unique_id, interface, notify=True):
+        self._add(self.pending_bulletins, (board, sender_short_name, subject, content, unique_id),
+                  interface if notify else None)
+
+    def add_mail(self, sender_id, sender_short_name, recipient_id, subject, content, unique_id, interface):
+        self._add(self.pending_mail, (sender_id, sender_short_name, recipient_id, subject, content, unique_id), interface)
+
+    def _add(self, pending, record, interface):
+        with self.condition:
+            pending.append((record, interface))
+            if self.first_pending_at is None:
+                self.first_pending_at = time.monotonic()
+            self.condition.notify()
+
+    def _pending_count(self):
+        return len(self.pending_bulletins) + len(self.pending_mail)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.running:
+                    if not self._pending_count():
+                        self.condition.wait()
+                        continue
+                    # After a failed store wait window * 2^failures, however full the batch is
+                    remaining = self.first_pending_at + self.window * 2 ** self.failures - time.monotonic()
+                    if remaining <= 0 or (self._pending_count() >= self.max_batch and not self.failures):
+                        break
+                    self.condition.wait(remaining)
+                if not self.running:
+                    return
+            self.flush()
+
+    def flush(self):
+        # Callers that are about to delete a synced record flush first, so a
+        # delete can never overtake the insert it refers to.
+        with self.flush_lock:
+            with self.condition:
+                bulletins, self.pending_bulletins = self.pending_bulletins, []
+                mail, self.pending_mail = self.pending_mail, []
+                self.first_pending_at = None
+            if not bulletins and not mail:
+                return 0, 0
+
+            # Backfilled records are queued without an interface to announce on
+            notify_on = {record[-1]: interface for record, interface in bulletins if interface is not None}
+            try:
+                inserted_bulletins, inserted_mail = insert_sync_records(
+                    [record for record, _ in bulletins], [record for record, _ in mail])
+            except Exception as e:
+                self._requeue(bulletins, mail, e)
+                return 0, 0
+
+        inserted = len(inserted_bulletins) + len(inserted_mail)
+        duplicates = len(bulletins) + len(mail) - inserted
+        with self.condition:
+            self.failures = 0
+            self.batches += 1
+            self.inserted += inserted
+            self.duplicates += duplicates
+        logging.info(f"SERVER SYNC: Stored {inserted} new sync records, skipped {duplicates} duplicates")
+
+        for board, sender_short_name, subject, content, unique_id in inserted_bulletins:
+            if board.lower() == "urgent" and unique_id in notify_on:
+                notification_message = f"💥NEW URGENT BULLETIN💥\nFrom: {sender_short_name}\nTitle: {subject}"
+                send_message(notification_message, BROADCAST_NUM, notify_on[unique_id])
+        return inserted, duplicates
+
+    def _requeue(self, bulletins, mail, error):
+        count = len(bulletins) + len(mail)
+        with self.condition:
+            self.failures += 1
+            if self.failures > self.max_retries:
+                self.failures = 0
+                self.dropped += count
+                logging.error(f"SERVER SYNC: Dropping {count} sync records after {self.max_retries} failed retries: "
+                              f"{error}")
+                return
+            # Inserts are idempotent, so the whole batch is simply tried again ahead of newer records
+            self.pending_bulletins = bulletins + self.pending_bulletins
+            self.pending_mail = mail + self.pending_mail
+            self.first_pending_at = time.monotonic()
+            self.condition.notify()
+            logging.error(f"SERVER SYNC: Failed to store {count} sync records, retry {self.failures} of "
+                          f"{self.max_retries}: {error}")
+
+    def get_stats(self):
+        with self.condition:
+            return {
+                'pending': self._pending_count(),
+                'batches': self.batches,
+                'inserted': self.inserted,
+                'duplicates': self.duplicates,
+                'dropped': self.dropped,
+            }
+
+
+_sync_ingest = None
+_sync_ingest_lock = threading.Lock()
+
+
+def start_sync_ingest(config=None):
+    global _sync_ingest
+    with _sync_ingest_lock:
+        if _sync_ingest is not None:
+            _sync_ingest.stop()
+        _sync_ingest = SyncIngest(config)
+        _sync_ingest.start()
+        return _sync_ingest
+
+
+def get_sync_ingest():
+    global _sync_ingest
+    with _sync_ingest_lock:
+        if _sync_ingest is None:
+            _sync_ingest = SyncIngest()
+            _sync_ingest.start()
+        return _sync_ingest
+
+
+def stop_sync_ingest():
+    global _sync_ingest
+    with _sync_ingest_lock:
+        if _sync_ingest is not None:
+            _sync_ingest.stop()
+            _sync_ingest = None
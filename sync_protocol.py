@@ -0,0 +1,290 @@
+"""
+Framed binary format for BBS-to-BBS sync, sent as PRIVATE_APP data packets.
+
+Every fragment carries a fixed header:
+
+    magic     1 byte   0xB5
+    version   1 byte   SYNC_VERSION
+    type      1 byte   record type (see RECORD_TYPES)
+    flags     1 byte   FLAG_* bits
+    msg_id   16 bytes  the record's UUID, or a random id when it has none
+    index     1 byte   fragment index
+    count     1 byte   fragment count
+    crc32     4 bytes  CRC32 of the complete (compressed) body
+
+Fan-out frames (FLAG_PEERS) are broadcast once for several peers and carry
+the addressed peers right after the header: a count byte followed by each
+peer's 4-byte node number. Peers that are not listed ignore the frame.
+
+The body is the record's fields, each as a varint length followed by UTF-8
+(or raw bytes for the control fields listed in RAW_FIELDS), optionally
+compressed. Unlike the pipe-delimited text format, fields may
+contain any character.
+"""
+
+import logging
+import os
+import struct
+import threading
+import time
+import uuid
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+SYNC_PORT_NUM = 256  # PRIVATE_APP
+SYNC_PORT_NAME = 'PRIVATE_APP'
+SYNC_MAGIC = 0xB5
+SYNC_VERSION = 1
+
+FLAG_RECORD_ID = 0x01
+FLAG_ZLIB = 0x02
+FLAG_ZSTD = 0x04
+FLAG_PEERS = 0x08
+
+HEADER = struct.Struct('>BBBB16sBBI')
+MAX_FRAME_SIZE = 228
+MAX_FRAGMENT_BODY = MAX_FRAME_SIZE - HEADER.size
+MAX_FRAGMENTS = 255
+
+RECORD_TYPES = {
+    'BULLETIN': 1,
+    'MAIL': 2,
+    'DELETE_BULLETIN': 3,
+    'DELETE_MAIL': 4,
+    'CHANNEL': 5,
+    'DIGEST': 6,
+    'IDS': 7,
+    'WANT': 8,
+    'ACK': 9,
+    'BACKFILL_BULLETIN': 10,
+}
+RECORD_NAMES = {code: name for name, code in RECORD_TYPES.items()}
+
+# Record types whose last field is the record's unique_id
+RECORDS_WITH_ID = {'BULLETIN', 'MAIL', 'DELETE_BULLETIN', 'DELETE_MAIL', 'BACKFILL_BULLETIN'}
+
+# Control records carry raw bytes in these field positions
+RAW_FIELDS = {'DIGEST': {2}, 'IDS': {2, 3}, 'WANT': {1}, 'ACK': {0, 2}}
+
+
+class SyncProtocolError(ValueError):
+    pass
+
+
+def _encode_varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _decode_varint(data, offset):
+    value = 0
+    shift = 0
+    while True:
+        if offset >= len(data):
+            raise SyncProtocolError("Truncated varint")
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, offset
+        shift += 7
+
+
+def _encode_fields(fields):
+    out = bytearray()
+    for field in fields:
+        encoded = field if isinstance(field, bytes) else str(field).encode('utf-8')
+        out += _encode_varint(len(encoded))
+        out += encoded
+    return bytes(out)
+
+
+def _decode_fields(body, raw_fields=()):
+    fields = []
+    offset = 0
+    while offset < len(body):
+        length, offset = _decode_varint(body, offset)
+        if offset + length > len(body):
+            raise SyncProtocolError("Truncated field")
+        field = body[offset:offset + length]
+        fields.append(field if len(fields) in raw_fields else field.decode('utf-8'))
+        offset += length
+    return fields
+
+
+def _compress(body, compression):
+    if compression == 'zstd' and zstandard is not None:
+        compressed = zstandard.ZstdCompressor(level=19).compress(body)
+        flag = FLAG_ZSTD
+    elif compression in ('zlib', 'zstd'):
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+        compressed = compressor.compress(body) + compressor.flush()
+        flag = FLAG_ZLIB
+    else:
+        return body, 0
+    if len(compressed) >= len(body):
+        return body, 0
+    return compressed, flag
+
+
+def _decompress(body, flags):
+    if flags & FLAG_ZSTD:
+        if zstandard is None:
+            raise SyncProtocolError("zstd-compressed sync frame received but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(body)
+    if flags & FLAG_ZLIB:
+        return zlib.decompress(body, -15)
+    return body
+
+
+def _encode_peers(peers):
+    if len(peers) > 255:
+        raise SyncProtocolError("Too many peers for one fan-out frame")
+    return bytes([len(peers)]) + b''.join(struct.pack('>I', peer) for peer in peers)
+
+
+def decode_peers(frame):
+    """Returns the node numbers a fan-out frame is addressed to, or None for a unicast frame."""
+    if len(frame) < HEADER.size or not frame[3] & FLAG_PEERS:
+        return None
+    count = frame[HEADER.size] if len(frame) > HEADER.size else 0
+    end = HEADER.size + 1 + 4 * count
+    if len(frame) < end:
+        raise SyncProtocolError("Truncated peer list")
+    return [peer for (peer,) in struct.iter_unpack('>I', frame[HEADER.size + 1:end])]
+
+
+def _payload_offset(frame):
+    peers = decode_peers(frame)
+    return HEADER.size if peers is None else HEADER.size + 1 + 4 * len(peers)
+
+
+def encode_record(record_type, fields, compression='zlib', peers=None):
+    """
+    Encode a sync record into a list of frames ready for sendData. When `peers`
+    (node numbers) is given the frames are fan-out frames addressed to them.
+    """
+    code = RECORD_TYPES[record_type]
+    fields = list(fields)
+    flags = 0
+    peer_block = b''
+    if peers is not None:
+        peer_block = _encode_peers(peers)
+        flags |= FLAG_PEERS
+    msg_id = None
+    if record_type in RECORDS_WITH_ID and fields:
+        try:
+            record_id = uuid.UUID(fields[-1])
+        except ValueError:
+            record_id = None
+        # Only canonical UUID strings round-trip unchanged through 16 bytes
+        if record_id is not None and str(record_id) == fields[-1]:
+            msg_id = record_id.bytes
+            fields = fields[:-1]
+            flags |= FLAG_RECORD_ID
+    if msg_id is None:
+        msg_id = os.urandom(16)
+
+    body, compression_flag = _compress(_encode_fields(fields), compression)
+    flags |= compression_flag
+    crc = zlib.crc32(body)
+
+    chunk_size = MAX_FRAGMENT_BODY - len(peer_block)
+    if chunk_size <= 0:
+        raise SyncProtocolError("Peer list leaves no room for a payload")
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)] or [b'']
+    if len(chunks) > MAX_FRAGMENTS:
+        raise SyncProtocolError(f"{record_type} record too large to sync ({len(body)} bytes)")
+    return [HEADER.pack(SYNC_MAGIC, SYNC_VERSION, code, flags, msg_id, index, len(chunks), crc) + peer_block + chunk
+            for index, chunk in enumerate(chunks)]
+
+
+def decode_header(frame):
+    if len(frame) < HEADER.size:
+        raise SyncProtocolError("Frame shorter than header")
+    magic, version, code, flags, msg_id, index, count, crc = HEADER.unpack_from(frame)
+    if magic != SYNC_MAGIC:
+        raise SyncProtocolError("Bad magic")
+    if version != SYNC_VERSION:
+        raise SyncProtocolError(f"Unsupported sync version {version}")
+    if count == 0 or index >= count:
+        raise SyncProtocolError("Bad fragment index")
+    return code, flags, msg_id, index, count, crc
+
+
+def decode_body(code, flags, msg_id, body):
+    record_type = RECORD_NAMES.get(code)
+    if record_type is None:
+        raise SyncProtocolError(f"Unknown record type {code}")
+    fields = _decode_fields(_decompress(body, flags), RAW_FIELDS.get(record_type, ()))
+    if flags & FLAG_RECORD_ID:
+        fields.append(str(uuid.UUID(bytes=msg_id)))
+    return record_type, fields
+
+
+class SyncReassembler:
+    """Collects fragments per (sender, msg_id) until a record is complete."""
+
+    def __init__(self, timeout=600, max_pending=256):
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def add_fragment(self, sender, frame):
+        """Returns (record_type, fields) once all fragments have arrived, else None."""
+        try:
+            code, flags, msg_id, index, count, crc = decode_header(frame)
+            offset = _payload_offset(frame)
+        except SyncProtocolError as e:
+            logging.warning(f"SERVER SYNC: Dropping malformed sync frame from {sender}: {e}")
+            return None
+
+        key = (sender, msg_id)
+        now = time.monotonic()
+        with self.lock:
+            self._expire(now)
+            entry = self.pending.get(key)
+            if entry is None or entry['count'] != count or entry['crc'] != crc:
+                entry = self.pending[key] = {'count': count, 'crc': crc, 'code': code, 'flags': flags,
+                                             'parts': {}, 'updated': now}
+            entry['parts'][index] = frame[offset:]
+            entry['updated'] = now
+            if len(entry['parts']) < count:
+                return None
+            del self.pending[key]
+
+        body = b''.join(entry['parts'][i] for i in range(count))
+        if zlib.crc32(body) != crc:
+            logging.warning(f"SERVER SYNC: Checksum mismatch on sync record from {sender}, dropping")
+            return None
+        try:
+            return decode_body(code, flags, msg_id, body)
+        except Exception as e:
+            logging.warning(f"SERVER SYNC: Could not decode sync record from {sender}: {e}")
+            return None
+
+    def received_indexes(self, sender, msg_id):
+        """Fragment indexes held so far for an incomplete record."""
+        with self.lock:
+            entry = self.pending.get((sender, msg_id))
+            return set(entry['parts']) if entry else set()
+
+    def _expire(self, now):
+        expired = [key for key, entry in self.pending.items() if now - entry['updated'] > self.timeout]
+        for key in expired:
+            del self.pending[key]
+        while len(self.pending) >= self.max_pending:
+            oldest = min(self.pending, key=lambda k: self.pending[k]['updated'])
+            del self.pending[oldest]
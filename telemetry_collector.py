@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Long-running collector that records node telemetry, link quality and
+positions into telemetry.db (see telemetry_store.py).
+
+Every packet heard adds a sample for its sender (SNR, RSSI and hop count,
+plus device metrics or position when the packet carries them), and the NodeDB
+is snapshotted periodically so battery levels of quiet nodes are kept too.
+
+Usage: python3 telemetry_collector.py [--host 192.168.1.87] [--port 4403] [--db telemetry.db]
+"""
+
+import argparse
+import threading
+import time
+
+import meshtastic
+import meshtastic.tcp_interface
+from pubsub import pub
+
+from mesh_topology import packet_hops
+from telemetry_store import TelemetryStore
+
+FLUSH_INTERVAL = 10
+ROLLUP_INTERVAL = 300
+SNAPSHOT_INTERVAL = 900
+
+pending = []
+pending_lock = threading.Lock()
+
+
+def packet_sample(packet):
+    values = {
+        'snr': packet.get('rxSnr'),
+        'rssi': packet.get('rxRssi'),
+    }
+    hops = packet_hops(packet)
+    if hops is not None:
+        values['hops'] = hops
+
+    decoded = packet.get('decoded', {})
+    device_metrics = decoded.get('telemetry', {}).get('deviceMetrics')
+    if device_metrics:
+        values.update(battery=device_metrics.get('batteryLevel'), voltage=device_metrics.get('voltage'),
+                      channel_util=device_metrics.get('channelUtilization'),
+                      air_util_tx=device_metrics.get('airUtilTx'))
+    position = decoded.get('position')
+    if position:
+        values.update(latitude=position.get('latitude'), longitude=position.get('longitude'),
+                      altitude=position.get('altitude'))
+    return values
+
+
+def node_sample(node):
+    device_metrics = node.get('deviceMetrics', {})
+    position = node.get('position', {})
+    return {
+        'battery': device_metrics.get('batteryLevel'),
+        'voltage': device_metrics.get('voltage'),
+        'channel_util': device_metrics.get('channelUtilization'),
+        'air_util_tx': device_metrics.get('airUtilTx'),
+        'latitude': position.get('latitude'),
+        'longitude': position.get('longitude'),
+        'altitude': position.get('altitude'),
+    }
+
+
+def onReceive(packet, interface):
+    from_id = packet.get('fromId')
+    if from_id is None:
+        return
+    with pending_lock:
+        pending.append((from_id, time.time(), packet_sample(packet)))
+
+
+def snapshot_nodes(interface):
+    now = time.time()
+    samples = [(node_id, now, node_sample(node)) for node_id, node in (interface.nodes or {}).items()
+               if node.get('deviceMetrics') or node.get('position')]
+    with pending_lock:
+        pending.extend(samples)
+
+
+def flush(store):
+    global pending
+    with pending_lock:
+        samples, pending = pending, []
+    return store.add_samples(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Meshtastic node telemetry collector")
+    parser.add_argument("--host", default="192.168.1.87", help="Meshtastic device IP address")
+    parser.add_argument("--port", type=int, default=4403, help="Meshtastic TCP port")
+    parser.add_argument("--db", default="telemetry.db", help="Telemetry database file")
+    args = parser.parse_args()
+
+    store = TelemetryStore(args.db)
+    interface = meshtastic.tcp_interface.TCPInterface(args.host, args.port)
+    pub.subscribe(onReceive, "meshtastic.receive")
+
+    last_rollup = last_snapshot = 0
+    try:
+        print("Collecting telemetry. Press Ctrl+C to exit.")
+        while True:
+            now = time.time()
+            if now - last_snapshot >= SNAPSHOT_INTERVAL:
+                snapshot_nodes(interface)
+                last_snapshot = now
+            written = flush(store)
+            if now - last_rollup >= ROLLUP_INTERVAL:
+                store.rollup(now)
+                last_rollup = now
+                print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} rolled up samples ({written} written this cycle)")
+            time.sleep(FLUSH_INTERVAL)
+    except KeyboardInterrupt:
+        print("\nScript terminated by user.")
+    finally:
+        flush(store)
+        store.rollup()
+        store.close()
+        interface.close()
+        print("Interface closed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Time-series store for node telemetry, link quality and position history.
+
+Samples land in samples_raw and are rolled up into 5 minute and 1 hour
+buckets that keep the sum, count, min and max of every metric, so averages
+stay exact when 5 minute buckets are combined into hours. Each level has its
+own retention, which keeps the database bounded however long the collector
+runs.
+"""
+
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+METRICS = ('battery', 'voltage', 'channel_util', 'air_util_tx', 'snr', 'rssi', 'hops', 'latitude', 'longitude',
+           'altitude')
+
+# (table, bucket seconds, source table)
+ROLLUPS = (
+    ('samples_5m', 300, 'samples_raw'),
+    ('samples_1h', 3600, 'samples_5m'),
+)
+
+DEFAULT_RETENTION = {
+    'samples_raw': 2 * 86400,
+    'samples_5m': 30 * 86400,
+    'samples_1h': 730 * 86400,
+}
+
+
+class TelemetryStore:
+    def __init__(self, path='telemetry.db', retention=None):
+        self.path = path
+        self.retention = dict(DEFAULT_RETENTION, **(retention or {}))
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self._create_schema()
+
+    def _create_schema(self):
+        columns = ", ".join(f"{metric} REAL" for metric in METRICS)
+        rollup_columns = ", ".join(f"{metric}_sum REAL, {metric}_count INTEGER, {metric}_min REAL, {metric}_max REAL"
+                                   for metric in METRICS)
+        with self.conn:
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS samples_raw (node_id TEXT NOT NULL, ts INTEGER NOT NULL, "
+                              f"{columns})")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_samples_raw_node_ts ON samples_raw (node_id, ts)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_samples_raw_ts ON samples_raw (ts)")
+            for table, _, _ in ROLLUPS:
+                self.conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (node_id TEXT NOT NULL, ts INTEGER NOT NULL, "
+                                  f"{rollup_columns}, PRIMARY KEY (node_id, ts))")
+                self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_ts ON {table} (ts)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS rollup_state (level TEXT PRIMARY KEY, "
+                              "rolled_until INTEGER NOT NULL)")
+
+    def close(self):
+        self.conn.close()
+
+    def add_samples(self, samples):
+        """samples: iterable of (node_id, ts, {metric: value}) with any subset of METRICS."""
+        rows = [(node_id, int(ts), *(values.get(metric) for metric in METRICS)) for node_id, ts, values in samples]
+        if not rows:
+            return 0
+        placeholders = ", ".join("?" * (len(METRICS) + 2))
+        with self.lock, self.conn:
+            self.conn.executemany(f"INSERT INTO samples_raw (node_id, ts, {', '.join(METRICS)}) "
+                                  f"VALUES ({placeholders})", rows)
+        return len(rows)
+
+    def rollup(self, now=None):
+        """Aggregates every closed bucket not yet rolled up, then applies retention."""
+        now = int(now if now is not None else time.time())
+        with self.lock, self.conn:
+            for table, seconds, source in ROLLUPS:
+                row = self.conn.execute("SELECT rolled_until FROM rollup_state WHERE level = ?", (table,)).fetchone()
+                rolled_until = row[0] if row else 0
+                until = now // seconds * seconds
+                if until <= rolled_until:
+                    continue
+                if source == 'samples_raw':
+                    aggregates = ", ".join(f"SUM({m}), COUNT({m}), MIN({m}), MAX({m})" for m in METRICS)
+                else:
+                    aggregates = ", ".join(f"SUM({m}_sum), SUM({m}_count), MIN({m}_min), MAX({m}_max)"
+                                           for m in METRICS)
+                columns = ", ".join(f"{m}_sum, {m}_count, {m}_min, {m}_max" for m in METRICS)
+                self.conn.execute(
+                    f"INSERT OR REPLACE INTO {table} (node_id, ts, {columns}) "
+                    f"SELECT node_id, ts / {seconds} * {seconds} AS bucket, {aggregates} FROM {source} "
+                    f"WHERE ts >= ? AND ts < ? GROUP BY node_id, bucket", (rolled_until, until))
+                self.conn.execute("INSERT OR REPLACE INTO rollup_state (level, rolled_until) VALUES (?, ?)",
+                                  (table, until))
+            for table, keep in self.retention.items():
+                if keep:
+                    self.conn.execute(f"DELETE FROM {table} WHERE ts < ?", (now - keep,))
+
+    def nodes(self):
+        with self.lock:
+            return [row[0] for row in self.conn.execute(
+                "SELECT node_id FROM samples_1h UNION SELECT node_id FROM samples_5m "
+                "UNION SELECT node_id FROM samples_raw")]
+
+    def pick_resolution(self, start, end, now=None):
+        """The finest level whose retention still covers `start` and whose row count stays reasonable."""
+        now = now if now is not None else time.time()
+        span = end - start
+        if span <= 86400 and now - start <= self.retention['samples_raw']:
+            return 'raw'
+        if span <= 30 * 86400 and now - start <= self.retention['samples_5m']:
+            return '5m'
+        return '1h'
+
+    def query(self, node_id, metric, start, end=None, resolution='auto'):
+        """
+        Returns (timestamps, values) as NumPy arrays for one node and metric.
+        Rolled-up levels return the bucket average; use query_range for min/max.
+        """
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric {metric}")
+        end = end if end is not None else time.time()
+        if resolution == 'auto':
+            resolution = self.pick_resolution(start, end)
+        if resolution == 'raw':
+            sql = (f"SELECT ts, {metric} FROM samples_raw WHERE node_id = ? AND ts >= ? AND ts < ? "
+                   f"AND {metric} IS NOT NULL ORDER BY ts")
+        else:
+            table = 'samples_5m' if resolution == '5m' else 'samples_1h'
+            sql = (f"SELECT ts, {metric}_sum / {metric}_count FROM {table} WHERE node_id = ? AND ts >= ? AND ts < ? "
+                   f"AND {metric}_count > 0 ORDER BY ts")
+        with self.lock:
+            rows = self.conn.execute(sql, (node_id, int(start), int(end))).fetchall()
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        timestamps, values = zip(*rows)
+        return np.asarray(timestamps, dtype=np.int64), np.asarray(values, dtype=np.float64)
+
+    def query_range(self, node_id, metric, start, end=None, resolution='1h'):
+        """Returns (timestamps, mean, minimum, maximum) arrays from a rolled-up level."""
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric {metric}")
+        end = end if end is not None else time.time()
+        table = 'samples_5m' if resolution == '5m' else 'samples_1h'
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT ts, {metric}_sum / {metric}_count, {metric}_min, {metric}_max FROM {table} "
+                f"WHERE node_id = ? AND ts >= ? AND ts < ? AND {metric}_count > 0 ORDER BY ts",
+                (node_id, int(start), int(end))).fetchall()
+        data = np.asarray(rows, dtype=np.float64).reshape(-1, 4)
+        return data[:, 0].astype(np.int64), data[:, 1], data[:, 2], data[:, 3]
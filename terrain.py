@@ -0,0 +1,245 @@
+"""
+SRTM terrain as memory-mapped NumPy rasters, shared by the LOS and heatmap
+scripts.
+
+The first time a tile is needed it is fetched through SRTM.py (which
+downloads and caches the .hgt file) and written to CACHE_DIR as a native
+int16 .npy file. After that np.load(..., mmap_mode='r') opens it without
+parsing, and the OS pages in only the parts a lookup touches. Lookups take
+whole arrays of coordinates (nearest, which matches SRTM.py, or bilinear),
+and preload() builds the mosaic for a bounding box around the points of
+interest once.
+"""
+
+import math
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'meshtastic-terrain')
+DEFAULT_MARGIN_KM = 20
+# Mosaics kept by Terrain.grid, so lookups that alternate between areas don't rebuild them
+MAX_GRIDS = 4
+
+# SRTM.py treats samples outside this range as voids
+MIN_VALID = -1000
+MAX_VALID = 10000
+VOID = -32768
+
+
+def tile_name(lat0, lon0):
+    return f"{'N' if lat0 >= 0 else 'S'}{abs(lat0):02d}{'E' if lon0 >= 0 else 'W'}{abs(lon0):03d}"
+
+
+def bbox_around(points, margin_km=DEFAULT_MARGIN_KM):
+    """(min_lat, min_lon, max_lat, max_lon) covering {'lat', 'lon'} points plus margin_km on every side."""
+    lats = [point['lat'] for point in points]
+    lons = [point['lon'] for point in points]
+    margin_lat = margin_km / 111.32
+    margin_lon = margin_km / (111.32 * max(math.cos(math.radians(max(abs(lat) for lat in lats))), 0.01))
+    return min(lats) - margin_lat, min(lons) - margin_lon, max(lats) + margin_lat, max(lons) + margin_lon
+
+
+def _values(flat, index):
+    values = np.asarray(flat.take(index), dtype=np.float64)
+    return np.where((values < MIN_VALID) | (values > MAX_VALID), np.nan, values)
+
+
+class ElevationGrid:
+    """
+    SRTM tiles for a bounding box laid side by side in one int16 array (a
+    single tile is used as is, e.g. straight from its memory map). Tiles keep
+    their own square_side rows and columns (SRTM tiles duplicate their
+    edges), so a lookup is the tile-local index SRTM.py computes plus the
+    tile's offset. Voids and missing tiles come back as NaN.
+    """
+
+    def __init__(self, data, south, west, north, east, side):
+        self.data = data
+        self.south, self.west, self.north, self.east = south, west, north, east
+        self.side = side
+
+    @property
+    def bounds(self):
+        return self.south, self.west, self.north, self.east, self.side
+
+    @classmethod
+    def from_tiles(cls, tiles, south, west, north, east, side):
+        """tiles: {(lat0, lon0): side x side int16 array, or None for a missing tile}."""
+        if south == north and west == east and tiles.get((south, west)) is not None:
+            return cls(tiles[(south, west)], south, west, north, east, side)
+        rows, columns = north - south + 1, east - west + 1
+        data = np.full((rows * side, columns * side), VOID, dtype=np.int16)
+        for (lat0, lon0), tile in tiles.items():
+            if tile is not None:
+                row, column = (north - lat0) * side, (lon0 - west) * side
+                data[row:row + side, column:column + side] = tile
+        return cls(data, south, west, north, east, side)
+
+    @classmethod
+    def from_srtm(cls, srtm_data, min_lat, min_lon, max_lat, max_lon):
+        """Loads every tile touching the box through an SRTM.py GeoElevationData, without the .npy cache."""
+        south, west = math.floor(min_lat), math.floor(min_lon)
+        north, east = math.floor(max_lat), math.floor(max_lon)
+        tiles = {}
+        side = None
+        for lat0 in range(south, north + 1):
+            for lon0 in range(west, east + 1):
+                elevation_file = srtm_data.get_file(lat0 + 0.5, lon0 + 0.5)
+                if elevation_file is None:
+                    tiles[(lat0, lon0)] = None
+                    continue
+                if side is not None and elevation_file.square_side != side:
+                    raise ValueError("Tiles with different resolutions (SRTM1 and SRTM3) in one area are not supported")
+                side = elevation_file.square_side
+                tiles[(lat0, lon0)] = np.frombuffer(elevation_file.data, dtype='>i2').reshape(side, side)
+        if side is None:
+            raise ValueError(f"No SRTM data for {min_lat}..{max_lat}, {min_lon}..{max_lon}")
+        return cls.from_tiles(tiles, south, west, north, east, side)
+
+    def elevations(self, lats, lons, method='nearest'):
+        """
+        Elevations for arrays of coordinates, NaN where SRTM.py would return None.
+        'nearest' matches SRTM.py's lookup; 'bilinear' interpolates the four
+        surrounding samples of the tile.
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        lat0 = np.floor(lats)
+        lon0 = np.floor(lons)
+        scale = float(self.side - 1)
+        row_f = (lat0 + 1 - lats) * scale
+        column_f = (lons - lon0) * scale
+        row = np.floor(row_f)
+        column = np.floor(column_f)
+
+        inside = (lat0 >= self.south) & (lat0 <= self.north) & (lon0 >= self.west) & (lon0 <= self.east)
+        all_inside = inside.all()
+        # Row and column in the mosaic: tile offset plus the tile-local index
+        mosaic_row = (self.north - lat0) * self.side + row
+        mosaic_column = (lon0 - self.west) * self.side + column
+        if not all_inside:
+            mosaic_row = np.where(inside, mosaic_row, 0)
+            mosaic_column = np.where(inside, mosaic_column, 0)
+        width = self.data.shape[1]
+        index = mosaic_row.astype(np.intp) * width + mosaic_column.astype(np.intp)
+        flat = self.data.reshape(-1)
+
+        if method == 'nearest':
+            result = _values(flat, index)
+        elif method == 'bilinear':
+            last = self.side - 1
+            down = np.where(row < last, width, 0)
+            right = np.where(column < last, 1, 0)
+            dy = row_f - row
+            dx = column_f - column
+            top = _values(flat, index) * (1 - dx) + _values(flat, index + right) * dx
+            bottom = _values(flat, index + down) * (1 - dx) + _values(flat, index + down + right) * dx
+            result = top * (1 - dy) + bottom * dy
+        else:
+            raise ValueError(f"Unknown interpolation method {method}")
+        return result if all_inside else np.where(inside, result, np.nan)
+
+
+class Terrain:
+    """
+    Drop-in replacement for srtm.get_data() in the scripts: get_elevation()
+    behaves like SRTM.py's, get_elevations() works on arrays, and grid()
+    returns the ElevationGrid los_engine samples.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, srtm_data=None):
+        self.cache_dir = cache_dir
+        self._srtm_data = srtm_data
+        self.tiles = {}
+        self.lock = threading.Lock()
+        self.grids = OrderedDict()
+        self.grids_lock = threading.Lock()
+
+    @property
+    def srtm_data(self):
+        if self._srtm_data is None:
+            from srtm import get_data
+            self._srtm_data = get_data()
+        return self._srtm_data
+
+    def tile(self, lat0, lon0):
+        """The (lat0, lon0) tile as a read-only int16 memory map, or None where SRTM has no data."""
+        key = (lat0, lon0)
+        with self.lock:
+            if key not in self.tiles:
+                self.tiles[key] = self._load_tile(lat0, lon0)
+            return self.tiles[key]
+
+    def _load_tile(self, lat0, lon0):
+        path = os.path.join(self.cache_dir, tile_name(lat0, lon0) + '.npy')
+        if not os.path.exists(path):
+            elevation_file = self.srtm_data.get_file(lat0 + 0.5, lon0 + 0.5)
+            if elevation_file is None:
+                return None
+            side = elevation_file.square_side
+            tile = np.frombuffer(elevation_file.data, dtype='>i2').reshape(side, side).astype(np.int16)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Write under a temporary name so a concurrent reader never maps a half-written file
+            partial = f"{path}.{os.getpid()}.partial.npy"
+            np.save(partial, tile)
+            os.replace(partial, path)
+        return np.load(path, mmap_mode='r')
+
+    def grid(self, min_lat, min_lon, max_lat, max_lon):
+        """ElevationGrid covering the box; the last MAX_GRIDS mosaics are reused while one covers the request."""
+        south, west = math.floor(min_lat), math.floor(min_lon)
+        north, east = math.floor(max_lat), math.floor(max_lon)
+        with self.grids_lock:
+            for key, grid in reversed(self.grids.items()):
+                if grid.south <= south and grid.west <= west and grid.north >= north and grid.east >= east:
+                    self.grids.move_to_end(key)
+                    return grid
+        tiles = {(lat0, lon0): self.tile(lat0, lon0)
+                 for lat0 in range(south, north + 1) for lon0 in range(west, east + 1)}
+        sides = {tile.shape[0] for tile in tiles.values() if tile is not None}
+        if not sides:
+            raise ValueError(f"No SRTM data for {min_lat}..{max_lat}, {min_lon}..{max_lon}")
+        if len(sides) > 1:
+            raise ValueError("Tiles with different resolutions (SRTM1 and SRTM3) in one area are not supported")
+        grid = ElevationGrid.from_tiles(tiles, south, west, north, east, sides.pop())
+        with self.grids_lock:
+            self.grids[(south, west, north, east)] = grid
+            while len(self.grids) > MAX_GRIDS:
+                self.grids.popitem(last=False)
+        return grid
+
+    def preload(self, min_lat, min_lon, max_lat, max_lon):
+        """Converts (on first use) and maps every tile in the box, and builds its mosaic."""
+        return self.grid(min_lat, min_lon, max_lat, max_lon)
+
+    def preload_points(self, points, margin_km=DEFAULT_MARGIN_KM):
+        return self.preload(*bbox_around(points, margin_km))
+
+    def get_elevations(self, lats, lons, method='nearest'):
+        """Elevations for arrays of coordinates; NaN for voids and areas without data."""
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        if lats.size == 0:
+            return np.empty(lats.shape)
+        grid = self.grid(np.nanmin(lats), np.nanmin(lons), np.nanmax(lats), np.nanmax(lons))
+        return grid.elevations(lats, lons, method)
+
+    def get_elevation(self, latitude, longitude, method='nearest'):
+        """One elevation, None where SRTM.py would return None."""
+        try:
+            elevation = self.get_elevations([latitude], [longitude], method)[0]
+        except ValueError:
+            return None
+        if np.isnan(elevation):
+            return None
+        return int(elevation) if method == 'nearest' else float(elevation)
+
+
+def grid_for(source, min_lat, min_lon, max_lat, max_lon):
+    """ElevationGrid for the box from a Terrain, or straight from an SRTM.py GeoElevationData."""
+    if isinstance(source, Terrain):
+        return source.grid(min_lat, min_lon, max_lat, max_lon)
+    return ElevationGrid.from_srtm(source, min_lat, min_lon, max_lat, max_lon)
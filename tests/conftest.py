@@ -0,0 +1,32 @@
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The BBS modules read config.ini from the working directory when they are imported
+CONFIG = """[menu]
+main_menu_items = Q,B,U,X
+bbs_menu_items = M,B,C,J,X
+utilities_menu_items = S,F,W,X
+"""
+WORKDIR = tempfile.mkdtemp(prefix='bbs-tests-')
+with open(os.path.join(WORKDIR, 'config.ini'), 'w') as config_file:
+    config_file.write(CONFIG)
+os.chdir(WORKDIR)
+atexit.register(shutil.rmtree, WORKDIR, True)
+
+import db_operations  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh bulletins.db in tmp_path for the current thread's connection."""
+    db_operations.close_db_connection()
+    monkeypatch.setattr(db_operations, 'DB_FILE', str(tmp_path / 'bulletins.db'))
+    yield db_operations.get_db_connection()
+    db_operations.close_db_connection()
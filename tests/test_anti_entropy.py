@@ -0,0 +1,211 @@
+import sqlite3
+from collections import Counter, deque
+from functools import reduce
+
+import pytest
+
+import anti_entropy
+import db_operations
+from anti_entropy import FANOUT, KEY_SIZE, _child_digests, record_key
+
+
+class Interface:
+    def __init__(self, peers):
+        self.bbs_nodes = peers
+
+
+class Mesh:
+    """Two BBS nodes, each with its own database, exchanging sync records through an in-memory queue."""
+
+    def __init__(self, tmp_path, monkeypatch):
+        self.connections = {}
+        for node in ('A', 'B'):
+            self.connections[node] = sqlite3.connect(str(tmp_path / f'{node}.db'))
+        self.interfaces = {'A': Interface(['B']), 'B': Interface(['A'])}
+        self.queue = deque()
+        self.traffic = Counter()
+        self.current = None
+        for node in self.connections:
+            self.use(node)
+            db_operations.initialize_database()
+
+        monkeypatch.setattr(anti_entropy, 'send_sync_frames', self._sender)
+        for name, record_type in [('send_mail_to_bbs_nodes', 'MAIL'),
+                                  ('send_delete_bulletin_to_bbs_nodes', 'DELETE_BULLETIN'),
+                                  ('send_delete_mail_to_bbs_nodes', 'DELETE_MAIL')]:
+            monkeypatch.setattr(anti_entropy, name, self._record_sender(record_type))
+
+    def use(self, node):
+        self.current = node
+        db_operations.thread_local.connection = self.connections[node]
+
+    def _sender(self, record_type, fields, peers, interface):
+        for peer in peers:
+            self.queue.append((self.current, peer, record_type, list(fields)))
+            self.traffic[record_type] += 1
+
+    def _record_sender(self, record_type):
+        def send(*args):
+            *fields, peers, interface = args
+            self._sender(record_type, fields, peers, interface)
+        return send
+
+    def round(self, node):
+        self.use(node)
+        anti_entropy.run_round(self.interfaces[node])
+        while self.queue:
+            sender, node, record_type, fields = self.queue.popleft()
+            self.use(node)
+            interface = self.interfaces[node]
+            if record_type == 'DIGEST':
+                anti_entropy.handle_digest(fields, sender, interface)
+            elif record_type == 'IDS':
+                anti_entropy.handle_ids(fields, sender, interface)
+            elif record_type == 'WANT':
+                anti_entropy.handle_want(fields, sender, interface)
+            elif record_type == 'BACKFILL_BULLETIN':
+                db_operations.insert_sync_records([tuple(fields)], [])
+            elif record_type == 'MAIL':
+                db_operations.insert_sync_records([], [tuple(fields)])
+            elif record_type == 'DELETE_BULLETIN':
+                db_operations.delete_bulletin_by_unique_id(fields[0], [], interface)
+            elif record_type == 'DELETE_MAIL':
+                record = db_operations.get_mail_by_unique_id(fields[0])
+                if record:
+                    db_operations.delete_mail(fields[0], record[2], [], interface)
+
+    def state(self, node):
+        self.use(node)
+        return ({unique_id for _, unique_id in db_operations.get_bulletin_keys('General')},
+                {unique_id for _, unique_id in db_operations.get_mail_keys()})
+
+    def close(self):
+        db_operations.thread_local.__dict__.pop('connection', None)
+        for conn in self.connections.values():
+            conn.close()
+
+
+@pytest.fixture
+def mesh(tmp_path, monkeypatch):
+    mesh = Mesh(tmp_path, monkeypatch)
+    yield mesh
+    mesh.close()
+
+
+def test_record_key_is_stable():
+    assert record_key('abc') == record_key('abc')
+    assert len(record_key('abc')) == KEY_SIZE
+    assert record_key('abc') != record_key('abd')
+
+
+def test_child_digests_xor_keys_by_next_nibble():
+    keys = [record_key(f'id-{i}') for i in range(200)]
+    digests = _child_digests(keys, '')
+    assert len(digests) == FANOUT
+    for nibble, digest in enumerate(digests):
+        child = [key for key in keys if int(key.hex()[0], 16) == nibble]
+        expected = reduce(lambda a, b: a ^ b, (int.from_bytes(key, 'big') for key in child), 0)
+        assert digest == expected.to_bytes(KEY_SIZE, 'big')
+    assert _child_digests(reversed(keys), '') == digests
+
+
+def test_child_digests_only_differ_where_keys_differ():
+    keys = [record_key(f'id-{i}') for i in range(200)]
+    extra = record_key('extra')
+    ours, theirs = _child_digests(keys, ''), _child_digests(keys + [extra], '')
+    differing = [nibble for nibble in range(FANOUT) if ours[nibble] != theirs[nibble]]
+    assert differing == [int(extra.hex()[0], 16)]
+
+
+def test_missing_records_are_exchanged_both_ways(mesh):
+    mesh.use('A')
+    for i in range(120):
+        db_operations.add_bulletin('General', 'AAAA', f'a{i}', 'content', [], None)
+        db_operations.add_mail('!1', 'AAAA', '!2', f'a{i}', 'content', [], None)
+    mesh.use('B')
+    for i in range(5):
+        db_operations.add_bulletin('General', 'BBBB', f'b{i}', 'content', [], None)
+
+    mesh.round('A')
+
+    assert mesh.state('A') == mesh.state('B')
+    assert len(mesh.state('A')[0]) == 125 and len(mesh.state('A')[1]) == 120
+
+
+def test_in_sync_nodes_only_exchange_root_digests(mesh):
+    mesh.use('A')
+    for i in range(50):
+        db_operations.add_bulletin('General', 'AAAA', f'a{i}', 'content', [], None)
+    mesh.round('A')
+    mesh.traffic.clear()
+
+    mesh.round('A')
+    mesh.round('B')
+
+    assert mesh.traffic == Counter({'DIGEST': 4})
+
+
+def test_deletes_propagate_and_converge(mesh):
+    mesh.use('A')
+    bulletins = [db_operations.add_bulletin('General', 'AAAA', f'a{i}', 'content', [], None) for i in range(100)]
+    mail = [db_operations.add_mail('!1', 'AAAA', '!2', f'a{i}', 'content', [], None) for i in range(100)]
+    mesh.round('A')
+
+    for unique_id in bulletins[:60]:
+        db_operations.delete_bulletin_by_unique_id(unique_id, [], None)
+    for unique_id in mail[:60]:
+        db_operations.delete_mail(unique_id, '!2', [], None)
+    mesh.use('B')
+    db_operations.delete_bulletin_by_unique_id(bulletins[99], [], None)
+
+    mesh.round('B')
+
+    assert mesh.state('A') == mesh.state('B') == (set(bulletins[60:99]), set(mail[60:]))
+    mesh.traffic.clear()
+    mesh.round('A')
+    assert mesh.traffic == Counter({'DIGEST': 2})
+
+
+def test_tombstones_are_scoped_to_their_board(mesh):
+    mesh.use('A')
+    general = db_operations.add_bulletin('General', 'AAAA', 'subject', 'content', [], None)
+    other = db_operations.add_bulletin('Other', 'AAAA', 'subject', 'content', [], None)
+    db_operations.delete_bulletin_by_unique_id(general, [], None)
+    db_operations.delete_bulletin_by_unique_id(other, [], None)
+
+    assert [unique_id for _, unique_id in db_operations.get_tombstone_keys('bulletin', 'General')] == [general]
+    assert [unique_id for _, unique_id in db_operations.get_tombstone_keys('bulletin', 'Other')] == [other]
+    assert db_operations.get_tombstone_keys('mail') == []
+    assert set(anti_entropy._tombstones_under('B:General', '').values()) == {general}
+
+
+def test_prune_tombstones_by_age(mesh):
+    mesh.use('A')
+    conn = db_operations.get_db_connection()
+    with conn:
+        conn.execute("INSERT INTO tombstones (unique_id, kind, deleted_at) VALUES ('old', 'mail', '2000-01-01 00:00')")
+        db_operations.add_tombstone(conn.cursor(), 'new', 'mail')
+
+    assert db_operations.prune_tombstones(30) == 1
+    assert [unique_id for _, unique_id in db_operations.get_tombstone_keys('mail')] == ['new']
+
+
+def test_key_ranges_read_only_the_requested_prefix(mesh):
+    mesh.use('A')
+    unique_ids = [db_operations.add_mail('!1', 'AAAA', '!2', f's{i}', 'content', [], None) for i in range(300)]
+    keys = {record_key(unique_id): unique_id for unique_id in unique_ids}
+    prefix = next(iter(keys)).hex()[:2]
+
+    assert anti_entropy._keys_under('M', '') == keys
+    assert anti_entropy._keys_under('M', prefix) == {key: unique_id for key, unique_id in keys.items()
+                                                     if key.hex().startswith(prefix)}
+
+
+def test_want_pushes_only_the_wanted_records(mesh):
+    mesh.use('A')
+    unique_ids = [db_operations.add_mail('!1', 'AAAA', '!2', f's{i}', 'content', [], None) for i in range(50)]
+    wanted = sorted(record_key(unique_id) for unique_id in unique_ids[:3])
+
+    anti_entropy.handle_want(['M', b''.join(wanted)], 'B', mesh.interfaces['A'])
+
+    assert sorted(fields[-1] for _, _, _, fields in mesh.queue) == sorted(unique_ids[:3])
@@ -0,0 +1,88 @@
+import pytest
+
+from command_router import CommandRouter
+
+
+@pytest.fixture
+def calls():
+    return []
+
+
+@pytest.fixture
+def router(calls):
+    def handler(name):
+        return lambda sender_id, message, state, interface: calls.append((name, message))
+
+    router = CommandRouter()
+    router.add_quick_command('cm', handler('check mail'))
+    router.add_quick_command('cb,,', handler('check bulletins'))
+    router.add_quick_command('c', handler('c'))
+    router.add_menu('main', {'b': lambda sender_id, interface: calls.append(('main b', None))})
+    router.add_menu('bbs', {'m': lambda sender_id, interface: calls.append(('bbs m', None))})
+    router.add_menu('board', {'r': lambda sender_id, interface, state: calls.append(('board r', state['board']))},
+                    with_state=True)
+    router.add_state_menu('MENU', lambda state: state['menu'])
+    router.add_state_menu('BOARD', 'board')
+    router.add_step('MAIL', handler('mail any step'))
+    router.add_step('MAIL', handler('mail step 2'), step=2)
+    router.add_step('BOARD', handler('board step'))
+    router.add_step('DRAFT', handler('draft'), exclusive=True)
+    router.set_default(handler('help'))
+    return router
+
+
+def dispatch(router, calls, message, state=None):
+    calls.clear()
+    router.dispatch('!1', message, state, None)
+    return calls[0][0] if calls else None
+
+
+def test_quick_commands_match_the_longest_prefix(router, calls):
+    assert dispatch(router, calls, 'CM') == 'check mail'
+    assert dispatch(router, calls, 'cb,,General') == 'check bulletins'
+    assert dispatch(router, calls, 'cb,General') == 'c'
+    assert dispatch(router, calls, 'cx') == 'c'
+    assert dispatch(router, calls, 'zz') == 'help'
+
+
+def test_steps_are_routed_by_command_and_step(router, calls):
+    assert dispatch(router, calls, 'hello', {'command': 'MAIL', 'step': 2}) == 'mail step 2'
+    assert dispatch(router, calls, 'hello', {'command': 'MAIL', 'step': 3}) == 'mail any step'
+    assert dispatch(router, calls, 'hello', {'command': 'MAIL'}) == 'mail any step'
+
+
+def test_menus_come_before_steps_unless_the_step_is_exclusive(router, calls):
+    assert dispatch(router, calls, 'b', {'command': 'MAIL', 'step': 2}) == 'main b'
+    assert dispatch(router, calls, 'x', {'command': 'MAIL', 'step': 2}) == 'help'
+    for message in ('b', 'x', 'anything'):
+        assert dispatch(router, calls, message, {'command': 'DRAFT', 'step': 1}) == 'draft'
+    assert dispatch(router, calls, 'cm', {'command': 'DRAFT', 'step': 1}) == 'check mail'
+
+
+def test_state_selects_the_menu(router, calls):
+    assert dispatch(router, calls, 'm', {'command': 'MENU', 'menu': 'bbs'}) == 'bbs m'
+    assert dispatch(router, calls, 'b', {'command': 'MENU', 'menu': 'bbs'}) == 'help'
+    assert dispatch(router, calls, 'r', {'command': 'BOARD', 'board': 'General'}) == 'board r'
+    assert calls == [('board r', 'General')]
+    assert dispatch(router, calls, 'other', {'command': 'BOARD', 'board': 'General'}) == 'board step'
+
+
+def test_unknown_messages_fall_back_to_the_default(router, calls):
+    assert dispatch(router, calls, 'hello') == 'help'
+    assert dispatch(router, calls, 'hello', {'command': 'UNKNOWN'}) == 'help'
+    assert dispatch(router, calls, 'm', {'command': 'MENU', 'menu': 'missing'}) == 'help'
+    assert dispatch(router, calls, 'b', {'command': 'MENU', 'menu': 'missing'}) == 'main b'
+
+
+def test_stats_count_calls_and_errors(router):
+    router.add_quick_command('boom', lambda sender_id, message, state, interface: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        router.dispatch('!1', 'boom', None, None)
+    router.dispatch('!1', 'cm', None, None)
+    router.dispatch('!1', 'cm', None, None)
+
+    stats = router.get_stats()
+    assert set(stats) == {'quick:boom', 'quick:cm'}
+    assert (stats['quick:cm']['count'], stats['quick:cm']['errors']) == (2, 0)
+    assert stats['quick:boom']['errors'] == 1
+    assert sum(stats['quick:cm']['histogram'].values()) == 2
@@ -0,0 +1,114 @@
+import os
+import time
+import uuid
+
+import pytest
+
+import fanout
+from fanout import FanoutReceiver, FanoutSender, node_id_to_num
+from sync_protocol import SyncReassembler
+
+PEERS = ['!0000000b', '!0000000c']
+
+
+class Dispatcher:
+    def __init__(self):
+        self.frames = []
+
+    def enqueue(self, frame, destination, interface, priority, port_num=None, channel_index=0):
+        self.frames.append((frame, destination))
+
+    def take(self):
+        frames, self.frames = self.frames, []
+        return frames
+
+
+class Interface:
+    def __init__(self, node_id):
+        self.myInfo = type('MyInfo', (), {'my_node_num': node_id_to_num(node_id)})()
+
+
+@pytest.fixture
+def dispatcher(monkeypatch):
+    dispatcher = Dispatcher()
+    monkeypatch.setattr(fanout, 'get_dispatcher', lambda: dispatcher)
+    return dispatcher
+
+
+def bulletin():
+    return ['General', 'AAAA', 'big', os.urandom(600).hex(), str(uuid.uuid4())]
+
+
+def deliver(frames, node_id, dispatcher, skip=()):
+    """Feeds broadcast frames to the node's receiver and returns the ACKs it sent back as (fields, sender)."""
+    receiver = FanoutReceiver(SyncReassembler())
+    interface = Interface(node_id)
+    records = [receiver.add_fragment('!0000000a', frame, interface)
+               for index, frame in enumerate(frames) if index not in skip]
+    acks = []
+    for frame, destination in dispatcher.take():
+        record_type, fields = SyncReassembler().add_fragment(node_id, frame)
+        assert (record_type, destination) == ('ACK', '!0000000a')
+        acks.append((fields, node_id))
+    return [record for record in records if record is not None], acks
+
+
+def retransmit_due(sender):
+    return sender._collect_retransmits(list(sender.pending), time.monotonic())
+
+
+def test_record_is_broadcast_once_for_all_peers(dispatcher):
+    sender = FanoutSender()
+    fields = bulletin()
+    sender.send('BULLETIN', fields, PEERS, None)
+    frames = [frame for frame, destination in dispatcher.take()]
+    assert len(frames) > 2
+
+    for node_id in PEERS:
+        records, acks = deliver(frames, node_id, dispatcher)
+        assert records == [('BULLETIN', fields)]
+        for ack in acks:
+            sender.handle_ack(*ack)
+
+    assert retransmit_due(sender) == []
+    assert sender.get_stats()['pending'] == 0 and sender.get_stats()['delivered'] == 2
+    assert deliver(frames, '!0000000d', dispatcher) == ([], [])
+
+
+def test_only_missing_fragments_are_resent_to_the_peer_missing_them(dispatcher):
+    sender = FanoutSender()
+    fields = bulletin()
+    sender.send('BULLETIN', fields, PEERS, None)
+    frames = [frame for frame, destination in dispatcher.take()]
+
+    _, acks = deliver(frames, PEERS[0], dispatcher)
+    records, partial_acks = deliver(frames, PEERS[1], dispatcher, skip={1})
+    assert records == []
+    for ack in acks + partial_acks:
+        sender.handle_ack(*ack)
+
+    assert retransmit_due(sender) == [(frames[1], PEERS[1], None)]
+    assert sender.get_stats()['frames_retransmitted'] == 1
+
+
+def test_completed_record_is_acknowledged_again_when_resent(dispatcher):
+    frames = fanout.encode_record('BULLETIN', bulletin(), peers=[node_id_to_num(PEERS[0])])
+    receiver = FanoutReceiver(SyncReassembler())
+    interface = Interface(PEERS[0])
+    assert [receiver.add_fragment('!0000000a', frame, interface) for frame in frames][-1] is not None
+    dispatcher.take()
+    assert receiver.add_fragment('!0000000a', frames[0], interface) is None
+    assert len(dispatcher.take()) == 1
+
+
+def test_sender_gives_up_after_max_retries(dispatcher):
+    sender = FanoutSender()
+    sender.max_retries = 2
+    sender.send('BULLETIN', bulletin(), PEERS, None)
+    frames = dispatcher.take()
+
+    for attempt in range(2):
+        assert len(retransmit_due(sender)) == 2 * len(frames)
+    assert retransmit_due(sender) == []
+    stats = sender.get_stats()
+    assert (stats['pending'], stats['failed'], stats['delivered']) == (0, 2, 0)
@@ -0,0 +1,65 @@
+import pytest
+
+import inbound
+from inbound import DuplicateFilter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(inbound, 'time', clock)
+    return clock
+
+
+def packet(packet_id, text, sender=1):
+    return {'from': sender, 'id': packet_id, 'decoded': {'payload': text.encode()}}
+
+
+def test_redelivered_packet_is_a_duplicate_within_the_id_window(clock):
+    duplicates = DuplicateFilter(id_window=60)
+    assert not duplicates.is_duplicate(packet(1, 'R'))
+    assert duplicates.is_duplicate(packet(1, 'R'))
+    assert not duplicates.is_duplicate(packet(1, 'R', sender=2))
+    clock.advance(59)
+    assert duplicates.is_duplicate(packet(1, 'R'))
+    clock.advance(2)
+    assert not duplicates.is_duplicate(packet(1, 'R'))
+
+
+def test_expired_entries_are_dropped(clock):
+    duplicates = DuplicateFilter(id_window=60, max_entries=10)
+    for packet_id in range(5):
+        duplicates.is_duplicate(packet(packet_id, 'R'))
+    clock.advance(61)
+    duplicates.is_duplicate(packet(99, 'R'))
+    assert len(duplicates.expires) == 1
+    for packet_id in range(20):
+        duplicates.is_duplicate(packet(packet_id, 'R'))
+    assert len(duplicates.expires) <= 11
+
+
+def test_repeated_text_is_only_a_duplicate_when_the_text_window_is_on(clock):
+    duplicates = DuplicateFilter(id_window=60, text_window=10)
+    assert not duplicates.is_duplicate(packet(1, 'hello'))
+    assert duplicates.is_duplicate(packet(2, 'hello'))
+    assert not duplicates.is_duplicate(packet(3, 'other'))
+    clock.advance(11)
+    assert not duplicates.is_duplicate(packet(4, 'hello'))
+
+
+def test_text_window_is_off_by_default(clock):
+    duplicates = DuplicateFilter()
+    assert not duplicates.is_duplicate(packet(1, 'N'))
+    assert not duplicates.is_duplicate(packet(2, 'N'))
+    assert duplicates.is_duplicate(packet(2, 'N'))
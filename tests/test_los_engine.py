@@ -0,0 +1,59 @@
+import os
+
+import numpy as np
+import pytest
+
+import los_engine
+from los_benchmark import SyntheticSRTM, reference_los_map
+
+OBSERVER = {'lat': 30.368449, 'lon': -98.0621764, 'height': 2}
+RADIUS_KM = 10
+
+
+@pytest.fixture(scope='module')
+def source():
+    return SyntheticSRTM()
+
+
+def test_vectorized_map_matches_the_scalar_reference(source):
+    expected_map, expected_elevations = reference_los_map(source, OBSERVER, RADIUS_KM, 24)
+    los_map, elevations = los_engine.compute_los_map(source, [OBSERVER], OBSERVER['lat'], OBSERVER['lon'],
+                                                     RADIUS_KM, 24)
+    assert 0 < expected_map.sum() < expected_map.size
+    assert np.array_equal(los_map, expected_map)
+    assert np.array_equal(elevations, expected_elevations)
+
+
+@pytest.mark.parametrize('algorithm', ['sweep', 'r2'])
+def test_viewshed_sweeps_agree_with_per_cell_rays(source, algorithm):
+    exact, exact_elevations = los_engine.compute_viewshed(source, OBSERVER, RADIUS_KM, 200, algorithm='r3')
+    los_map, elevations = los_engine.compute_viewshed(source, OBSERVER, RADIUS_KM, 200, algorithm=algorithm)
+    visible, exact_visible = los_map == 1, exact == 1
+    assert np.mean(visible == exact_visible) >= 0.99
+    # Most cells are hidden at this height, so also compare the visible area itself
+    assert np.sum(visible & exact_visible) / np.sum(visible | exact_visible) >= 0.85
+    assert np.array_equal(elevations, exact_elevations)
+
+
+def shared_memory_blocks():
+    return set(os.listdir('/dev/shm'))
+
+
+@pytest.mark.skipif(not os.path.isdir('/dev/shm'), reason="needs /dev/shm to list shared memory")
+@pytest.mark.parametrize('algorithm', ['r3', 'sweep'])
+def test_process_pool_matches_a_serial_run_and_frees_shared_memory(source, algorithm):
+    before = shared_memory_blocks()
+    serial = los_engine.compute_viewshed(source, OBSERVER, RADIUS_KM, 120, algorithm=algorithm)
+    parallel = los_engine.compute_viewshed(source, OBSERVER, RADIUS_KM, 120, algorithm=algorithm, workers=2)
+    for expected, result in zip(serial, parallel):
+        assert np.array_equal(result, expected)
+    assert shared_memory_blocks() == before
+
+
+@pytest.mark.skipif(not os.path.isdir('/dev/shm'), reason="needs /dev/shm to list shared memory")
+def test_failed_worker_still_frees_shared_memory(source):
+    before = shared_memory_blocks()
+    with pytest.raises(ValueError):
+        los_engine.compute_los_map(source, [OBSERVER], OBSERVER['lat'], OBSERVER['lon'], RADIUS_KM, 120,
+                                   method='unknown', workers=2)
+    assert shared_memory_blocks() == before
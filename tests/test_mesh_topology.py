@@ -0,0 +1,62 @@
+import pytest
+
+from mesh_topology import HOP_WINDOW, MeshTopology, packet_hops
+
+LOCAL = '!0000000a'
+
+
+@pytest.mark.parametrize('packet,hops', [
+    ({'hopStart': 3, 'hopLimit': 3}, 0),
+    ({'hopStart': 3, 'hopLimit': 1}, 2),
+    ({'hopStart': 3}, 3),
+    ({'hopLimit': 3}, None),
+    ({}, None),
+    ({'hopStart': 2, 'hopLimit': 5}, None),
+])
+def test_hops_are_hop_start_minus_hop_limit(packet, hops):
+    assert packet_hops(packet) == hops
+
+
+def test_hop_distribution_keeps_a_rolling_window():
+    topology = MeshTopology(LOCAL)
+    for hops in [2] * 5 + [1] * 3:
+        topology.observe({'fromId': '!1', 'hopStart': 3, 'hopLimit': 3 - hops}, now=0)
+    assert topology.hops_to('!1') == 2 and topology.last_hops('!1') == 1
+    assert topology.hop_distribution('!1') == {2: 5, 1: 3}
+
+    for _ in range(HOP_WINDOW):
+        topology.observe({'fromId': '!1', 'hopStart': 3, 'hopLimit': 2}, now=1)
+    assert topology.hop_distribution('!1') == {1: HOP_WINDOW}
+    assert topology.observe({'fromId': '!2', 'hopLimit': 3}) is None
+    assert topology.hops_to('!2') is None
+
+
+def test_direct_packets_add_edges_with_smoothed_snr():
+    topology = MeshTopology(LOCAL, alpha=0.5)
+    topology.observe({'fromId': '!1', 'hopStart': 3, 'hopLimit': 3, 'rxSnr': 8.0}, now=0)
+    topology.observe({'fromId': '!1', 'hopStart': 3, 'hopLimit': 3, 'rxSnr': 4.0}, now=1)
+    topology.observe({'fromId': '!2', 'hopStart': 3, 'hopLimit': 2, 'rxSnr': 1.0}, now=2)
+
+    assert topology.neighbours(LOCAL) == {'!1': 6.0}
+    assert topology.edge_snr('!1', LOCAL) == 6.0
+    assert topology.neighbours('!2') == {}
+
+
+def test_neighbour_info_adds_the_reported_edges():
+    topology = MeshTopology(LOCAL)
+    packet = {'fromId': '!0000000b', 'decoded': {'neighborinfo': {
+        'nodeId': 0xb, 'neighbors': [{'nodeId': 0xc, 'snr': 5.5}, {'nodeId': 0xd, 'snr': -2.0}, {'snr': 1.0}]}}}
+    assert topology.observe(packet) is None
+    assert topology.neighbours('!0000000b') == {'!0000000c': 5.5, '!0000000d': -2.0}
+    assert topology.neighbours('!0000000c') == {'!0000000b': 5.5}
+
+    stats = topology.get_stats()
+    assert (stats['edges'], stats['direct_neighbours'], stats['packets']) == (2, 0, 1)
+
+
+def test_local_id_comes_from_the_interface():
+    interface = type('Interface', (), {'myInfo': type('MyInfo', (), {'my_node_num': 10})()})()
+    topology = MeshTopology()
+    topology.observe({'fromId': '!1', 'hopStart': 3, 'hopLimit': 3}, interface)
+    assert topology.local_id == LOCAL
+    assert topology.get_stats()['hops'] == {'0': 1}
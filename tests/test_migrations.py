@@ -0,0 +1,103 @@
+import db_operations
+from db_schema import SCHEMA_MIGRATIONS, migrate_database, sync_key
+
+# The schema as it was before versioned migrations (user_version 0)
+BASELINE_SCHEMA = [
+    '''CREATE TABLE bulletins (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        board TEXT NOT NULL,
+        sender_short_name TEXT NOT NULL,
+        date TEXT NOT NULL,
+        subject TEXT NOT NULL,
+        content TEXT NOT NULL,
+        unique_id TEXT NOT NULL
+    )''',
+    '''CREATE TABLE mail (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        sender TEXT NOT NULL,
+        sender_short_name TEXT NOT NULL,
+        recipient TEXT NOT NULL,
+        date TEXT NOT NULL,
+        subject TEXT NOT NULL,
+        content TEXT NOT NULL,
+        unique_id TEXT NOT NULL
+    )''',
+    '''CREATE TABLE channels (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        url TEXT NOT NULL
+    )''',
+]
+
+
+def baseline_database(conn):
+    for statement in BASELINE_SCHEMA:
+        conn.execute(statement)
+    bulletin = "INSERT INTO bulletins (board, sender_short_name, date, subject, content, unique_id) VALUES (?, ?, ?, ?, ?, ?)"
+    conn.execute(bulletin, ('General', 'AAAA', '2024-01-01 10:00', 'first', 'kept', 'b-1'))
+    conn.execute(bulletin, ('General', 'AAAA', '2024-01-01 10:05', 'resent', 'dropped', 'b-1'))
+    conn.execute(bulletin, ('Urgent', 'BBBB', '2024-01-02 09:00', 'other', 'kept', 'b-2'))
+    mail = ("INSERT INTO mail (sender, sender_short_name, recipient, date, subject, content, unique_id) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)")
+    conn.execute(mail, ('!1', 'AAAA', '!2', '2024-01-01 10:00', 'hi', 'kept', 'm-1'))
+    conn.execute(mail, ('!1', 'AAAA', '!2', '2024-01-01 10:01', 'hi', 'dropped', 'm-1'))
+    conn.commit()
+
+
+def indexes(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA index_list({table})")}
+
+
+def test_upgrade_from_baseline(db):
+    baseline_database(db)
+    assert db.execute("PRAGMA user_version").fetchone()[0] == 0
+
+    migrate_database(db)
+
+    assert db.execute("PRAGMA user_version").fetchone()[0] == len(SCHEMA_MIGRATIONS)
+    assert db.execute("SELECT id, content FROM bulletins ORDER BY id").fetchall() == [(1, 'kept'), (3, 'kept')]
+    assert db.execute("SELECT id, content FROM mail").fetchall() == [(1, 'kept')]
+    assert {'idx_bulletins_unique_id', 'idx_bulletins_board'} <= indexes(db, 'bulletins')
+    assert {'idx_mail_unique_id', 'idx_mail_recipient'} <= indexes(db, 'mail')
+    columns = {row[1] for row in db.execute("PRAGMA table_info(tombstones)")}
+    assert columns == {'unique_id', 'kind', 'board', 'deleted_at', 'sync_key'}
+    assert db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] == 0
+    assert db.execute("SELECT sync_key FROM bulletins WHERE unique_id = 'b-2'").fetchone()[0] == sync_key('b-2')
+
+
+def test_migrate_is_idempotent(db):
+    baseline_database(db)
+    migrate_database(db)
+    migrate_database(db)
+    assert db.execute("PRAGMA user_version").fetchone()[0] == len(SCHEMA_MIGRATIONS)
+
+
+def test_upgrade_resumes_from_recorded_version(db):
+    baseline_database(db)
+    for statement in SCHEMA_MIGRATIONS[0]:
+        db.execute(statement)
+    db.execute("PRAGMA user_version = 1")
+    db.commit()
+
+    migrate_database(db)
+
+    assert db.execute("PRAGMA user_version").fetchone()[0] == len(SCHEMA_MIGRATIONS)
+    assert db.execute("SELECT COUNT(*) FROM tombstones").fetchone()[0] == 0
+
+
+def test_unique_id_rejects_duplicates_after_upgrade(db):
+    baseline_database(db)
+    migrate_database(db)
+    inserted, _ = db_operations.insert_sync_records(
+        [('General', 'AAAA', 'first', 'again', 'b-1'), ('General', 'CCCC', 'new', 'new', 'b-3')], [])
+    assert [record[-1] for record in inserted] == ['b-3']
+
+
+def test_add_with_existing_unique_id_is_ignored(db):
+    db_operations.initialize_database()
+    unique_id = db_operations.add_bulletin('General', 'AAAA', 'first', 'content', [], None)
+    assert db_operations.add_bulletin('General', 'AAAA', 'again', 'content', [], None, unique_id) == unique_id
+    assert db_operations.count_bulletins('General') == 1
+    unique_id = db_operations.add_mail('!1', 'AAAA', '!2', 'first', 'content', [], None)
+    assert db_operations.add_mail('!1', 'AAAA', '!2', 'again', 'content', [], None, unique_id) == unique_id
+    assert db_operations.count_mail('!2') == 1
@@ -0,0 +1,78 @@
+import os
+
+import numpy as np
+import pytest
+
+from coverage_raster import LinkBudget
+from los_benchmark import SyntheticSRTM
+from multisite import MultiSitePlan, SiteCache
+
+SITES = [
+    {'name': 'west', 'lat': 30.50, 'lon': -98.52, 'height': 10},
+    {'name': 'east', 'lat': 30.50, 'lon': -98.46, 'height': 10},
+    {'name': 'north', 'lat': 30.54, 'lon': -98.49, 'height': 20, 'budget': {'tx_power_dbm': 0.0}},
+]
+
+
+@pytest.fixture(scope='module')
+def source():
+    return SyntheticSRTM(side=121)
+
+
+def plan(source, cache_dir, sites=SITES):
+    return MultiSitePlan(source, sites, range_km=4, budget=LinkBudget(tx_power_dbm=-10.0), cell_arcsec=15,
+                         steps=64, cache=SiteCache(str(cache_dir)))
+
+
+def site_snr(multisite_plan, result, index):
+    """One site's SNR on the combined extent, NaN outside its window."""
+    site = multisite_plan.sites[index]
+    raster = multisite_plan.site_raster(site)
+    budget = multisite_plan.site_budget(site)
+    snr = np.full(result.snr.shape, np.nan, dtype=np.float32)
+    rows, columns = raster.path_loss_db.shape
+    row, column = raster.first_row - result.first_row, raster.first_column - result.first_column
+    snr[row:row + rows, column:column + columns] = budget.rssi(np.asarray(raster.path_loss_db)) - budget.noise_floor_dbm
+    return snr
+
+
+def test_union_and_best_server_combine_the_sites(source, tmp_path):
+    multisite_plan = plan(source, tmp_path)
+    result = multisite_plan.compute()
+    snrs = np.stack([site_snr(multisite_plan, result, index) for index in range(len(SITES))])
+
+    with np.errstate(invalid='ignore'):
+        covered = snrs >= result.limit
+    assert np.array_equal(result.overlap, covered.sum(axis=0))
+    assert np.array_equal(result.union, covered.any(axis=0))
+    assert 0 < result.union.sum() < result.union.size and (result.overlap >= 2).any()
+
+    snrs[np.isnan(snrs)] = -np.inf
+    assert np.array_equal(result.best_server, np.where(result.union, snrs.argmax(axis=0), -1))
+    np.testing.assert_allclose(result.snr[result.union], snrs.max(axis=0)[result.union], rtol=1e-6)
+
+
+def test_cached_sites_are_not_recomputed(source, tmp_path):
+    first = plan(source, tmp_path, SITES[:2])
+    first.compute()
+    assert first.computed == 2
+
+    second = plan(source, tmp_path)
+    result = second.compute()
+    assert second.computed == 1
+    assert np.array_equal(result.best_server, plan(source, tmp_path).compute().best_server)
+    assert not [name for name in os.listdir(tmp_path) if 'partial' in name]
+
+
+def test_unreadable_cache_entry_is_a_miss(source, tmp_path):
+    first = plan(source, tmp_path, SITES[:1])
+    expected = first.compute()
+    key = first.site_key(SITES[0])
+    with open(tmp_path / f'{key}.json', 'w') as f:
+        f.write('{"site": ')
+
+    second = plan(source, tmp_path, SITES[:1])
+    result = second.compute()
+    assert second.computed == 1
+    assert np.array_equal(result.best_server, expected.best_server)
+    assert plan(source, tmp_path, SITES[:1]).cache.get(key) is not None
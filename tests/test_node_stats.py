@@ -0,0 +1,98 @@
+import json
+import socket
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from metrics import MetricsServer
+from node_stats import NodeStats
+
+
+class Interface:
+    def __init__(self, nodes):
+        self.nodes = nodes
+
+
+def node(name, battery=None, last_heard=0, hw_model='TBEAM', role='CLIENT'):
+    result = {'user': {'longName': name, 'hwModel': hw_model, 'role': role}, 'lastHeard': last_heard}
+    if battery is not None:
+        result['deviceMetrics'] = {'batteryLevel': battery}
+    return result
+
+
+@pytest.fixture
+def stats():
+    now = int(time.time())
+    interface = Interface({
+        '!1': node('one', battery=15, last_heard=now - 600),
+        '!2': node('two', battery=80, last_heard=now - 7200, hw_model='HELTEC_V3'),
+        '!3': node('three', battery=5, last_heard=now - 90000, role='ROUTER'),
+    })
+    return NodeStats(interface)
+
+
+def test_low_battery_nodes_are_listed_lowest_first(stats):
+    assert stats.get_low_battery() == [('three', 5), ('one', 15)]
+
+    stats.update_node('!2', node('two', battery=10, hw_model='HELTEC_V3'))
+    stats.update_node('!3', node('three', battery=90, role='ROUTER'))
+    assert stats.get_low_battery() == [('two', 10), ('one', 15)]
+
+    stats.update_node('!1', node('one renamed', battery=15))
+    assert stats.get_low_battery() == [('two', 10), ('one renamed', 15)]
+
+
+def test_counts_follow_node_updates(stats):
+    assert stats.count_heard_since() == 3
+    assert stats.count_heard_since(int(time.time()) - 3600) == 1
+    assert stats.get_hw_models() == [('TBEAM', 2), ('HELTEC_V3', 1)]
+    assert dict(stats.get_roles()) == {'CLIENT': 2, 'ROUTER': 1}
+
+    stats.update_node('!3', node('three', battery=5, last_heard=int(time.time()), role='CLIENT'))
+    assert stats.count_heard_since(int(time.time()) - 3600) == 2
+    assert stats.get_roles() == [('CLIENT', 3)]
+
+
+def test_new_nodes_in_the_nodedb_trigger_a_rebuild(stats):
+    stats.interface.nodes['!4'] = node('four', battery=1)
+    assert stats.get_low_battery()[0] == ('four', 1)
+    assert stats.get_stats()['nodes'] == 4
+    assert stats.get_stats()['low_battery'] == 3
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def fetch(url):
+    with urllib.request.urlopen(url, timeout=5) as response:
+        return json.loads(response.read())
+
+
+def test_metrics_endpoint_serves_each_source(stats):
+    server = MetricsServer()
+    server.port = free_port()
+    server.add_source('nodes', stats.get_stats)
+    server.add_source('broken', lambda: 1 / 0)
+    assert server.start()
+    try:
+        base = f'http://127.0.0.1:{server.port}/metrics'
+        everything = fetch(base)
+        assert everything['nodes']['nodes'] == 3
+        assert everything['nodes']['hw_models'] == {'TBEAM': 2, 'HELTEC_V3': 1}
+        assert everything['nodes']['low_battery'] == 2
+        assert everything['broken'] == {'error': 'division by zero'}
+        assert fetch(base + '/nodes/') == {'nodes': stats.get_stats()}
+        with pytest.raises(urllib.error.HTTPError) as error:
+            fetch(base + '/missing')
+        assert error.value.code == 404
+    finally:
+        server.stop()
+
+
+def test_metrics_endpoint_is_off_without_a_port():
+    assert not MetricsServer().start()
@@ -0,0 +1,125 @@
+import pytest
+
+import command_handlers
+import db_operations
+from command_handlers import fetch_page, handle_read_bulletin_command, handle_read_mail_command
+
+PAGE_SIZE = 3
+
+
+class User:
+    """Captures what the handlers send to and store for one user."""
+
+    def __init__(self):
+        self.lines = []
+        self.messages = []
+        self.state = None
+
+    def send_lines(self, lines, sender_id, interface):
+        self.lines.append(list(lines))
+
+    def send_message(self, message, sender_id, interface):
+        self.messages.append(message)
+
+    def update_user_state(self, sender_id, state):
+        self.state = state
+
+
+@pytest.fixture
+def user(db, monkeypatch):
+    db_operations.initialize_database()
+    user = User()
+    monkeypatch.setattr(command_handlers, 'page_size', PAGE_SIZE)
+    for name in ('send_lines', 'send_message', 'update_user_state'):
+        monkeypatch.setattr(command_handlers, name, getattr(user, name))
+    monkeypatch.setattr(command_handlers, 'get_node_id_from_num', lambda sender_id, interface: '!2')
+    return user
+
+
+def add_bulletins(count, board='General'):
+    for i in range(count):
+        db_operations.add_bulletin(board, 'AAAA', f'subject {i}', 'content', [], None)
+
+
+def add_mail(count):
+    for i in range(count):
+        db_operations.add_mail('!1', 'AAAA', '!2', f'subject {i}', 'content', [], None)
+
+
+def test_get_bulletins_and_mail_continue_after_the_cursor(user):
+    add_bulletins(5)
+    add_bulletins(2, 'Other')
+    add_mail(4)
+
+    first = db_operations.get_bulletins('General', None, 2)
+    assert [row[1] for row in first] == ['subject 0', 'subject 1']
+    assert [row[1] for row in db_operations.get_bulletins('General', first[-1][0], 10)] == \
+        ['subject 2', 'subject 3', 'subject 4']
+    assert len(db_operations.get_bulletins('General')) == 5
+    mail = db_operations.get_mail('!2', None, 3)
+    assert [row[2] for row in db_operations.get_mail('!2', mail[-1][0], 3)] == ['subject 3']
+    assert db_operations.get_mail('!3') == []
+
+
+def test_fetch_page_returns_a_cursor_only_when_more_rows_follow(user):
+    add_bulletins(PAGE_SIZE * 2)
+    rows, cursor = fetch_page(db_operations.get_bulletins, 'General')
+    assert len(rows) == PAGE_SIZE and cursor == rows[-1][0]
+    rows, cursor = fetch_page(db_operations.get_bulletins, 'General', cursor)
+    assert len(rows) == PAGE_SIZE and cursor is None
+    assert fetch_page(db_operations.get_bulletins, 'Other') == ([], None)
+
+
+def test_check_mail_pages_keep_message_numbers(user):
+    add_mail(PAGE_SIZE + 2)
+    command_handlers.handle_check_mail_command(1, None)
+    assert command_handlers.NEXT_PAGE_HINT in user.lines[-1]
+    assert len(user.state['mail']) == PAGE_SIZE
+
+    handle_read_mail_command(1, 'N', user.state, None)
+    last_page = user.lines[-1]
+    assert last_page[0].startswith(f"{PAGE_SIZE + 1:02d}. ") and last_page[1].startswith(f"{PAGE_SIZE + 2:02d}. ")
+    assert command_handlers.NEXT_PAGE_HINT not in last_page
+    assert user.state['cursor'] is None and len(user.state['mail']) == PAGE_SIZE + 2
+
+    handle_read_mail_command(1, str(PAGE_SIZE + 2), user.state, None)
+    assert f'subject {PAGE_SIZE + 1}' in user.messages[0]
+
+
+def test_n_on_the_last_page_is_not_a_page_request(user):
+    add_bulletins(PAGE_SIZE)
+    command_handlers.send_check_bulletin_page(1, None, 'General')
+    assert user.state['cursor'] is None
+    assert command_handlers.NEXT_PAGE_HINT not in user.lines[-1]
+
+    handle_read_bulletin_command(1, 'n', user.state, None)
+    assert len(user.lines) == 1
+    assert user.messages == ["Invalid input. Please enter a valid bulletin number."]
+
+
+def test_n_with_an_empty_next_page(user):
+    add_bulletins(PAGE_SIZE + 1)
+    command_handlers.send_check_bulletin_page(1, None, 'General')
+    state = user.state
+    for bulletin_id, *_ in db_operations.get_bulletins('General', state['cursor']):
+        db_operations.delete_bulletin(bulletin_id, [], None)
+
+    handle_read_bulletin_command(1, 'N', state, None)
+    assert user.lines[-1] == ["\nPlease reply with the number of the bulletin you want to read."]
+    assert user.state['cursor'] is None and len(user.state['bulletins']) == PAGE_SIZE
+
+
+def test_board_and_mailbox_listings_page_with_n(user):
+    add_bulletins(PAGE_SIZE + 1)
+    add_mail(PAGE_SIZE + 1)
+
+    command_handlers.send_board_page(1, None, 'General', ["header"])
+    assert user.lines[-1][0] == "header" and user.lines[-1][-1] == command_handlers.NEXT_PAGE_HINT
+    command_handlers.handle_bb_steps(1, 'n', 3, user.state, None, [])
+    assert user.lines[-1] == [f"[{PAGE_SIZE + 1}] subject {PAGE_SIZE}"]
+    assert user.state == {'command': 'BULLETIN_READ', 'step': 3, 'board': 'General', 'cursor': None}
+
+    command_handlers.send_mail_page(1, None, '!2', [])
+    command_handlers.handle_mail_steps(1, 'N', 2, user.state, None, [])
+    assert len(user.lines[-1]) == 1 and f"Subject: subject {PAGE_SIZE}" in user.lines[-1][0]
+    assert user.state['cursor'] is None
@@ -0,0 +1,48 @@
+import math
+
+import numpy as np
+import pytest
+
+import radio_path
+from terrain import ElevationGrid
+
+
+def test_fresnel_radius_matches_the_closed_form():
+    # r = 17.32 * sqrt(d1 * d2 / (f * d)) with distances in km and f in GHz
+    assert radio_path.fresnel_radius(5000, 5000, 'US') == pytest.approx(17.32 * math.sqrt(25 / (0.915 * 10)),
+                                                                      rel=1e-3)
+    assert radio_path.fresnel_radius(2000, 8000, 868) == pytest.approx(17.32 * math.sqrt(16 / (0.868 * 10)),
+                                                                     rel=1e-3)
+    assert radio_path.fresnel_radius(5000, 5000, 'US', zone=2) == pytest.approx(
+        math.sqrt(2) * radio_path.fresnel_radius(5000, 5000, 'US'))
+    assert radio_path.fresnel_radius(0, 0, 'US') == 0
+
+
+def test_earth_bulge_matches_the_closed_form():
+    # h = d1 * d2 / (12.74 * k) with distances in km and h in metres
+    assert radio_path.earth_bulge(5000, 5000) == pytest.approx(25 / (12.742 * 4 / 3), rel=1e-3)
+    assert radio_path.earth_bulge(20000, 30000, k_factor=1) == pytest.approx(600 / 12.742, rel=1e-3)
+    assert radio_path.earth_bulge(5000, 5000, k_factor=np.inf) == 0
+
+
+def test_unknown_region_is_rejected():
+    assert radio_path.frequency_mhz('EU_868') == 868.0
+    with pytest.raises(ValueError):
+        radio_path.frequency_mhz('MARS')
+
+
+@pytest.mark.parametrize('k_factor', [radio_path.DEFAULT_K_FACTOR, np.inf])
+def test_flat_path_is_tightest_at_the_midpoint(k_factor):
+    grid = ElevationGrid.from_tiles({(30, -98): np.full((121, 121), 100, dtype=np.int16)}, 30, -98, 30, -98, 121)
+    height = 40.0
+    analysis = radio_path.analyze_paths(None, 30.1, -97.5, [30.19], [-97.5], height, height, 'US', k_factor=k_factor,
+                                        grid=grid)
+
+    half = analysis.length_m[0] / 2
+    wavelength = 299792458.0 / 915e6
+    bulge = 0 if k_factor == np.inf else half * half / (2 * k_factor * 6371000)
+    assert analysis.length_m[0] == pytest.approx(0.09 * 111195, rel=1e-3)
+    assert analysis.worst_distance_m[0] == pytest.approx(half)
+    assert analysis.worst_clearance_m[0] == pytest.approx(height - bulge)
+    assert analysis.min_clearance_ratio[0] == pytest.approx((height - bulge) / math.sqrt(wavelength * half / 2))
+    assert analysis.clear()[0] and analysis.line_of_sight()[0]
@@ -0,0 +1,117 @@
+import pytest
+
+import db_operations
+import sessions
+from sessions import SWEEP_INTERVAL, SessionStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000000.0
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(sessions, 'time', clock)
+    return clock
+
+
+def store(ttl=100.0, max_sessions=1000, persist=False):
+    session_store = SessionStore()
+    session_store.ttl = ttl
+    session_store.max_sessions = max_sessions
+    session_store.persist = persist
+    session_store.last_sweep = sessions.time.time()
+    return session_store
+
+
+def test_session_expires_after_ttl(clock):
+    session_store = store()
+    session_store.set(1, {'command': 'MAIL'})
+    clock.advance(99)
+    assert session_store.get(1) == {'command': 'MAIL'}
+    clock.advance(101)
+    assert session_store.get(1) is None
+    assert session_store.get_stats()['expired'] == 1
+
+
+def test_sweep_removes_idle_sessions(clock):
+    session_store = store()
+    session_store.set(1, {'command': 'MAIL'})
+    clock.advance(SWEEP_INTERVAL + 101)
+    session_store.set(2, {'command': 'BULLETIN'})
+    assert list(session_store.sessions) == [2]
+
+
+def test_least_recently_used_sessions_are_evicted(clock):
+    session_store = store(max_sessions=2)
+    session_store.set(1, {'n': 1})
+    session_store.set(2, {'n': 2})
+    session_store.get(1)
+    session_store.set(3, {'n': 3})
+    assert set(session_store.sessions) == {1, 3}
+    assert session_store.get_stats()['evicted'] == 1
+
+
+def test_setting_none_clears_the_session(clock):
+    session_store = store()
+    session_store.set(1, {'command': 'MAIL'})
+    session_store.set(1, None)
+    assert session_store.get(1) is None
+
+
+def test_draft_limit(clock):
+    session_store = store()
+    session_store.max_draft_bytes = 10
+    state = {'content': ''}
+    assert session_store.append_draft(1, state, 'short')
+    assert not session_store.append_draft(1, state, 'too long now')
+    assert state['content'] == 'short\n'
+    assert session_store.get_stats()['drafts_rejected'] == 1
+
+
+def test_sessions_survive_a_restart(db, clock):
+    db_operations.initialize_database()
+    session_store = store(persist=True)
+    session_store.set(1, {'command': 'MAIL', 'step': 2})
+    session_store.set(2, {'command': 'BULLETIN'})
+    session_store.set(2, None)
+    session_store.set(3, {'command': 'CHECK_MAIL'})
+    clock.advance(60)
+
+    restarted = store(persist=True)
+    assert restarted.load() == 2
+    assert restarted.get(1) == {'command': 'MAIL', 'step': 2}
+    assert restarted.get(2) is None
+
+    restarted.set(1, {'command': 'MAIL', 'step': 3})
+    clock.advance(90)
+    assert store(persist=True).load() == 1
+    assert [row[0] for row in db_operations.load_sessions()] == [1]
+
+
+def test_reading_a_session_counts_as_activity(clock):
+    session_store = store()
+    session_store.set(1, {'command': 'MAIL'})
+    session_store.set(2, {'command': 'BULLETIN'})
+    clock.advance(60)
+    session_store.get(1)
+    clock.advance(60)
+    session_store.set(3, {'command': 'CHECK_MAIL'})
+    session_store.last_sweep = 0
+    session_store.get(3)
+    assert list(session_store.sessions) == [1, 3]
+
+
+def test_state_is_only_serialized_when_persisted(clock):
+    session_store = store()
+    state = {'draft': object()}
+    session_store.set(1, state)
+    assert session_store.get(1) is state
@@ -0,0 +1,64 @@
+import re
+
+import pytest
+
+from utils import byte_length, split_message
+
+
+def unnumbered(chunks):
+    return [re.sub(r'^\d+/\d+ ', '', chunk) for chunk in chunks]
+
+
+def test_short_message_is_not_split():
+    assert split_message("hello", 200) == ["hello"]
+
+
+@pytest.mark.parametrize('limit', [20, 50, 200])
+@pytest.mark.parametrize('numbered', [True, False])
+def test_chunks_fit_the_byte_limit(limit, numbered):
+    message = "Bulletin: " + "ünïcödé ✓ 📡 words and more words\n" * 30
+    chunks = split_message(message, limit, numbered)
+    assert len(chunks) > 1
+    assert all(byte_length(chunk) <= limit for chunk in chunks)
+    if numbered:
+        # Breaks on a separator drop that one character, so only those may be missing
+        content = "".join(unnumbered(chunks))
+        assert content.replace(" ", "").replace("\n", "") == message.replace(" ", "").replace("\n", "")
+    else:
+        assert "".join(chunks) == message
+
+
+def test_multibyte_characters_are_never_cut():
+    message = "📡" * 100
+    chunks = split_message(message, 30, numbered=False)
+    assert "".join(chunks) == message
+    assert all(byte_length(chunk) <= 30 for chunk in chunks)
+
+
+def test_numbering_widens_for_ten_or_more_chunks():
+    chunks = split_message("x" * 500, 20)
+    assert chunks[0].startswith("1/")
+    assert chunks[-1].startswith(f"{len(chunks)}/{len(chunks)} ")
+    assert len(chunks) >= 10
+    assert all(byte_length(chunk) <= 20 for chunk in chunks)
+
+
+def test_prefers_breaking_on_lines_then_words():
+    message = "first line here\nsecond line here and some more words"
+    chunks = unnumbered(split_message(message, 25))
+    assert chunks[0] == "first line here"
+    assert all(not chunk.startswith(" ") for chunk in chunks)
+
+
+def test_unnumbered_chunks_keep_their_separators():
+    message = "first line here\nsecond line here and some more words"
+    chunks = split_message(message, 25, numbered=False)
+    assert chunks[0] == "first line here\n"
+    assert all(chunk.endswith((" ", "\n")) for chunk in chunks[:-1])
+    assert "".join(chunks) == message
+
+
+@pytest.mark.parametrize('limit,numbered', [(1, False), (3, False), (7, True)])
+def test_limit_too_small_for_a_character_raises(limit, numbered):
+    with pytest.raises(ValueError):
+        split_message("€" * 10, limit, numbered)
@@ -0,0 +1,89 @@
+import pytest
+
+import db_operations
+import sync_ingest
+from sync_ingest import SyncIngest
+
+URGENT = ('Urgent', 'AAAA', 'Road closed', 'details')
+
+
+@pytest.fixture
+def ingest(db, monkeypatch):
+    db_operations.initialize_database()
+    sent = []
+    monkeypatch.setattr(sync_ingest, 'send_message', lambda message, destination, interface: sent.append(message))
+    ingest = SyncIngest()
+    ingest.sent = sent
+    return ingest
+
+
+def test_batch_is_stored_in_one_flush_and_duplicates_counted(ingest):
+    for i in range(3):
+        ingest.add_bulletin('General', 'AAAA', f'subject {i}', 'content', f'b-{i}', None)
+    ingest.add_bulletin('General', 'AAAA', 'subject 0', 'content', 'b-0', None)
+    ingest.add_mail('!1', 'AAAA', '!2', 'subject', 'content', 'm-1', None)
+
+    assert ingest.flush() == (4, 1)
+    assert ingest.flush() == (0, 0)
+    assert db_operations.count_bulletins('General') == 3
+    assert db_operations.count_mail('!2') == 1
+    stats = ingest.get_stats()
+    assert (stats['batches'], stats['inserted'], stats['duplicates'], stats['pending']) == (1, 4, 1, 0)
+
+
+def test_deleted_records_are_not_stored_again(ingest):
+    unique_id = db_operations.add_bulletin('General', 'AAAA', 'subject', 'content', [], None)
+    db_operations.delete_bulletin_by_unique_id(unique_id, [], None)
+
+    ingest.add_bulletin('General', 'AAAA', 'subject', 'content', unique_id, None)
+
+    assert ingest.flush() == (0, 1)
+    assert db_operations.count_bulletins('General') == 0
+
+
+def test_failed_batch_is_requeued_then_dropped(ingest, monkeypatch):
+    def fail(bulletins, mail):
+        raise RuntimeError('database is locked')
+
+    monkeypatch.setattr(sync_ingest, 'insert_sync_records', fail)
+    ingest.max_retries = 2
+    ingest.add_mail('!1', 'AAAA', '!2', 'subject', 'content', 'm-1', None)
+
+    for attempt in range(2):
+        assert ingest.flush() == (0, 0)
+        assert ingest.get_stats()['pending'] == 1
+    monkeypatch.undo()
+    monkeypatch.setattr(sync_ingest, 'send_message', lambda *args: None)
+    assert ingest.flush() == (1, 0)
+
+    monkeypatch.setattr(sync_ingest, 'insert_sync_records', fail)
+    ingest.add_mail('!1', 'AAAA', '!2', 'subject', 'content', 'm-2', None)
+    for attempt in range(3):
+        ingest.flush()
+    assert ingest.get_stats()['pending'] == 0
+    assert ingest.get_stats()['dropped'] == 1
+
+
+def test_only_live_urgent_bulletins_are_announced(ingest):
+    interface = object()
+    ingest.add_bulletin(*URGENT, 'live', interface)
+    ingest.add_bulletin(*URGENT, 'old-1', interface, notify=False)
+    ingest.add_bulletin(*URGENT, 'old-2', interface, notify=False)
+    ingest.add_bulletin('General', 'AAAA', 'subject', 'content', 'general', interface)
+
+    assert ingest.flush() == (4, 0)
+    assert len(ingest.sent) == 1 and 'Road closed' in ingest.sent[0]
+
+
+def test_backfilled_bulletins_are_not_announced(ingest, monkeypatch):
+    import message_processing
+
+    monkeypatch.setattr(message_processing, 'get_sync_ingest', lambda: ingest)
+    interface = object()
+    message_processing.process_sync_record('BACKFILL_BULLETIN', [*URGENT, 'old'], interface)
+    assert ingest.flush() == (1, 0)
+    assert ingest.sent == []
+
+    message_processing.process_sync_record('BULLETIN', [*URGENT, 'new'], interface)
+    assert ingest.flush() == (1, 0)
+    assert len(ingest.sent) == 1
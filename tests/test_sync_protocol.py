@@ -0,0 +1,89 @@
+import os
+import random
+import uuid
+
+import pytest
+
+from sync_protocol import (
+    FLAG_RECORD_ID, MAX_FRAME_SIZE, SyncProtocolError, SyncReassembler, decode_header, decode_peers, encode_record
+)
+
+
+def reassemble(frames, sender='!peer'):
+    reassembler = SyncReassembler()
+    results = [reassembler.add_fragment(sender, frame) for frame in frames]
+    assert all(result is None for result in results[:-1])
+    return results[-1]
+
+
+@pytest.mark.parametrize('compression', ['zlib', 'zstd', None])
+def test_bulletin_round_trip(compression):
+    unique_id = str(uuid.uuid4())
+    fields = ['General', 'AAAA', 'Subject | with pipes', 'Ünïcode ✓ content\nsecond line', unique_id]
+    frames = encode_record('BULLETIN', fields, compression)
+    assert len(frames) == 1
+    assert decode_header(frames[0])[1] & FLAG_RECORD_ID
+    assert reassemble(frames) == ('BULLETIN', fields)
+
+
+def test_unique_id_travels_in_header_for_deletes():
+    unique_id = str(uuid.uuid4())
+    for record_type in ('DELETE_BULLETIN', 'DELETE_MAIL'):
+        frames = encode_record(record_type, [unique_id])
+        code, flags, msg_id, index, count, crc = decode_header(frames[0])
+        assert flags & FLAG_RECORD_ID and msg_id == uuid.UUID(unique_id).bytes
+        assert reassemble(frames) == (record_type, [unique_id])
+
+
+def test_non_uuid_id_stays_in_body():
+    fields = ['!1', 'AAAA', '!2', 'subject', 'content', 'legacy-id']
+    frames = encode_record('MAIL', fields)
+    assert not decode_header(frames[0])[1] & FLAG_RECORD_ID
+    assert reassemble(frames) == ('MAIL', fields)
+
+
+def test_large_record_fragments_and_reassembles_out_of_order():
+    content = os.urandom(3000).hex()
+    fields = ['General', 'AAAA', 'big', content, str(uuid.uuid4())]
+    frames = encode_record('BULLETIN', fields)
+    assert len(frames) > 1
+    assert all(len(frame) <= MAX_FRAME_SIZE for frame in frames)
+    shuffled = frames[:]
+    random.Random(1).shuffle(shuffled)
+    assert reassemble(shuffled) == ('BULLETIN', fields)
+
+
+def test_fragments_from_different_senders_are_kept_apart():
+    fields = ['General', 'AAAA', 'big', os.urandom(1000).hex(), str(uuid.uuid4())]
+    frames = encode_record('BULLETIN', fields)
+    reassembler = SyncReassembler()
+    for frame in frames[:-1]:
+        assert reassembler.add_fragment('!a', frame) is None
+    assert reassembler.add_fragment('!b', frames[-1]) is None
+    assert reassembler.add_fragment('!a', frames[-1]) == ('BULLETIN', fields)
+
+
+def test_control_record_raw_fields_round_trip():
+    keys = os.urandom(8 * 5)
+    tombstones = os.urandom(8 * 2)
+    frames = encode_record('IDS', ['B:General', '3f', keys, tombstones])
+    assert reassemble(frames) == ('IDS', ['B:General', '3f', keys, tombstones])
+
+
+def test_fan_out_frames_carry_peers():
+    fields = ['General', 'AAAA', 'subject', 'content', str(uuid.uuid4())]
+    frames = encode_record('BULLETIN', fields, peers=[0x11223344, 0x55667788])
+    assert decode_peers(frames[0]) == [0x11223344, 0x55667788]
+    assert reassemble(frames) == ('BULLETIN', fields)
+
+
+def test_corrupted_body_is_dropped():
+    frames = encode_record('MAIL', ['!1', 'AAAA', '!2', 'subject', 'content', str(uuid.uuid4())], None)
+    corrupted = frames[0][:-1] + bytes([frames[0][-1] ^ 0xFF])
+    assert SyncReassembler().add_fragment('!peer', corrupted) is None
+
+
+def test_bad_magic_is_rejected():
+    frame = encode_record('CHANNEL', ['name', 'url'])[0]
+    with pytest.raises(SyncProtocolError):
+        decode_header(b'\x00' + frame[1:])
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from telemetry_store import TelemetryStore
+
+START = 1700000000 // 3600 * 3600
+HOURS = 3
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = TelemetryStore(str(tmp_path / 'telemetry.db'))
+    # One battery sample a minute, the minute index as value; SNR only every other minute
+    store.add_samples((('!1', START + minute * 60, {'battery': minute, 'snr': -minute if minute % 2 else None})
+                       for minute in range(HOURS * 60)))
+    store.add_samples([('!2', START + 30, {'voltage': 4.1})])
+    yield store
+    store.close()
+
+
+def test_rollup_keeps_exact_averages_and_extremes(store):
+    store.rollup(START + HOURS * 3600)
+
+    timestamps, mean, minimum, maximum = store.query_range('!1', 'battery', START, START + HOURS * 3600, '5m')
+    assert len(timestamps) == HOURS * 12 and timestamps[1] - timestamps[0] == 300
+    assert np.array_equal(mean, np.arange(HOURS * 12) * 5 + 2)
+    assert np.array_equal(minimum, np.arange(HOURS * 12) * 5)
+    assert np.array_equal(maximum, np.arange(HOURS * 12) * 5 + 4)
+
+    timestamps, hourly = store.query('!1', 'battery', START, START + HOURS * 3600, '1h')
+    assert np.array_equal(timestamps, START + np.arange(HOURS) * 3600)
+    assert np.array_equal(hourly, np.arange(HOURS) * 60 + 29.5)
+    _, snr = store.query('!1', 'snr', START, START + 3600, '1h')
+    assert snr[0] == -np.mean(np.arange(1, 60, 2))
+    assert sorted(store.nodes()) == ['!1', '!2']
+
+
+def test_rollup_is_incremental(store, tmp_path):
+    for now in range(START, START + HOURS * 3600 + 1, 1000):
+        store.rollup(now)
+    store.rollup(START + HOURS * 3600)
+
+    once = TelemetryStore(str(tmp_path / 'once.db'))
+    once.add_samples((('!1', START + minute * 60, {'battery': minute}) for minute in range(HOURS * 60)))
+    once.rollup(START + HOURS * 3600)
+    for resolution in ('5m', '1h'):
+        expected = once.query_range('!1', 'battery', START, START + HOURS * 3600, resolution)
+        for result, wanted in zip(store.query_range('!1', 'battery', START, START + HOURS * 3600, resolution),
+                                  expected):
+            assert np.array_equal(result, wanted)
+    once.close()
+
+
+def test_only_closed_buckets_are_rolled_up(store):
+    store.rollup(START + 3600 + 299)
+    assert len(store.query('!1', 'battery', START, START + 7200, '5m')[0]) == 12
+    assert len(store.query('!1', 'battery', START, START + 7200, '1h')[0]) == 1
+
+
+def test_retention_prunes_each_level(store):
+    store.retention.update({'samples_raw': 3600, 'samples_5m': 7200, 'samples_1h': 0})
+    store.rollup(START + HOURS * 3600)
+
+    raw, _ = store.query('!1', 'battery', START, START + HOURS * 3600, 'raw')
+    assert raw.min() >= START + (HOURS - 1) * 3600 and len(raw) == 60
+    five_minutes, _ = store.query('!1', 'battery', START, START + HOURS * 3600, '5m')
+    assert five_minutes.min() == START + (HOURS - 2) * 3600
+    assert len(store.query('!1', 'battery', START, START + HOURS * 3600, '1h')[0]) == HOURS
+    assert store.query('!2', 'voltage', START, START + HOURS * 3600, 'raw')[0].size == 0
+
+
+def test_resolution_follows_span_and_retention(store):
+    now = START + 40 * 86400
+    assert store.pick_resolution(now - 3600, now, now) == 'raw'
+    assert store.pick_resolution(now - 7 * 86400, now, now) == '5m'
+    assert store.pick_resolution(now - 35 * 86400, now - 34 * 86400, now) == '1h'
+    with pytest.raises(ValueError):
+        store.query('!1', 'unknown', START)
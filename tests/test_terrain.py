@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+import terrain
+from los_benchmark import SyntheticSRTM
+from terrain import Terrain
+
+
+class CountingSRTM(SyntheticSRTM):
+    def __init__(self):
+        super().__init__(side=121)
+        self.reads = 0
+
+    def get_file(self, latitude, longitude):
+        self.reads += 1
+        return super().get_file(latitude, longitude)
+
+
+@pytest.fixture
+def source():
+    return CountingSRTM()
+
+
+def test_elevations_match_srtm(tmp_path, source):
+    elevation_data = Terrain(str(tmp_path), source)
+    rng = np.random.default_rng(3)
+    lats = rng.uniform(30, 32, 200)
+    lons = rng.uniform(-99, -97, 200)
+    expected = [source.get_elevation(lat, lon) for lat, lon in zip(lats, lons)]
+    assert [elevation_data.get_elevation(lat, lon) for lat, lon in zip(lats, lons)] == expected
+    result = elevation_data.get_elevations(lats, lons)
+    assert [None if np.isnan(value) else int(value) for value in result] == expected
+
+
+def test_lookups_outside_the_mosaic_keep_it(tmp_path, source):
+    elevation_data = Terrain(str(tmp_path), source)
+    area = elevation_data.preload(30.2, -98.8, 31.8, -97.2)
+    elevation_data.get_elevation(45.5, 10.5)
+    elevation_data.get_elevation(-20.5, 150.5)
+    assert elevation_data.grid(30.5, -98.5, 31.5, -97.5) is area
+    assert elevation_data.grid(45.1, 10.1, 45.9, 10.9) is elevation_data.grid(45.2, 10.2, 45.8, 10.8)
+
+    reads = source.reads
+    for i in range(20):
+        elevation_data.get_elevation(31.2, -98.1)
+        elevation_data.get_elevation(45.5, 10.5)
+    assert source.reads == reads
+
+
+def test_least_recently_used_mosaic_is_dropped(tmp_path, source):
+    elevation_data = Terrain(str(tmp_path), source)
+    first = elevation_data.grid(0.5, 0.5, 0.5, 0.5)
+    for lat0 in range(1, terrain.MAX_GRIDS):
+        elevation_data.grid(lat0 + 0.5, 0.5, lat0 + 0.5, 0.5)
+    assert elevation_data.grid(0.5, 0.5, 0.5, 0.5) is first
+    elevation_data.grid(10.5, 0.5, 10.5, 0.5)
+    assert len(elevation_data.grids) == terrain.MAX_GRIDS
+    assert (1, 0, 1, 0) not in elevation_data.grids
+    assert (0, 0, 0, 0) in elevation_data.grids
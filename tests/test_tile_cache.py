@@ -0,0 +1,76 @@
+import threading
+
+import pytest
+
+from tile_cache import TileCache, TileServer, TileStore, TileUnavailable, solid_png, tiles_for_bbox
+
+BOX = (30.2, -98.3, 30.5, -97.9)
+ZOOM = 10
+
+
+@pytest.fixture
+def server():
+    with TileServer() as server:
+        yield server
+
+
+@pytest.fixture
+def cache(server):
+    cache = TileCache(sources=server.sources(), store=TileStore(':memory:'))
+    yield cache
+    cache.store.close()
+
+
+def test_prefetch_fetches_each_tile_once(server, cache):
+    tiles = tiles_for_bbox(*BOX, ZOOM)
+    assert len(tiles) > 1
+    assert cache.prefetch_bbox('osm', *BOX, ZOOM) == len(tiles)
+    assert server.requests == cache.fetches == cache.store.count('osm') == len(tiles)
+
+    assert cache.prefetch_bbox('osm', *BOX, ZOOM) == 0
+    x, y, z = tiles[0]
+    assert cache.get_bytes('osm', z, x, y) == solid_png(((x * 37 + z) % 256, (y * 53 + z) % 256, 60))
+    assert server.requests == cache.fetches == len(tiles)
+
+    assert cache.prefetch_bbox('opentopomap', *BOX, ZOOM) == len(tiles)
+    assert server.requests == 2 * len(tiles)
+
+
+def test_cached_images_do_not_fetch_again(server, cache):
+    pytest.importorskip('PIL')
+    cache.prefetch_bbox('osm', *BOX, ZOOM)
+    requests, fetches = server.requests, cache.fetches
+    for x, y, z in tiles_for_bbox(*BOX, ZOOM):
+        assert cache.get_image('osm', z, x, y).size == (256, 256)
+    assert (server.requests, cache.fetches) == (requests, fetches)
+
+
+def test_concurrent_requests_for_one_tile_fetch_it_once(server, cache):
+    server.delay = 0.2
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_bytes('osm', ZOOM, 5, 7)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 8 and len(set(results)) == 1
+    assert server.requests == cache.fetches == 1
+
+
+def test_offline_cache_serves_only_stored_tiles(server, cache):
+    cache.get_bytes('osm', ZOOM, 5, 7)
+    cache.offline = True
+    assert cache.get_bytes('osm', ZOOM, 5, 7)
+    with pytest.raises(TileUnavailable):
+        cache.get_bytes('osm', ZOOM, 5, 8)
+    assert cache.prefetch_bbox('osm', *BOX, ZOOM) == 0
+    assert server.requests == cache.fetches == 1
+
+
+def test_offline_cache_draws_blank_tiles(server, cache):
+    pytest.importorskip('PIL')
+    cache.offline = True
+    image = cache.get_image('osm', ZOOM, 5, 8)
+    assert image.size == (256, 256) and image.getpixel((0, 0)) == (255, 255, 255)
+    assert server.requests == cache.fetches == 0
@@ -0,0 +1,341 @@
+"""
+On-disk cache for the map tiles drawn behind the LOS plots.
+
+The LOS scripts used to patch cartopy's OSM/OpenTopoMap get_image with an
+image_spoof() that downloaded every tile on every plot. Tiles now go through
+a TileCache:
+
+- TileStore: a SQLite file laid out like MBTiles (tiles table with TMS
+  rows, plus a metadata table) with a source column, so OSM and
+  OpenTopoMap tiles share one file,
+- an LRU of decoded PIL images in memory,
+- prefetch() of every tile in a bounding box through a thread pool before
+  cartopy asks for them one at a time,
+- offline mode, which serves only what is cached and draws blank tiles for
+  the rest.
+
+install() patches a cartopy tile class to use the cache and add_image()
+prefetches the axes' extent before handing over to ax.add_image.
+TileServer is a local HTTP stand-in that serves generated tiles, for
+exercising all of this without touching the real tile servers.
+
+Set TILE_CACHE_OFFLINE=1 to run the scripts offline.
+"""
+
+import http.server
+import io
+import logging
+import math
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import Request, urlopen
+
+CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'meshtastic-tiles', 'tiles.mbtiles')
+# The User-agent image_spoof sent; the tile servers block urllib's default one
+USER_AGENT = 'Anaconda 3'
+SOURCES = {
+    'osm': 'https://tile.openstreetmap.org/{z}/{x}/{y}.png',
+    'opentopomap': 'https://a.tile.opentopomap.org/{z}/{x}/{y}.png',
+}
+MEMORY_TILES = 256
+PREFETCH_WORKERS = 8
+# Larger areas (e.g. an axes still at its global extent) are left to cartopy's own requests
+MAX_PREFETCH_TILES = 512
+TILE_SIZE = 256
+
+
+class TileUnavailable(Exception):
+    """A tile is not in the cache and the cache is offline."""
+
+
+def tile_xy(lat, lon, zoom):
+    """Slippy-map (x, y) of the tile containing the point."""
+    n = 2 ** zoom
+    lat = max(min(lat, 85.0511), -85.0511)
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tiles_for_bbox(min_lat, min_lon, max_lat, max_lon, zoom):
+    """(x, y, zoom) of every tile covering the box."""
+    west, north = tile_xy(max_lat, min_lon, zoom)
+    east, south = tile_xy(min_lat, max_lon, zoom)
+    return [(x, y, zoom) for x in range(west, east + 1) for y in range(north, south + 1)]
+
+
+class TileStore:
+    """MBTiles-style SQLite store keyed by (source, z, x, y); safe to share between threads."""
+
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock:
+            if path != ':memory:':
+                self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS tiles (
+                source TEXT NOT NULL,
+                zoom_level INTEGER NOT NULL,
+                tile_column INTEGER NOT NULL,
+                tile_row INTEGER NOT NULL,
+                tile_data BLOB NOT NULL,
+                fetched_at REAL NOT NULL,
+                PRIMARY KEY (source, zoom_level, tile_column, tile_row))''')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT)')
+            self.conn.execute("INSERT OR IGNORE INTO metadata VALUES ('format', 'png')")
+            self.conn.commit()
+
+    @staticmethod
+    def _row(z, y):
+        # MBTiles rows count from the south (TMS), slippy-map y from the north
+        return (2 ** z - 1) - y
+
+    def get(self, source, z, x, y):
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT tile_data FROM tiles WHERE source=? AND zoom_level=? AND tile_column=? AND tile_row=?',
+                (source, z, x, self._row(z, y))).fetchone()
+        return row[0] if row else None
+
+    def has(self, source, z, x, y):
+        with self.lock:
+            return self.conn.execute(
+                'SELECT 1 FROM tiles WHERE source=? AND zoom_level=? AND tile_column=? AND tile_row=?',
+                (source, z, x, self._row(z, y))).fetchone() is not None
+
+    def put(self, source, z, x, y, data):
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?, ?, ?)',
+                              (source, z, x, self._row(z, y), sqlite3.Binary(data), time.time()))
+            self.conn.commit()
+
+    def count(self, source=None):
+        with self.lock:
+            if source is None:
+                return self.conn.execute('SELECT COUNT(*) FROM tiles').fetchone()[0]
+            return self.conn.execute('SELECT COUNT(*) FROM tiles WHERE source=?', (source,)).fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class TileCache:
+    def __init__(self, store=None, offline=False, memory_tiles=MEMORY_TILES, workers=PREFETCH_WORKERS,
+                 sources=None, user_agent=USER_AGENT, timeout=30):
+        self.store = store if store is not None else TileStore()
+        self.offline = offline
+        self.memory_tiles = memory_tiles
+        self.workers = workers
+        self.sources = dict(SOURCES if sources is None else sources)
+        self.user_agent = user_agent
+        self.timeout = timeout
+        self.images = OrderedDict()
+        self.lock = threading.Lock()
+        # Tiles currently being downloaded, so concurrent requests for one tile fetch it once
+        self.pending = {}
+        self.fetches = 0
+
+    def url(self, source, z, x, y):
+        if source not in self.sources:
+            raise ValueError(f"Unknown tile source {source}")
+        return self.sources[source].format(z=z, x=x, y=y)
+
+    def _download(self, url):
+        with urlopen(Request(url, headers={'User-agent': self.user_agent}), timeout=self.timeout) as response:
+            return response.read()
+
+    def get_bytes(self, source, z, x, y, url=None):
+        """Encoded tile from the store, downloading it (unless offline) the first time."""
+        data = self.store.get(source, z, x, y)
+        if data is not None:
+            return data
+        if self.offline:
+            raise TileUnavailable(f"{source} tile {z}/{x}/{y} is not cached")
+        key = (source, z, x, y)
+        with self.lock:
+            event = self.pending.get(key)
+            owner = event is None
+            if owner:
+                event = self.pending[key] = threading.Event()
+        if not owner:
+            event.wait()
+            data = self.store.get(source, z, x, y)
+            if data is None:
+                raise TileUnavailable(f"{source} tile {z}/{x}/{y} could not be fetched")
+            return data
+        try:
+            data = self._download(url or self.url(source, z, x, y))
+            self.store.put(source, z, x, y, data)
+            with self.lock:
+                self.fetches += 1
+            return data
+        finally:
+            with self.lock:
+                del self.pending[key]
+            event.set()
+
+    def get_image(self, source, z, x, y, mode='RGB', url=None):
+        """Decoded PIL image of the tile; blank where it is unavailable offline."""
+        key = (source, z, x, y, mode)
+        with self.lock:
+            image = self.images.get(key)
+            if image is not None:
+                self.images.move_to_end(key)
+                return image
+        from PIL import Image
+        try:
+            image = Image.open(io.BytesIO(self.get_bytes(source, z, x, y, url))).convert(mode)
+        except TileUnavailable as e:
+            logging.info(f"{e}, drawing a blank tile")
+            return Image.new(mode, (TILE_SIZE, TILE_SIZE), 'white')
+        with self.lock:
+            self.images[key] = image
+            while len(self.images) > self.memory_tiles:
+                self.images.popitem(last=False)
+        return image
+
+    def prefetch(self, source, tiles, url_for=None):
+        """
+        Downloads the tiles ((x, y, z) tuples) missing from the store through
+        the thread pool. Returns how many were fetched; nothing is fetched
+        offline.
+        """
+        missing = [tile for tile in tiles if not self.store.has(source, tile[2], tile[0], tile[1])]
+        if self.offline or not missing:
+            return 0
+        before = self.fetches
+
+        def fetch(tile):
+            x, y, z = tile
+            try:
+                self.get_bytes(source, z, x, y, url_for(tile) if url_for else None)
+            except Exception as e:
+                logging.info(f"Prefetching {source} tile {z}/{x}/{y} failed: {e}")
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            list(executor.map(fetch, missing))
+        return self.fetches - before
+
+    def prefetch_bbox(self, source, min_lat, min_lon, max_lat, max_lon, zoom, url_for=None):
+        return self.prefetch(source, tiles_for_bbox(min_lat, min_lon, max_lat, max_lon, zoom), url_for)
+
+
+_tile_cache = None
+_tile_cache_lock = threading.Lock()
+
+
+def get_tile_cache():
+    """The process-wide cache; TILE_CACHE_OFFLINE=1 starts it offline."""
+    global _tile_cache
+    with _tile_cache_lock:
+        if _tile_cache is None:
+            offline = os.environ.get('TILE_CACHE_OFFLINE', '').lower() in ('1', 'true', 'yes')
+            _tile_cache = TileCache(offline=offline)
+        return _tile_cache
+
+
+def install(tile_class, source, cache=None):
+    """Replaces tile_class.get_image (a cartopy GoogleWTS subclass) with a cached lookup of `source` tiles."""
+
+    def get_image(self, tile):
+        x, y, z = tile
+        image = (cache or get_tile_cache()).get_image(source, z, x, y, self.desired_tile_form, self._image_url(tile))
+        return image, self.tileextent(tile), 'lower'
+
+    tile_class.get_image = get_image
+    tile_class.tile_source = source
+
+
+def add_image(ax, tiles, zoom, cache=None):
+    """ax.add_image(tiles, zoom), after prefetching the tiles of the axes' current extent concurrently."""
+    import cartopy.crs as ccrs
+    west, east, south, north = ax.get_extent(crs=ccrs.PlateCarree())
+    left, top = tile_xy(north, west, zoom)
+    right, bottom = tile_xy(south, east, zoom)
+    source = getattr(tiles, 'tile_source', None)
+    if source is not None and (right - left + 1) * (bottom - top + 1) <= MAX_PREFETCH_TILES:
+        (cache or get_tile_cache()).prefetch(source, tiles_for_bbox(south, west, north, east, zoom), tiles._image_url)
+    return ax.add_image(tiles, zoom)
+
+
+def solid_png(rgb, size=TILE_SIZE):
+    """A size x size PNG of one colour, built without PIL."""
+    def chunk(kind, data):
+        body = kind + data
+        return struct.pack('>I', len(data)) + body + struct.pack('>I', zlib.crc32(body) & 0xffffffff)
+
+    row = b'\x00' + bytes(rgb) * size
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', size, size, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(row * size)) + chunk(b'IEND', b''))
+
+
+class TileServer:
+    """
+    Local HTTP stand-in for a tile server: GET /{source}/{z}/{x}/{y}.png
+    returns a solid tile whose colour depends on the coordinates, and
+    `requests` counts what was served. Use sources() as TileCache(sources=...).
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, delay=0.0):
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                parts = self.path.strip('/').rsplit('.', 1)[0].split('/')
+                try:
+                    source, z, x, y = parts[0], int(parts[1]), int(parts[2]), int(parts[3])
+                except (IndexError, ValueError):
+                    self.send_error(404)
+                    return
+                with server.lock:
+                    server.requests += 1
+                if server.delay:
+                    time.sleep(server.delay)
+                body = solid_png(((x * 37 + z) % 256, (y * 53 + z) % 256, len(source) * 20 % 256))
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/png')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.delay = delay
+        self.httpd = http.server.ThreadingHTTPServer((host, port), Handler)
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def sources(self, names=SOURCES):
+        return {name: f"{self.base_url}/{name}/{{z}}/{{x}}/{{y}}.png" for name in names}
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
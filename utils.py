@@ -1,85 +1,169 @@
 import logging
-import time
 
-user_states = {}
+from fanout import get_fanout_sender
+from node_index import get_node_index
+from outbound import PRIORITY_INTERACTIVE, PRIORITY_SYNC, get_dispatcher
+from sessions import get_session_store
+from sync_protocol import SYNC_PORT_NUM, encode_record
 
 
 def update_user_state(user_id, state):
-    user_states[user_id] = state
+    get_session_store().set(user_id, state)
 
 
 def get_user_state(user_id):
-    return user_states.get(user_id, None)
-
-
-def send_message(message, destination, interface):
-    max_payload_size = 200
-    for i in range(0, len(message), max_payload_size):
-        chunk = message[i:i + max_payload_size]
-        try:
-            d = interface.sendText(
-                text=chunk,
-                destinationId=destination,
-                wantAck=False,
-                wantResponse=False
-            )
-            logging.info(f"REPLY SEND ID={d.id}")
-        except Exception as e:
-            logging.info(f"REPLY SEND ERROR {e.message}")
-
-        
-        time.sleep(2)
+    return get_session_store().get(user_id)
+
+
+def append_to_draft(user_id, state, text):
+    return get_session_store().append_draft(user_id, state, text)
+
+
+def send_message(message, destination, interface, priority=PRIORITY_INTERACTIVE, numbered=True):
+    # Frames are paced by the outbound dispatcher; this only queues them.
+    dispatcher = get_dispatcher()
+    for chunk in split_message(message, dispatcher.max_payload_bytes, numbered):
+        dispatcher.enqueue(chunk, destination, interface, priority)
+
+
+# Longest UTF-8 encoding of one character; every chunk must have room for it
+MAX_CHAR_BYTES = 4
+
+
+def byte_length(text):
+    return len(text.encode('utf-8'))
+
+
+def _cut_point(text, limit, keep_separator=False):
+    """
+    Returns (end, resume): text[:end] fits in `limit` bytes and the rest starts at text[resume:].
+    With keep_separator the break character ends the chunk instead of being dropped.
+    """
+    fits = len(text.encode('utf-8')[:limit].decode('utf-8', 'ignore'))
+    # Prefer a line break, then a space, as long as it keeps the frame at least half full
+    for separator in ("\n", " "):
+        if keep_separator:
+            position = text.rfind(separator, 0, fits)
+            if position > fits // 2:
+                return position + 1, position + 1
+        else:
+            position = text.rfind(separator, 0, fits + 1)
+            if position > fits // 2:
+                return position, position + 1
+    return fits, fits
+
+
+def split_message(message, limit, numbered=True):
+    """
+    Splits a message into chunks of at most `limit` UTF-8 bytes, breaking on
+    lines or words where possible. Multi-chunk messages are prefixed "1/3 ".
+    Unnumbered chunks keep every character, so joining them gives back the message.
+    Raises ValueError when `limit` leaves no room for a whole character.
+    """
+    if byte_length(message) <= limit:
+        return [message]
+
+    digits = 1
+    while True:
+        reserve = byte_length(f"{'9' * digits}/{'9' * digits} ") if numbered else 0
+        if limit - reserve < MAX_CHAR_BYTES:
+            raise ValueError(f"A limit of {limit} bytes leaves no room for a character in each chunk")
+        chunks = []
+        rest = message
+        while byte_length(rest) > limit - reserve:
+            end, resume = _cut_point(rest, limit - reserve, not numbered)
+            chunks.append(rest[:end])
+            rest = rest[resume:]
+        if rest:
+            chunks.append(rest)
+        if not numbered:
+            return chunks
+        if len(chunks) < 10 ** digits:
+            return [f"{index}/{len(chunks)} {chunk}" for index, chunk in enumerate(chunks, start=1)]
+        digits += 1
+
+
+def pack_lines(lines, limit=None):
+    """Joins lines with newlines into as few messages as possible, each fitting in one frame."""
+    if limit is None:
+        limit = get_dispatcher().max_payload_bytes
+    messages = []
+    current = None
+    for line in lines:
+        if current is not None and byte_length(current) + 1 + byte_length(line) <= limit:
+            current += "\n" + line
+        else:
+            if current is not None:
+                messages.append(current)
+            current = line
+    if current is not None:
+        messages.append(current)
+    return messages
 
 
 def get_node_info(interface, short_name):
-    nodes = [{'num': node_id, 'shortName': node['user']['shortName'], 'longName': node['user']['longName']}
-             for node_id, node in interface.nodes.items()
-             if node['user']['shortName'].lower() == short_name]
+    nodes = [{'num': node_id, 'shortName': node_short_name, 'longName': node_long_name}
+             for node_id, node_short_name, node_long_name in get_node_index(interface).find_by_short_name(short_name)]
     return nodes
 
 
 def get_node_id_from_num(node_num, interface):
-    for node_id, node in interface.nodes.items():
-        if node['num'] == node_num:
-            return node_id
-    return None
+    return get_node_index(interface).get_id(node_num)
 
 
 def get_node_short_name(node_id, interface):
-    node_info = interface.nodes.get(node_id)
-    if node_info:
-        return node_info['user']['shortName']
+    names = get_node_index(interface).get_names(node_id)
+    if names:
+        return names[0]
     return None
 
 
-def send_bulletin_to_bbs_nodes(board, sender_short_name, subject, content, unique_id, bbs_nodes, interface):
-    message = f"BULLETIN|{board}|{sender_short_name}|{subject}|{content}|{unique_id}"
+def get_node_long_name(node_id, interface):
+    names = get_node_index(interface).get_names(node_id)
+    if names:
+        return names[1]
+    return None
+
+
+def send_sync_frames(record_type, fields, bbs_nodes, interface):
+    if getattr(interface, 'sync_transport', 'unicast') == 'fanout' and len(bbs_nodes) > 1:
+        get_fanout_sender().send(record_type, fields, bbs_nodes, interface)
+        return
+    frames = encode_record(record_type, fields, getattr(interface, 'sync_compression', 'zlib'))
+    dispatcher = get_dispatcher()
     for node_id in bbs_nodes:
-        send_message(message, node_id, interface)
+        for frame in frames:
+            dispatcher.enqueue(frame, node_id, interface, PRIORITY_SYNC, port_num=SYNC_PORT_NUM)
+
+
+def send_sync_record(record_type, fields, bbs_nodes, interface):
+    if getattr(interface, 'sync_format', 'text') == 'binary':
+        send_sync_frames(record_type, fields, bbs_nodes, interface)
+    else:
+        message = "|".join([record_type] + [str(field) for field in fields])
+        for node_id in bbs_nodes:
+            send_message(message, node_id, interface, PRIORITY_SYNC, numbered=False)
+
+
+def send_bulletin_to_bbs_nodes(board, sender_short_name, subject, content, unique_id, bbs_nodes, interface):
+    send_sync_record("BULLETIN", [board, sender_short_name, subject, content, unique_id], bbs_nodes, interface)
 
 
 def send_mail_to_bbs_nodes(sender_id, sender_short_name, recipient_id, subject, content, unique_id, bbs_nodes,
                            interface):
-    message = f"MAIL|{sender_id}|{sender_short_name}|{recipient_id}|{subject}|{content}|{unique_id}"
     logging.info(f"SERVER SYNC: Syncing new mail message {subject} sent from {sender_short_name} to other BBS systems.")
-    for node_id in bbs_nodes:
-        send_message(message, node_id, interface)
+    send_sync_record("MAIL", [sender_id, sender_short_name, recipient_id, subject, content, unique_id], bbs_nodes,
+                     interface)
 
 
-def send_delete_bulletin_to_bbs_nodes(bulletin_id, bbs_nodes, interface):
-    message = f"DELETE_BULLETIN|{bulletin_id}"
-    for node_id in bbs_nodes:
-        send_message(message, node_id, interface)
+def send_delete_bulletin_to_bbs_nodes(unique_id, bbs_nodes, interface):
+    send_sync_record("DELETE_BULLETIN", [unique_id], bbs_nodes, interface)
 
 
 def send_delete_mail_to_bbs_nodes(unique_id, bbs_nodes, interface):
-    message = f"DELETE_MAIL|{unique_id}"
     logging.info(f"SERVER SYNC: Sending delete mail sync message with unique_id: {unique_id}")
-    for node_id in bbs_nodes:
-        send_message(message, node_id, interface)
+    send_sync_record("DELETE_MAIL", [unique_id], bbs_nodes, interface)
 
 
 def send_channel_to_bbs_nodes(name, url, bbs_nodes, interface):
-    message = f"CHANNEL|{name}|{url}"
-    for node_id in bbs_nodes:
-        send_message(message, node_id, interface)
+    send_sync_record("CHANNEL", [name, url], bbs_nodes, interface)